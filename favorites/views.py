@@ -1,8 +1,15 @@
+import logging
+
 from django.shortcuts import get_object_or_404, redirect, render
-from django.core.paginator import Paginator, PageNotAnInteger, EmptyPage
 from unidecode import unidecode
 
+from products.favorites import get_user_favorites
 from products.models import Favorite
+from products.search import search_favorites
+from products.pagination import get_page
+
+
+logger = logging.getLogger('purbeurre.favorites')
 
 
 def favorites(request):
@@ -10,21 +17,12 @@ def favorites(request):
     Used when displaying the current user's favorites
     """
     cur_user = request.user  # Gets the current logged-in user
-    fav_products = Favorite.objects.all()  # Gets all "Favorite" model objects
 
-    # Gets the favorites of the current user
-    fav_prod_filtered = fav_products.filter(users_id=cur_user).order_by('-id')
+    # Gets the favorites of the current user, with their products
+    fav_prod_filtered = get_user_favorites(cur_user).order_by('-id')
 
-    # Adds pagination for up to 6 products per page
-    paginator = Paginator(fav_prod_filtered, 6)
-    page = request.GET.get('page')
-
-    try:
-        products = paginator.page(page)
-    except PageNotAnInteger:
-        products = paginator.page(1)
-    except EmptyPage:
-        products = paginator.page(paginator.num_pages)
+    # Adds keyset pagination for up to 6 products per page
+    products = get_page(fav_prod_filtered, request, 6)
 
     context = {
         'favorites': products,
@@ -37,12 +35,15 @@ def remove_from_fav(request, favorite_id):
     """
     Used when the user removes a product from his favorites
     """
-    # Gets a favorite designated by favorite_id or returns 404
-    favorite = get_object_or_404(Favorite, pk=favorite_id)
+    # Gets a favorite designated by favorite_id (with its product) or
+    # returns 404
+    favorite = get_object_or_404(
+        Favorite.objects.select_related('products'), pk=favorite_id)
     favorite.delete()
 
-    print("{}, {} a été supprimé des favoris".format(
-                    favorite.products.name, favorite.products.brand))
+    logger.info(
+        "%s, %s a été supprimé des favoris de l'utilisateur %s",
+        favorite.products.name, favorite.products.brand, favorite.users_id)
 
     return redirect(request.META['HTTP_REFERER'])
 
@@ -56,32 +57,15 @@ def search_in_fav(request):
     if query:
         # Returns the query in lower case and without accents
         query = unidecode(query).lower()
-        result = True
 
         cur_user = request.user
-        # Returns all favorites
-        favorites = Favorite.objects.all()
-
-        # Returns current user filtered favorites
-        fav_filtered = favorites.filter(
-            users_id=cur_user
-            ).filter(products__name__icontains=query).order_by('id')
-
-        if not fav_filtered.exists():
-            result = False
-            fav_filtered = favorites.filter(
-                users_id=cur_user).order_by('id')
-
-        # Init pagination with 6 products
-        paginator = Paginator(fav_filtered, 6)
-        page = request.GET.get('page')
-
-        try:
-            fav_filtered = paginator.page(page)
-        except PageNotAnInteger:
-            fav_filtered = paginator.page(1)
-        except EmptyPage:
-            fav_filtered = paginator.page(paginator.num_pages)
+        # Returns the favorites of the current user matching the query,
+        # ranked by similarity, or all of them if none matches
+        fav_filtered = search_favorites(cur_user, query)
+
+        # Init keyset pagination with 6 products
+        fav_filtered = get_page(fav_filtered, request, 6)
+        result = bool(fav_filtered) and fav_filtered[0].matched
 
         if result:
             title = "Résultats de la recherche : {}".format(query)
@@ -0,0 +1,247 @@
+import hashlib
+import json
+
+from functools import wraps
+
+from django.core.serializers.json import DjangoJSONEncoder
+from django.http import (
+    HttpResponse, HttpResponseNotModified, JsonResponse,
+    StreamingHttpResponse
+)
+from django.utils.cache import patch_vary_headers
+from django.utils.http import parse_etags, quote_etag
+from django.views.decorators.http import require_GET
+from unidecode import unidecode
+
+from .forms import SearchForm
+from .models import Product
+from .pagination import KeysetPaginator
+from .search import search_products
+from .substitutes import SUBSTITUTES_POOL_SIZE, refresh_substitutes
+
+
+# Product columns that can be selected with the 'fields' parameter
+API_FIELDS = (
+    'id', 'name', 'brand', 'description', 'score', 'barcode',
+    'url_img_small', 'url_img', 'url_off', 'url_img_nutrition',
+)
+# Columns returned when no field is selected (those of the product cards)
+DEFAULT_FIELDS = ('id', 'name', 'brand', 'score', 'url_img')
+
+# Number of products by page of search results
+API_PAGE_SIZE = 20
+MAX_PAGE_SIZE = 100
+
+# Number of rows read from the database (and sent) at once by streamed
+# responses
+STREAM_CHUNK_SIZE = 500
+
+
+class ApiError(Exception):
+    """
+    Error returned to the client as a JSON object with its status code
+    """
+
+    def __init__(self, message, status=400):
+        # message may be a dict of messages (e.g. by form field)
+        super().__init__(message)
+        self.message = message
+        self.status = status
+
+
+def api_view(view):
+    """
+    Decorator of the API views: only GET requests are allowed and an
+    ApiError raised by the view is returned as a JSON error
+    """
+    @require_GET
+    @wraps(view)
+    def wrapper(request, *args, **kwargs):
+        try:
+            return view(request, *args, **kwargs)
+        except ApiError as error:
+            return JsonResponse(
+                {'error': error.message}, status=error.status)
+
+    return wrapper
+
+
+def dumps(data):
+    """
+    Returns data in compact JSON (no spaces, non-ASCII characters kept)
+    """
+    return json.dumps(
+        data, cls=DjangoJSONEncoder, ensure_ascii=False,
+        separators=(',', ':'))
+
+
+def get_fields(request):
+    """
+    Returns the product columns selected by the 'fields' parameter of
+    request (comma separated), the id being always selected
+    """
+    selected = request.GET.get('fields')
+    if not selected:
+        return DEFAULT_FIELDS
+
+    fields = ['id'] + [
+        field for field in selected.split(',') if field and field != 'id']
+    unknown = [field for field in fields if field not in API_FIELDS]
+    if unknown:
+        raise ApiError("Unknown fields: {}".format(', '.join(unknown)))
+    return tuple(dict.fromkeys(fields))
+
+
+def get_int(request, name, default, maximum):
+    """
+    Returns the int parameter name of request, between 1 and maximum
+    """
+    try:
+        value = int(request.GET.get(name, default))
+    except ValueError:
+        raise ApiError(f"Invalid {name}")
+    return max(1, min(value, maximum))
+
+
+def json_response(request, data):
+    """
+    Returns data as a JSON response with an ETag (hash of the content), or
+    an empty 304 response if the client already has this content
+    (If-None-Match)
+    """
+    content = dumps(data).encode()
+    etag = quote_etag(hashlib.md5(content).hexdigest())
+
+    if_none_match = request.META.get('HTTP_IF_NONE_MATCH')
+    if if_none_match and (
+            etag in parse_etags(if_none_match) or if_none_match == '*'):
+        response = HttpResponseNotModified()
+    else:
+        response = HttpResponse(content, content_type='application/json')
+    response['ETag'] = etag
+    # Favorites depend on the logged-in user
+    patch_vary_headers(response, ('Cookie',))
+    return response
+
+
+def stream_response(rows, fields):
+    """
+    Returns a response streaming the rows (dicts) as a JSON object
+    {"results": [...]}, STREAM_CHUNK_SIZE rows at a time. The content isn't
+    known before it is sent: the response has no ETag
+    """
+    def generate():
+        yield '{"results":['
+        chunk = []
+        rows_iterator = rows.iterator(chunk_size=STREAM_CHUNK_SIZE)
+        for num, row in enumerate(rows_iterator):
+            chunk.append(('' if num == 0 else ',') + dumps(
+                {field: row[field] for field in fields}))
+            if len(chunk) == STREAM_CHUNK_SIZE:
+                yield ''.join(chunk)
+                chunk = []
+        yield ''.join(chunk) + ']}'
+
+    response = StreamingHttpResponse(
+        generate(), content_type='application/json')
+    patch_vary_headers(response, ('Cookie',))
+    return response
+
+
+@api_view
+def search(request):
+    """
+    Used for products search: a page of the products matching the search
+    & search_filter parameters (same constraints as the search form),
+    designated by the cursor parameter, or all of them with stream=1
+    """
+    query = request.GET.get('search')
+    search_filter = request.GET.get('search_filter')
+    if not query or not search_filter:
+        raise ApiError("search & search_filter parameters are required")
+
+    form = SearchForm(request.GET)
+    if not form.is_valid():
+        raise ApiError({
+            field: [str(error) for error in errors]
+            for field, errors in form.errors.items()
+        })
+
+    fields = get_fields(request)
+    # The query is searched in lower case and without accents
+    products = search_products(unidecode(query).lower(), search_filter)
+    # Ordering keys are also read, for the cursors
+    keys = [key.lstrip('-') for key in products.query.order_by]
+    rows = products.values(*dict.fromkeys(fields + tuple(keys)))
+
+    if request.GET.get('stream'):
+        return stream_response(rows, fields)
+
+    paginator = KeysetPaginator(
+        rows, get_int(request, 'page_size', API_PAGE_SIZE, MAX_PAGE_SIZE))
+    page = paginator.page(request.GET.get('cursor'))
+    return json_response(request, {
+        'results': [
+            {field: row[field] for field in fields} for row in page
+        ],
+        'next': page.next_cursor,
+        'previous': page.previous_cursor,
+    })
+
+
+@api_view
+def detail(request, product_id):
+    """
+    Used for the product designated by product_id
+    """
+    product = Product.objects.filter(
+        pk=product_id).values(*get_fields(request)).first()
+    if product is None:
+        raise ApiError("Product not found", status=404)
+
+    return json_response(request, product)
+
+
+@api_view
+def substitutes(request, product_id):
+    """
+    Used for the substitutes of the product designated by product_id, from
+    the substitutes index (best grades first). The index of the product is
+    built first if it isn't indexed yet
+    """
+    fields = get_fields(request)
+    limit = get_int(request, 'limit', 6, SUBSTITUTES_POOL_SIZE)
+    rows = Product.objects.filter(
+        substitute_for__product_id=product_id
+    ).order_by('grade', 'id').values(*fields)
+
+    results = list(rows[:limit])
+    if not results:
+        product = Product.objects.filter(pk=product_id).values(
+            'substitutes_indexed_at').first()
+        if product is None:
+            raise ApiError("Product not found", status=404)
+        if (product['substitutes_indexed_at'] is None and
+                refresh_substitutes([int(product_id)])):
+            results = list(rows[:limit])
+
+    return json_response(request, {'results': results})
+
+
+@api_view
+def favorites(request):
+    """
+    Used for the products in the favorites of the current user (most
+    recently added first), streamed with stream=1
+    """
+    if not request.user.is_authenticated:
+        raise ApiError("Authentication required", status=401)
+
+    fields = get_fields(request)
+    rows = Product.objects.filter(
+        favorite__users_id=request.user.id
+    ).order_by('-favorite__id').values(*fields)
+
+    if request.GET.get('stream'):
+        return stream_response(rows, fields)
+    return json_response(request, {'results': list(rows)})
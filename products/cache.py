@@ -0,0 +1,191 @@
+import hashlib
+import random
+import threading
+
+from collections import Counter
+from uuid import uuid4
+
+from django.core.cache import cache
+from django.db import transaction
+
+from .models import Favorite, Product
+
+
+# Cache key of the version of the catalogue (products & categories). Every
+# cached entry computed from the catalogue is stored under this version, so
+# changing it invalidates all of them at once.
+CATALOGUE_VERSION_KEY = 'catalogue_version'
+
+# Number of pages of the listing of all products kept in cache
+FALLBACK_CACHED_PAGES = 10
+FALLBACK_TIMEOUT = 60 * 60
+
+# Time to live of the cached searches
+SEARCH_TIMEOUT = 60 * 15
+
+# Time to live of the cached favorites of a user
+FAVORITES_TIMEOUT = 60 * 60 * 24
+
+
+# Hits & misses of the caches by (name, hit), counted in the memory of the
+# process: a read of the cache never writes in it
+access_counts = Counter()
+access_lock = threading.Lock()
+
+
+def _count_access(name, hit):
+    # Increments the hits or misses counter of the cache designated by name
+    with access_lock:
+        access_counts[name, hit] += 1
+
+
+def get_cache_stats(name):
+    """
+    Returns the hits, misses and hit ratio of the cache designated by name,
+    counted by the current process
+    """
+    with access_lock:
+        hits = access_counts[name, True]
+        misses = access_counts[name, False]
+    total = hits + misses
+    return {
+        'hits': hits,
+        'misses': misses,
+        'ratio': hits / total if total else None,
+    }
+
+
+def clear_cache_stats():
+    """
+    Resets the hits & misses counters of all the caches
+    """
+    with access_lock:
+        access_counts.clear()
+
+
+def get_catalogue_version():
+    """
+    Returns the current version of the catalogue
+    """
+    return cache.get_or_set(CATALOGUE_VERSION_KEY, uuid4().hex, None)
+
+
+def invalidate_catalogue():
+    """
+    Invalidates all the cached entries computed from the catalogue. Used
+    by the commands writing products or categories
+    """
+    cache.set(CATALOGUE_VERSION_KEY, uuid4().hex, None)
+
+
+def get_fallback_listing(per_page):
+    """
+    Returns the first pages of the listing of all products (ordered by id)
+    and whether they contain all the products. The listing is computed on
+    a cache miss only
+    """
+    key = f'fallback_listing:{per_page}'
+    version = get_catalogue_version()
+    listing = cache.get(key, version=version)
+
+    if listing is None:
+        size = FALLBACK_CACHED_PAGES * per_page
+        products = list(Product.objects.order_by('id')[:size + 1])
+        listing = (products[:size], len(products) <= size)
+        cache.set(key, listing, FALLBACK_TIMEOUT, version=version)
+
+    return listing
+
+
+def get_cached_search(query, search_filter, part, compute):
+    """
+    Returns the cached part (e.g. a page) of the search designated by the
+    normalized query and search_filter. On a miss, the part is computed by
+    compute() and cached
+    """
+    query = ' '.join(query.split())
+    digest = hashlib.md5(
+        f'{search_filter}:{query}:{part}'.encode()).hexdigest()
+    key = f'search:{digest}'
+    version = get_catalogue_version()
+
+    entry = cache.get(key, version=version)
+    _count_access('search', entry is not None)
+    if entry is None:
+        entry = compute()
+        cache.set(key, entry, SEARCH_TIMEOUT, version=version)
+
+    return entry
+
+
+def get_favorites_version(user_id):
+    """
+    Returns the version of the cached favorites of the user designated by
+    user_id, changed by every change of its favorites. Versions are random,
+    so that a lost version doesn't reuse an old entry
+    """
+    key = f'favorites_version:{user_id}'
+    version = cache.get(key)
+    if version is None:
+        cache.add(key, random.getrandbits(48), None)
+        version = cache.get(key)
+    return version
+
+
+def get_favorite_ids(user_id):
+    """
+    Returns the set of the ids of the products in the favorites of the user
+    designated by user_id. The set is read from the database on a miss only
+    """
+    version = get_favorites_version(user_id)
+    key = f'favorites:{user_id}'
+    favorite_ids = cache.get(key, version=version)
+    _count_access('favorites', favorite_ids is not None)
+
+    if favorite_ids is None:
+        favorite_ids = set(Favorite.objects.filter(
+            users_id=user_id).values_list('products_id', flat=True))
+        # Stored under the version read before the database: if favorites
+        # changed meanwhile, the version changed too and the entry is unused
+        cache.set(key, favorite_ids, FAVORITES_TIMEOUT, version=version)
+
+    return favorite_ids
+
+
+def invalidate_favorite_ids(user_id):
+    """
+    Invalidates the cached favorites of the user designated by user_id and
+    returns their new version
+    """
+    # A new random version rather than an increment, which isn't atomic
+    # with the file-based backend: concurrent changes never share a version
+    version = random.getrandbits(48)
+    cache.set(f'favorites_version:{user_id}', version, None)
+    return version
+
+
+def refresh_favorite_ids(user_id):
+    """
+    Writes through the cache the favorites of the user designated by
+    user_id, after a committed change of its favorites. Concurrent changes
+    never leave a stale entry: each change moves the version & the entry of
+    the new version is read from the database after the change
+    """
+    version = invalidate_favorite_ids(user_id)
+    favorite_ids = set(Favorite.objects.filter(
+        users_id=user_id).values_list('products_id', flat=True))
+    cache.set(
+        f'favorites:{user_id}', favorite_ids, FAVORITES_TIMEOUT,
+        version=version)
+
+
+def write_through_favorite_ids(user_id):
+    """
+    Writes through the cache the favorites of the user designated by
+    user_id once the current change of its favorites is committed
+    """
+    if transaction.get_connection().in_atomic_block:
+        # Until the commit (never if rolled back), the cached favorites are
+        # only invalidated: they would be read from the database
+        invalidate_favorite_ids(user_id)
+    transaction.on_commit(lambda: refresh_favorite_ids(user_id))
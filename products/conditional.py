@@ -0,0 +1,95 @@
+import hashlib
+
+from functools import wraps
+
+from django.conf import settings
+from django.utils.cache import patch_cache_control
+
+from .cache import get_catalogue_version, get_favorites_version
+from .models import Product
+
+
+# Time (seconds) during which browsers & proxies may reuse the pages of a
+# product for anonymous users without revalidating them
+PRODUCT_PAGE_MAX_AGE = 60 * 5
+
+
+def get_product_version(request, product_id):
+    """
+    Returns the last modification date of the product designated by
+    product_id (None if it doesn't exist), read once by request
+    """
+    if getattr(request, 'product_version', (None,))[0] != product_id:
+        request.product_version = (
+            product_id,
+            Product.objects.filter(pk=product_id).values_list(
+                'updated_at', flat=True).first(),
+        )
+    return request.product_version[1]
+
+
+def _get_etag(request, product_id, *parts):
+    # Returns the hash of the versions of the product & of the catalogue
+    # and of parts (None if the product doesn't exist). Pages of anonymous
+    # & logged-in users differ by their navigation
+    updated_at = get_product_version(request, product_id)
+    if updated_at is None:
+        return None
+
+    data = ':'.join(str(part) for part in (
+        product_id, updated_at.timestamp(), get_catalogue_version(),
+        request.user.is_authenticated, *parts))
+    return hashlib.md5(data.encode()).hexdigest()
+
+
+def detail_etag(request, product_id):
+    """
+    Returns the ETag of the detail page of the product designated by
+    product_id
+    """
+    return _get_etag(request, product_id)
+
+
+def result_etag(request, product_id):
+    """
+    Returns the (weak) ETag of the result page of the product designated by
+    product_id. Its substitutes are randomly selected and marked if they are
+    in the favorites of the user, whose form holds a CSRF token
+    """
+    user = request.user
+    parts = ()
+    if user.is_authenticated:
+        parts = (
+            user.id, get_favorites_version(user.id),
+            request.COOKIES.get(settings.CSRF_COOKIE_NAME))
+
+    etag = _get_etag(request, product_id, *parts)
+    return None if etag is None else f'W/"{etag}"'
+
+
+def product_last_modified(request, product_id):
+    """
+    Returns the last modification date of the product designated by
+    product_id
+    """
+    return get_product_version(request, product_id)
+
+
+def product_page_cache(view):
+    """
+    Decorator adding Cache-Control to the pages of a product: anonymous
+    users' pages may be reused for PRODUCT_PAGE_MAX_AGE, logged-in users'
+    pages are private and always revalidated (ETag)
+    """
+    @wraps(view)
+    def wrapper(request, *args, **kwargs):
+        response = view(request, *args, **kwargs)
+        if response.status_code in (200, 304):
+            if request.user.is_authenticated:
+                patch_cache_control(response, private=True, no_cache=True)
+            else:
+                patch_cache_control(
+                    response, public=True, max_age=PRODUCT_PAGE_MAX_AGE)
+        return response
+
+    return wrapper
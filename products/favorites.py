@@ -0,0 +1,91 @@
+from django.db import connection
+from django.db.models import Exists, OuterRef
+
+from . import cache
+from .models import Favorite
+
+
+# Product columns rendered by the favorites cards (cached by version)
+FAVORITE_CARD_FIELDS = (
+    'id', 'name', 'brand', 'score', 'url_img', 'updated_at',
+)
+
+# Adds the existing products among the ids to the favorites of a user, in
+# one statement. Products already in its favorites (even saved by a
+# concurrent request) are ignored. Returns the ids of the added products
+ADD_FAVORITES_SQL = """
+    INSERT INTO products_favorite (added_date, products_id, users_id)
+    SELECT now(), p.id, %(user_id)s
+    FROM products_product p
+    WHERE p.id = ANY(%(product_ids)s)
+    ON CONFLICT (products_id, users_id) DO NOTHING
+    RETURNING products_id
+"""
+
+
+def get_favorite_ids(user, product_ids):
+    """
+    Returns the set of the ids, among product_ids, of the products in the
+    favorites of user (read from the cached favorites of user)
+    """
+    if not user.is_authenticated:
+        return set()
+
+    return cache.get_favorite_ids(user.id).intersection(product_ids)
+
+
+def set_favorites(products, user):
+    """
+    Sets the is_favorite attribute of each product of products (instances)
+    for user and returns them as a list
+    """
+    products = list(products)
+    favorite_ids = get_favorite_ids(user, [product.id for product in products])
+    for product in products:
+        product.is_favorite = product.id in favorite_ids
+    return products
+
+
+def annotate_favorites(queryset, user):
+    """
+    Returns the products queryset annotated with is_favorite for user
+    (computed by the query itself)
+    """
+    return queryset.annotate(is_favorite=Exists(Favorite.objects.filter(
+        users_id=user.id, products_id=OuterRef('pk'))))
+
+
+def get_user_favorites(user):
+    """
+    Returns the favorites queryset of user, loaded with their products (one
+    query) restricted to the columns rendered by the favorites cards
+    """
+    return Favorite.objects.filter(users_id=user.id).select_related(
+        'products'
+    ).only(
+        'id', 'products', *(
+            f'products__{field}' for field in FAVORITE_CARD_FIELDS)
+    )
+
+
+def add_favorites(user, product_ids):
+    """
+    Adds the products designated by product_ids to the favorites of user,
+    without reading them first, and returns the set of the ids of the added
+    products (unknown products & existing favorites are ignored)
+    """
+    product_ids = sorted(set(product_ids))
+    if not user.is_authenticated or not product_ids:
+        return set()
+
+    with connection.cursor() as cursor:
+        cursor.execute(ADD_FAVORITES_SQL, {
+            'user_id': user.id,
+            'product_ids': product_ids,
+        })
+        added_ids = {row[0] for row in cursor.fetchall()}
+
+    if added_ids:
+        # No signal is sent by the statement
+        cache.write_through_favorite_ids(user.id)
+    return added_ids
@@ -41,9 +41,9 @@ class SearchForm(forms.Form):
         ('barcode', 'Code-Barres'),
         ('score', 'Nutriscore')
     ]
-    search_filter = forms.CharField(
+    search_filter = forms.ChoiceField(
+        choices=FILTER_CHOICES,
         widget=forms.Select(
-            choices=FILTER_CHOICES,
             attrs={
                 'class': 'btn btn-light rounded-left',
             }),
@@ -0,0 +1,180 @@
+import hashlib
+import json
+import os
+import tempfile
+import threading
+
+
+class HttpCache:
+    """
+    Class used to keep HTTP responses on disk, with their validators (ETag
+    & Last-Modified) used to make conditional requests
+
+    Each response is stored in a file named by the hash of its URL, with a
+    metadata file. The least recently used responses are removed once the
+    cache exceeds max_size bytes.
+
+    ...
+
+    Methods
+    -------
+    get(url)
+        Returns the validators of the cached response of url (None if not
+        cached) and marks it as recently used
+
+    contains(url)
+        Returns whether the response of url is cached
+
+    open_body(url)
+        Returns the opened body of the cached response of url (None if not
+        cached)
+
+    read_chunks(url)
+        Yields the body of the cached response of url by chunks
+
+    writer(url, validators)
+        Returns a CacheWriter saving the body of the response of url
+    """
+
+    CHUNK_SIZE = 64 * 1024
+
+    def __init__(self, directory, max_size):
+        self.directory = directory
+        self.max_size = max_size
+        self.lock = threading.Lock()
+        os.makedirs(directory, exist_ok=True)
+        self.size = sum(size for path, size, mtime in self._entries())
+
+    def _path(self, url):
+        # Path of the body of the cached response of url
+        return os.path.join(
+            self.directory, hashlib.sha256(url.encode()).hexdigest())
+
+    def _entries(self):
+        # Yields the path, size & last use time of the cached bodies
+        with os.scandir(self.directory) as entries:
+            for entry in entries:
+                if entry.name.endswith(('.meta', '.tmp')):
+                    continue
+                stat = entry.stat()
+                yield entry.path, stat.st_size, stat.st_mtime
+
+    def get(self, url):
+        """Returns the validators of the cached response of url (None if not
+        cached) and marks it as recently used"""
+
+        path = self._path(url)
+        try:
+            with open(path + '.meta') as meta:
+                validators = json.load(meta)
+            # The modification time of the body is its last use
+            os.utime(path)
+        except FileNotFoundError:
+            self._remove_orphan(path)
+            return None
+        except (OSError, ValueError):
+            return None
+        return validators
+
+    def contains(self, url):
+        """Returns whether the response of url is cached"""
+
+        return os.path.exists(self._path(url) + '.meta')
+
+    def open_body(self, url):
+        """Returns the opened body of the cached response of url (None if not
+        cached)"""
+
+        path = self._path(url)
+        try:
+            return open(path, 'rb')
+        except FileNotFoundError:
+            self._remove_orphan(path)
+            return None
+
+    def read_chunks(self, url):
+        """Yields the body of the cached response of url by chunks"""
+
+        body = self.open_body(url)
+        if body is None:
+            return
+        with body:
+            for chunk in iter(lambda: body.read(self.CHUNK_SIZE), b''):
+                yield chunk
+
+    def writer(self, url, validators):
+        """Returns a CacheWriter saving the body of the response of url"""
+
+        return CacheWriter(self, self._path(url), validators)
+
+    def _commit(self, path, tmp_path, validators):
+        # Replaces the cached response by the written one & evicts the least
+        # recently used responses if the cache is too large
+        with self.lock:
+            try:
+                self.size -= os.path.getsize(path)
+            except OSError:
+                pass
+            # The body is replaced before its metadata, which is written last
+            # (atomically): a metadata file is never left without its body
+            os.replace(tmp_path, path)
+            self.size += os.path.getsize(path)
+            fd, meta_tmp_path = tempfile.mkstemp(
+                dir=self.directory, suffix='.tmp')
+            with os.fdopen(fd, 'w') as meta:
+                json.dump(validators, meta)
+            os.replace(meta_tmp_path, path + '.meta')
+            if self.size > self.max_size:
+                self._evict()
+
+    def _remove_orphan(self, path):
+        # Removes the metadata of a missing body (interrupted commit or
+        # evicted body), the response is then no longer cached
+        with self.lock:
+            if not os.path.exists(path):
+                try:
+                    os.remove(path + '.meta')
+                except OSError:
+                    pass
+
+    def _evict(self):
+        # Removes the least recently used responses until the cache fits
+        for path, size, mtime in sorted(
+                self._entries(), key=lambda entry: entry[2]):
+            if self.size <= self.max_size:
+                break
+            for file_path in (path, path + '.meta'):
+                try:
+                    os.remove(file_path)
+                except OSError:
+                    pass
+            self.size -= size
+
+
+class CacheWriter:
+    """
+    Class used to write a response body in a HttpCache. The response is
+    cached when the writer is closed without error (with statement)
+    """
+
+    def __init__(self, cache, path, validators):
+        self.cache = cache
+        self.path = path
+        self.validators = validators
+        fd, self.tmp_path = tempfile.mkstemp(
+            dir=cache.directory, suffix='.tmp')
+        self.file = os.fdopen(fd, 'wb')
+
+    def write(self, chunk):
+        self.file.write(chunk)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.file.close()
+        if exc_type is None:
+            self.cache._commit(self.path, self.tmp_path, self.validators)
+        else:
+            # Incomplete responses aren't cached
+            os.remove(self.tmp_path)
@@ -0,0 +1,164 @@
+from django.db import transaction
+from django.db.models import OuterRef, Subquery
+from django.utils import timezone
+
+from .models import Category, Product, ProductCategory, get_grade
+
+
+# Number of products inserted by statement
+BATCH_SIZE = 500
+
+# Product fields filled from the data of a product
+PRODUCT_FIELDS = (
+    'name', 'brand', 'description', 'score', 'barcode', 'url_img_small',
+    'url_img', 'url_off', 'url_img_nutrition',
+)
+
+# Product fields updated by a synchronization
+SYNC_FIELDS = (
+    'name', 'brand', 'description', 'score', 'url_img_small', 'url_img',
+    'url_off', 'url_img_nutrition',
+)
+
+# Keys of an OpenFoodFacts product required to save it, by data key
+PRODUCT_KEYS = {
+    'name': 'product_name',
+    'brand': 'brands',
+    'description': 'ingredients_text',
+    'score': 'nutriscore_grade',
+    'barcode': 'code',
+    'categories': 'categories_tags',
+    'url_img': 'image_url',
+    'url_img_small': 'image_small_url',
+    'url_off': 'url',
+    'url_img_nutrition': 'image_nutrition_url',
+}
+
+
+def get_product_data(product):
+    """
+    Returns the data of an OpenFoodFacts product (dict of the product
+    fields and its 'categories') or None if it is not viable
+    """
+    try:
+        return {key: product[off_key] for key, off_key in PRODUCT_KEYS.items()}
+    except KeyError:
+        return None
+
+
+def get_categories_id():
+    """
+    Returns the ids of the categories in database by json_id
+    """
+    return dict(Category.objects.values_list('json_id', 'id'))
+
+
+def bulk_load_products(products_data, categories_id=None,
+                       batch_size=BATCH_SIZE):
+    """
+    Saves products not yet in database & links them with their categories
+    by batches of batch_size products (one transaction by batch)
+
+    products_data are dicts of the product fields and its 'categories'
+    (json_id list), categories_id the ids of the categories by json_id.
+    Returns the ids of the new products and the number of new links
+    """
+    if categories_id is None:
+        categories_id = get_categories_id()
+
+    new_products_id = []
+    nb_links = 0
+    for start in range(0, len(products_data), batch_size):
+        batch = products_data[start:start + batch_size]
+        with transaction.atomic():
+            ids, links = _load_batch(batch, categories_id)
+        new_products_id += ids
+        nb_links += links
+
+    return new_products_id, nb_links
+
+
+def _load_batch(batch, categories_id):
+    # Saves the new products of batch and their links with categories
+    # Products by barcode (the last data of a barcode wins)
+    batch = {data['barcode']: data for data in batch}
+    existing = set(Product.objects.filter(
+        barcode__in=batch).values_list('barcode', flat=True))
+    batch = {
+        barcode: data for barcode, data in batch.items()
+        if barcode not in existing
+    }
+
+    # The grade is set here as bulk_create doesn't call Product.save()
+    Product.objects.bulk_create(
+        [
+            Product(
+                grade=get_grade(data['score']),
+                **{field: data[field] for field in PRODUCT_FIELDS}
+            )
+            for data in batch.values()
+        ],
+        ignore_conflicts=True,
+    )
+    # Ids aren't returned by an insert ignoring conflicts
+    products = list(Product.objects.filter(
+        barcode__in=batch).values_list('barcode', 'id', 'grade'))
+
+    links = []
+    for barcode, product_id, grade in products:
+        for json_id in set(batch[barcode]['categories']):
+            if json_id in categories_id:
+                links.append(ProductCategory(
+                    product_id=product_id,
+                    category_id=categories_id[json_id],
+                    grade=grade,
+                ))
+    ProductCategory.objects.bulk_create(links, ignore_conflicts=True)
+
+    return [product_id for barcode, product_id, grade in products], len(links)
+
+
+def sync_products(products_data, batch_size=BATCH_SIZE):
+    """
+    Updates the products in database whose data changed (the first data of
+    a barcode wins). Unchanged products & products not in database aren't
+    written. Returns the ids of the updated products & of those whose grade
+    changed
+    """
+    data_by_barcode = {}
+    for data in products_data:
+        if get_grade(data['score']) is not None:
+            data_by_barcode.setdefault(data['barcode'], data)
+
+    changed = []
+    regraded_ids = []
+    now = timezone.now()
+    products = Product.objects.filter(
+        barcode__in=data_by_barcode).only('barcode', 'grade', *SYNC_FIELDS)
+    for product in products:
+        data = data_by_barcode[product.barcode]
+        if all(getattr(product, field) == data[field]
+               for field in SYNC_FIELDS):
+            continue
+
+        for field in SYNC_FIELDS:
+            setattr(product, field, data[field])
+        # The grade & the modification date are set here as bulk_update
+        # doesn't call Product.save()
+        product.updated_at = now
+        grade = get_grade(product.score)
+        if grade != product.grade:
+            product.grade = grade
+            regraded_ids.append(product.id)
+        changed.append(product)
+
+    with transaction.atomic():
+        Product.objects.bulk_update(
+            changed, SYNC_FIELDS + ('grade', 'updated_at'),
+            batch_size=batch_size)
+        # Copies the new grades on the links with categories
+        ProductCategory.objects.filter(product_id__in=regraded_ids).update(
+            grade=Subquery(Product.objects.filter(
+                pk=OuterRef('product_id')).values('grade')[:1]))
+
+    return [product.id for product in changed], regraded_ids
@@ -0,0 +1,185 @@
+import threading
+
+from concurrent.futures import ThreadPoolExecutor
+from time import perf_counter
+from urllib.parse import urlencode
+
+import requests
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+from django.test import Client
+from django.urls import reverse
+
+from products.models import Product
+
+
+class Command(BaseCommand):
+    """
+    Class used to add a new parameter bench_api to manage.py
+
+    ...
+
+    Methods
+    -------
+    add_arguments(parser)
+        Adds options for command line
+
+    handle()
+        Contains the method called when executed the command line
+        (_run_benchmark) with the specified options
+
+    _get_scenarios(query, product_id)
+        Returns the pairs of HTML & JSON API paths compared by the benchmark
+
+    _get_session()
+        Returns the HTTP client of the current thread
+
+    _load(path, nb_requests, concurrency)
+        Requests path nb_requests times from concurrency threads and returns
+        the requests per second, the mean response size & the errors count
+
+    _run_benchmark(nb_requests, concurrency, query, product_id)
+        Compares the requests per second of the HTML pages and of the JSON
+        API for each scenario
+    """
+
+    help = 'Load-tests the JSON API against the HTML pages'
+
+    def add_arguments(self, parser):
+        """Adds options for command line"""
+
+        parser.add_argument(
+            '--requests',
+            type=int,
+            default=200,
+            help='Indicates the number of requests by page',
+        )
+        parser.add_argument(
+            '--concurrency',
+            type=int,
+            default=4,
+            help='Indicates the number of concurrent clients',
+        )
+        parser.add_argument(
+            '--url',
+            help='Indicates a running server (e.g. http://localhost:8000), '
+                 'requested over HTTP instead of in-process',
+        )
+        parser.add_argument(
+            '--query',
+            default='pates',
+            help='Indicates the searched product name',
+        )
+        parser.add_argument(
+            '--product',
+            type=int,
+            help='Indicates the id of the product (first one by default)',
+        )
+
+    def handle(self, *args, **options):
+        """Contains the method called when executed the command line
+        (_run_benchmark) with the specified options"""
+
+        self.url = options['url']
+        self.local = threading.local()
+
+        product_id = options['product']
+        if product_id is None:
+            product_id = Product.objects.order_by('id').values_list(
+                'id', flat=True).first()
+            if product_id is None:
+                raise CommandError("No product in the database")
+
+        self._run_benchmark(
+            options['requests'], options['concurrency'],
+            options['query'], product_id)
+
+    def _get_scenarios(self, query, product_id):
+        """Returns the pairs of HTML & JSON API paths compared by the
+        benchmark"""
+
+        search = urlencode({'search': query, 'search_filter': 'product'})
+        product = {'product_id': product_id}
+        return [
+            ('search', reverse('search') + '?' + search,
+             reverse('api_search') + '?' + search),
+            ('detail', reverse('detail', kwargs=product),
+             reverse('api_detail', kwargs=product)),
+            ('substitutes', reverse('result', kwargs=product),
+             reverse('api_substitutes', kwargs=product)),
+        ]
+
+    def _get_session(self):
+        """Returns the HTTP client of the current thread"""
+
+        if not hasattr(self.local, 'session'):
+            if self.url is None:
+                # The in-process requests use an allowed host
+                host = next((
+                    host for host in settings.ALLOWED_HOSTS
+                    if host != '*' and not host.startswith('.')
+                ), 'localhost')
+                self.local.session = Client(HTTP_HOST=host)
+            else:
+                self.local.session = requests.Session()
+        return self.local.session
+
+    def _load(self, path, nb_requests, concurrency):
+        """Requests path nb_requests times from concurrency threads and
+        returns the requests per second, the mean response size & the
+        errors count"""
+
+        def request(num):
+            session = self._get_session()
+            try:
+                if self.url is None:
+                    response = session.get(path)
+                    content = b''.join(response) if response.streaming \
+                        else response.content
+                    return response.status_code, len(content)
+                response = session.get(self.url + path)
+                return response.status_code, len(response.content)
+            finally:
+                if self.url is None:
+                    # As by the server (CONN_MAX_AGE is 0), each request
+                    # uses its own database connection
+                    connection.close()
+
+        start = perf_counter()
+        with ThreadPoolExecutor(concurrency) as executor:
+            results = list(executor.map(request, range(nb_requests)))
+        elapsed = perf_counter() - start
+
+        errors = sum(1 for status, size in results if status != 200)
+        mean_size = sum(size for status, size in results) / len(results)
+        return nb_requests / elapsed, mean_size, errors
+
+    def _run_benchmark(self, nb_requests, concurrency, query, product_id):
+        """Compares the requests per second of the HTML pages and of the
+        JSON API for each scenario"""
+
+        self.stdout.write(
+            "%s requests by page, %s concurrent clients (%s)" % (
+                nb_requests, concurrency, self.url or 'in-process'))
+        self.stdout.write("{:<12} {:>10} {:>10} {:>10} {:>10} {:>8}".format(
+            'page', 'html req/s', 'html B', 'api req/s', 'api B', 'ratio'))
+
+        for name, html_path, api_path in self._get_scenarios(
+                query, product_id):
+            # Warms up the caches (catalogue, substitutes index)
+            self._load(html_path, 1, 1)
+            self._load(api_path, 1, 1)
+
+            html_rate, html_size, html_errors = self._load(
+                html_path, nb_requests, concurrency)
+            api_rate, api_size, api_errors = self._load(
+                api_path, nb_requests, concurrency)
+            self.stdout.write(
+                "{:<12} {:>10.1f} {:>10.0f} {:>10.1f} {:>10.0f} {:>7.1f}x"
+                .format(name, html_rate, html_size, api_rate, api_size,
+                        api_rate / html_rate))
+            if html_errors or api_errors:
+                self.stderr.write("%s : %s HTML & %s API errors" % (
+                    name, html_errors, api_errors))
@@ -0,0 +1,154 @@
+from time import perf_counter
+
+from django.core.management.base import BaseCommand
+from django.db import connection, transaction
+
+from products.models import Product
+from products.search import search_products
+
+
+# Words used to generate product names and brands
+NAME_WORDS = [
+    'Pâtes', 'Chocolat', 'Biscuits', 'Crème', 'Fromage', 'Jambon', 'Café',
+    'Thé', 'Céréales', 'Purée', 'Soupe', 'Yaourt', 'Confiture', 'Moutarde',
+    'Sardines', 'Riz', 'Lentilles', 'Compote', 'Limonade', 'Beurre',
+    'Miel', 'Saumon', 'Poulet', 'Pâté', 'Gâteau', 'Brioche', 'Crêpes',
+    'Tomates', 'Haricots', 'Olives', 'Noisettes', 'Vanille', 'Fraise',
+    'Pêche', 'Abricot', 'Citron', 'Épinards', 'Carottes', 'Pois', 'Maïs',
+]
+BRAND_WORDS = [
+    'Nutella', 'Coca-Cola', 'Lustucru', 'Bonne Maman', 'Danone',
+    'Président', 'Herta', 'Panzani', 'Lu', 'Fleury Michon', 'Carrefour',
+    'Auchan', 'Leclerc', 'Andros', 'Saint Michel', 'Bjorg', 'Côte d\'Or',
+]
+
+# Old search: unaccent(name) ILIKE '%query%' (no index can be used)
+OLD_FILTERS = {
+    'product': 'name__unaccent__icontains',
+    'brand': 'brand__unaccent__icontains',
+}
+
+
+class Command(BaseCommand):
+    """
+    Class used to add a new parameter bench_search to manage.py
+
+    ...
+
+    Methods
+    -------
+    add_arguments(parser)
+        Adds int & list arguments for command line
+
+    handle()
+        Contains the method called when executed the command line
+        (_run_benchmark) with the specified arguments
+
+    _generate_products(nb_rows)
+        Inserts nb_rows generated products in the database
+
+    _time_search(products, repeat)
+        Returns the mean time (ms) of a search as performed by the search
+        view (existence test, count and first page)
+
+    _run_benchmark(nb_rows, queries, repeat)
+        Compares the old and the new search for each query & filter. All
+        the generated data is rolled back at the end
+    """
+
+    help = 'Benchmarks the products search on a generated product table'
+
+    def add_arguments(self, parser):
+        """Adds int & list arguments for command line"""
+
+        parser.add_argument(
+            'nb_rows',
+            type=int,
+            nargs='?',
+            default=1000000,
+            help='Indicates the number of products to be generated',
+        )
+        parser.add_argument(
+            '--queries',
+            nargs='+',
+            default=['pates', 'creme', 'nutella', 'xylophone'],
+            help='Indicates the searches to be benchmarked',
+        )
+        parser.add_argument(
+            '--repeat',
+            type=int,
+            default=5,
+            help='Indicates the number of runs of each search',
+        )
+
+    def handle(self, *args, **options):
+        """Contains the method called when executed the command line
+        (_run_benchmark) with the specified arguments"""
+
+        self._run_benchmark(
+            options['nb_rows'], options['queries'], options['repeat'])
+
+    def _generate_products(self, nb_rows):
+        """Inserts nb_rows generated products in the database"""
+
+        with connection.cursor() as cursor:
+            cursor.execute("""
+                INSERT INTO products_product (
+                    name, brand, description, score, grade, barcode,
+                    url_img_small, url_img, url_off, url_img_nutrition,
+                    updated_at)
+                SELECT
+                    names[1 + (g * 7) %% cardinality(names)] || ' ' ||
+                    names[1 + (g / 13) %% cardinality(names)] || ' ' || g,
+                    brands[1 + (g / 3) %% cardinality(brands)],
+                    'Description', chr(97 + g %% 5), 1 + g %% 5,
+                    'bench-' || g, '', '', '', '', now()
+                FROM generate_series(1, %(nb_rows)s) g,
+                    (SELECT %(names)s::text[] AS names,
+                        %(brands)s::text[] AS brands) words
+            """, {
+                'nb_rows': nb_rows,
+                'names': NAME_WORDS,
+                'brands': BRAND_WORDS,
+            })
+            cursor.execute("ANALYZE products_product")
+
+    def _time_search(self, products, repeat):
+        """Returns the mean time (ms) of a search as performed by the search
+        view (existence test, count and first page)"""
+
+        start = perf_counter()
+        for i in range(repeat):
+            if products.exists():
+                products.count()
+                list(products[:6])
+        return (perf_counter() - start) * 1000 / repeat
+
+    def _run_benchmark(self, nb_rows, queries, repeat):
+        """Compares the old and the new search for each query & filter. All
+        the generated data is rolled back at the end"""
+
+        with transaction.atomic():
+            self.stdout.write("Generating %s products..." % nb_rows)
+            start = perf_counter()
+            self._generate_products(nb_rows)
+            self.stdout.write(
+                "Generated in {:.1f} s".format(perf_counter() - start))
+
+            self.stdout.write("{:<10} {:<12} {:>12} {:>12}".format(
+                'filter', 'query', 'before (ms)', 'after (ms)'))
+            for search_filter, lookup in OLD_FILTERS.items():
+                for query in queries:
+                    old_products = Product.objects.filter(
+                        **{lookup: query}).order_by('-id')
+                    new_products = search_products(query, search_filter)
+                    self.stdout.write(
+                        "{:<10} {:<12} {:>12.1f} {:>12.1f}".format(
+                            search_filter,
+                            query,
+                            self._time_search(old_products, repeat),
+                            self._time_search(new_products, repeat))
+                    )
+
+            # Removes the generated products
+            transaction.set_rollback(True)
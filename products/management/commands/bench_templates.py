@@ -0,0 +1,162 @@
+from time import perf_counter
+
+from django.conf import settings
+from django.contrib.auth.models import AnonymousUser
+from django.core.cache import cache
+from django.core.cache.utils import make_template_fragment_key
+from django.core.management.base import BaseCommand
+from django.template.backends.django import DjangoTemplates
+from django.template.loader import get_template
+from django.test import RequestFactory
+from django.utils import timezone
+
+from products.models import Product
+
+
+class Command(BaseCommand):
+    """
+    Class used to add a new parameter bench_templates to manage.py
+
+    ...
+
+    Methods
+    -------
+    add_arguments(parser)
+        Adds list & int arguments for command line
+
+    handle()
+        Contains the method called when executed the command line
+        (_run_benchmark) with the specified arguments
+
+    _get_products(nb_cards)
+        Returns nb_cards generated (unsaved) products
+
+    _get_uncached_template(name)
+        Returns the template name loaded without the cached loader
+
+    _clear_cards(products, target)
+        Removes the cached cards of products from the cache
+
+    _time_render(template, context, repeat, clear=None)
+        Returns the mean time (ms) of a rendering of template, clear being
+        called before each one
+
+    _run_benchmark(sizes, repeat)
+        Compares the render time of a search page of each size without
+        cached loader nor cached cards, with cached loader & cards rendered
+        then stored, and with cached cards
+    """
+
+    help = 'Benchmarks the render time of the product cards pages'
+
+    def add_arguments(self, parser):
+        """Adds list & int arguments for command line"""
+
+        parser.add_argument(
+            '--sizes',
+            type=int,
+            nargs='+',
+            default=[6, 60],
+            help='Indicates the numbers of cards of the rendered pages',
+        )
+        parser.add_argument(
+            '--repeat',
+            type=int,
+            default=50,
+            help='Indicates the number of renderings of each page',
+        )
+
+    def handle(self, *args, **options):
+        """Contains the method called when executed the command line
+        (_run_benchmark) with the specified arguments"""
+
+        self._run_benchmark(options['sizes'], options['repeat'])
+
+    def _get_products(self, nb_cards):
+        """Returns nb_cards generated (unsaved) products"""
+
+        updated_at = timezone.now()
+        return [
+            Product(
+                id=pnum + 1,
+                name=f'Pâtes complètes au blé dur {pnum}',
+                brand=f'Brand {pnum}',
+                score='abcde'[pnum % 5],
+                url_img_small=f'https://www.off.com/prod/img_small{pnum}',
+                url_img=f'https://www.off.com/prod/img{pnum}',
+                updated_at=updated_at,
+            )
+            for pnum in range(nb_cards)
+        ]
+
+    def _get_uncached_template(self, name):
+        """Returns the template name loaded without the cached loader"""
+
+        options = dict(settings.TEMPLATES[0]['OPTIONS'], loaders=[
+            'django.template.loaders.filesystem.Loader',
+            'django.template.loaders.app_directories.Loader',
+        ])
+        return DjangoTemplates({
+            'NAME': 'uncached',
+            'DIRS': settings.TEMPLATES[0]['DIRS'],
+            'APP_DIRS': False,
+            'OPTIONS': options,
+        }).get_template(name)
+
+    def _clear_cards(self, products, target):
+        """Removes the cached cards of products from the cache"""
+
+        cache.delete_many([
+            make_template_fragment_key(
+                'product_card', [product.id, product.updated_at, target])
+            for product in products
+        ])
+
+    def _time_render(self, template, context, repeat, clear=None):
+        """Returns the mean time (ms) of a rendering of template, clear
+        being called before each one"""
+
+        request = RequestFactory().get('/products/search/')
+        request.user = AnonymousUser()
+
+        elapsed = 0
+        for i in range(repeat + 1):
+            if clear is not None:
+                clear()
+            start = perf_counter()
+            template.render(context, request)
+            if i:
+                # The first rendering (compilation) isn't counted
+                elapsed += perf_counter() - start
+        return elapsed * 1000 / repeat
+
+    def _run_benchmark(self, sizes, repeat):
+        """Compares the render time of a search page of each size without
+        cached loader nor cached cards, with cached loader & cards rendered
+        then stored, and with cached cards"""
+
+        name = 'products/search.html'
+        self.stdout.write("{:>6} {:>14} {:>14} {:>14}".format(
+            'cards', 'uncached (ms)', 'cold (ms)', 'cached (ms)'))
+
+        for nb_cards in sizes:
+            products = self._get_products(nb_cards)
+            context = {
+                'products': products,
+                'is_result': True,
+                'nb_products': nb_cards,
+                'title': 'Résultats de la recherche : pates',
+            }
+
+            def clear():
+                self._clear_cards(products, 'result')
+
+            self.stdout.write("{:>6} {:>14.2f} {:>14.2f} {:>14.2f}".format(
+                nb_cards,
+                self._time_render(
+                    self._get_uncached_template(name), context, repeat,
+                    clear),
+                self._time_render(get_template(name), context, repeat, clear),
+                self._time_render(get_template(name), context, repeat),
+            ))
+            clear()
@@ -0,0 +1,67 @@
+from django.core.management.base import BaseCommand
+
+from products.cache import invalidate_catalogue
+from products.models import Product, Substitute
+from products.substitutes import INDEX_BATCH_SIZE, refresh_substitutes
+
+
+class Command(BaseCommand):
+    """
+    Class used to add a new parameter build_substitutes to manage.py
+
+    ...
+
+    Methods
+    -------
+    add_arguments(parser)
+        Adds int argument for command line
+
+    handle()
+        Contains the method called when executed the command line
+        (_rebuild_index) with the specified int argument
+
+    _rebuild_index(batch_size)
+        Clears the substitutes index and rebuilds it by batches of products
+    """
+
+    help = 'Rebuilds the substitutes index of pur_beurre database'
+
+    def add_arguments(self, parser):
+        """Adds int argument for command line"""
+
+        parser.add_argument(
+            'batch_size',
+            type=int,
+            nargs='?',
+            default=INDEX_BATCH_SIZE,
+            help='Indicates the number of products indexed by batch',
+        )
+
+    def handle(self, *args, **options):
+        """Contains the method called when executed the command line
+        (_rebuild_index) with the specified int argument"""
+
+        batch_size = options['batch_size']  # Gets batch_size argument
+        self.stdout.write("Rebuilding the substitutes index...")
+        self._rebuild_index(batch_size)  # _rebuild_index method
+
+    def _rebuild_index(self, batch_size):
+        """Clears the substitutes index and rebuilds it by batches of
+        products"""
+
+        Substitute.objects.all().delete()
+        Product.objects.update(substitutes_indexed_at=None)
+        products_id = list(
+            Product.objects.order_by('id').values_list('id', flat=True))
+
+        nb_rows = 0
+        for i in range(0, len(products_id), batch_size):
+            nb_rows += refresh_substitutes(products_id[i:i + batch_size])
+
+        self.stdout.write("{} substitutes indexed for {} products".format(
+            nb_rows,
+            len(products_id))
+        )
+
+        # Result pages (and their validators) are now out of date
+        invalidate_catalogue()
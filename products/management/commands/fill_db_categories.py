@@ -1,10 +1,13 @@
-import requests
+import resource
+import time
 
 from django.core.management.base import BaseCommand
 
-from random import randrange
+from random import sample
 
+from products.cache import invalidate_catalogue
 from products.models import Category
+from products.openfoodfacts import get_client, reservoir_sample
 
 
 URL = 'https://fr.openfoodfacts.org/'  # + /categorie/[name_cat].json
@@ -21,7 +24,7 @@ class Command(BaseCommand):
     Methods
     -------
     add_arguments(parser)
-        Adds int argument for command line
+        Adds int argument & options for command line
 
     handle()
         Contains the method called when executed the command line
@@ -31,23 +34,29 @@ class Command(BaseCommand):
         Method used to get OpenFoodFacts categories from and returns those
         filtered by min_nb_prod
 
+    _stream_categories(min_nb_prod, nb_cat)
+        Returns nb_cat random categories among those filtered by
+        min_nb_prod, the categories document being parsed while it is
+        downloaded and filtered by its products counts
+
     _get_random_categories(nb_cat)
         Returns some random categories contained in _get_categories defined by
         int nb_cat
 
-    _compare_with_db(nb_cat)
+    _compare_with_db(new_categories)
         Compares the data in the database with data received from openfoodfacts
         to avoid adding duplicates. Returns a clean list of categories
 
     _set_categories_to_db(nb_cat)
-        Used to set new categories to database
+        Used to set new categories to database (or only list them with
+        --dry-run), timing each phase
 
     """
 
     help = 'Adds categories and products in pur_beurre database'
 
     def add_arguments(self, parser):
-        """Adds int argument for command line"""
+        """Adds int argument & options for command line"""
 
         parser.add_argument(
             'nb_catg',
@@ -56,15 +65,43 @@ class Command(BaseCommand):
             default=2,
             help='Indicates the number of categories to be created',
         )
+        parser.add_argument(
+            '--stream',
+            action='store_true',
+            help='Parses the categories while they are downloaded',
+        )
+        parser.add_argument(
+            '--dry-run',
+            action='store_true',
+            help='Lists the new categories without adding them',
+        )
+        parser.add_argument(
+            '--no-cache',
+            action='store_true',
+            help='Downloads without the OpenFoodFacts responses cache',
+        )
+        parser.add_argument(
+            '--offline',
+            action='store_true',
+            help='Only reads the OpenFoodFacts responses cache',
+        )
 
     def handle(self, *args, **options):
         """Contains the method called when executed the command line
         (set_categories_to_db) with the specified int argument"""
 
         nb_cats = options['nb_catg']  # Gets nb_catg argument
+        self.stream = options['stream']
+        self.dry_run = options['dry_run']
+        self.client = get_client(
+            cached=not options['no_cache'], offline=options['offline'])
         self.stdout.write("Processing for %s categories..." % nb_cats)
         self._set_categories_to_db(nb_cats)  # set_categories_to_db method
 
+        # Peak resident memory of the process (kilobytes on Linux)
+        self.stdout.write("Peak RSS : %s MB" % round(
+            resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024, 1))
+
     def _get_categories(self, min_nb_prod):
         """Method used to get OpenFoodFacts categories from and returns those
         filtered by min_nb_prod"""
@@ -75,13 +112,7 @@ class Command(BaseCommand):
         list_cat_filtered = []
 
         # Getting all categories from openfoodfacts
-        json_cat = requests.get(
-            URL + 'categories.json',
-            headers={
-                'content-type': 'application/json',
-                'User-Agent': 'python-requests - PurbeurreApp'
-                }
-        ).json()
+        json_cat = self.client.get_json(URL + 'categories.json')
         list_cat = json_cat.get('tags')
 
         for category in list_cat:
@@ -89,13 +120,7 @@ class Command(BaseCommand):
             # least min_nb_prod products
             if (category['products'] >= min_nb_prod and
                     category['id'].startswith('fr')):
-                json_category = requests.get(
-                    category['url'] + '.json',
-                    headers={
-                        'content-type': 'application/json',
-                        'User-Agent': 'python-requests - PurbeurreApp',
-                        }
-                    ).json()
+                json_category = self.client.get_json(category['url'] + '.json')
                 nb_products = int(json_category.get('count'))
                 if nb_products is not None:
                     if nb_products >= min_nb_prod:
@@ -108,12 +133,48 @@ class Command(BaseCommand):
 
         return list_cat_filtered
 
+    def _stream_categories(self, min_nb_prod, nb_cat):
+        """Returns nb_cat random categories among those filtered by
+        min_nb_prod, the categories document being parsed while it is
+        downloaded and filtered by its products counts"""
+
+        self.stdout.write(
+            "Streaming categories containing at least %s products"
+            % min_nb_prod)
+        counts = {'all': 0, 'filtered': 0}
+
+        def iter_filtered():
+            # Yields the categories of the document filtered by min_nb_prod
+            for category in self.client.iter_json_items(
+                    URL + 'categories.json', 'tags'):
+                counts['all'] += 1
+                # The products count of the tag is used, no request by
+                # category
+                if (category.get('products', 0) >= min_nb_prod and
+                        category['id'].startswith('fr')):
+                    counts['filtered'] += 1
+                    yield category
+
+        # Only the selected categories are kept in memory
+        list_cat_selected = reservoir_sample(iter_filtered(), nb_cat)
+
+        print("Categories >= {} product(s) : {} / {}".format(
+            min_nb_prod,
+            counts['filtered'],
+            counts['all'],
+        ))
+
+        return list_cat_selected
+
     def _get_random_categories(self, nb_cat):
         """Returns some random categories contained in _get_categories defined
         by int nb_cat"""
 
         # Gets Openfoodfacts categories
-        lst = self._get_categories(MIN_PRODUCTS_TO_FILTER)
+        if self.stream:
+            lst = self._stream_categories(MIN_PRODUCTS_TO_FILTER, nb_cat)
+        else:
+            lst = self._get_categories(MIN_PRODUCTS_TO_FILTER)
 
         if nb_cat > len(lst):
             # Checks if nb_cat > lst length
@@ -122,26 +183,17 @@ class Command(BaseCommand):
 
         self.stdout.write("Getting %s random categories..." % nb_cat)
 
-        categories = []
-        for i in range(nb_cat):
-            # Random selection of categories
-            index = randrange(0, len(lst))
-            categories.append(lst.pop(index))
-
-        return categories
+        # Random selection of categories
+        return sample(lst, nb_cat)
 
-    def _compare_with_db(self, nb_cat):
+    def _compare_with_db(self, new_categories):
         """Compares the data in the database with data received from
         openfoodfacts to avoid adding duplicates. Returns a clean list of
         categories"""
 
-        categories_in_db = Category.objects.all()  # Gets categories from db
-        json_ids_in_db = []
-        for category in categories_in_db:
-            # Gets json_id from each category
-            json_ids_in_db.append(category.json_id)
-
-        new_categories = self._get_random_categories(nb_cat)
+        # Gets json_id of categories in db
+        json_ids_in_db = set(
+            Category.objects.values_list('json_id', flat=True))
         self.stdout.write(
             "Compares selection with existing data stored in the database...")
 
@@ -150,6 +202,8 @@ class Command(BaseCommand):
             # Checks if new category id exists in db
             if category['id'] not in json_ids_in_db:
                 categories_list.append(category)
+                # Duplicates in the selection are added once
+                json_ids_in_db.add(category['id'])
             else:
                 print("{} with json_id : {} already in database...".format(
                     category['name'],
@@ -159,19 +213,52 @@ class Command(BaseCommand):
         return categories_list
 
     def _set_categories_to_db(self, nb_cat):
-        """Used to set new categories to database"""
-        categories = self._compare_with_db(nb_cat)  # Gets new categories
+        """Used to set new categories to database (or only list them with
+        --dry-run), timing each phase"""
+
+        start = time.perf_counter()
+        new_categories = self._get_random_categories(nb_cat)
+        self.stdout.write(
+            "Download & selection : %.2fs" % (time.perf_counter() - start))
+
+        start = time.perf_counter()
+        categories = self._compare_with_db(new_categories)  # New categories
+        self.stdout.write(
+            "Comparison with database : %.2fs" % (time.perf_counter() - start))
+
+        if self.dry_run:
+            for category in categories:
+                print('Would add new category : {} ({})'.format(
+                    category['name'],
+                    category['id'])
+                )
+            self.stdout.write(
+                "%s categories would be added (dry run)" % len(categories))
+            return
+
+        start = time.perf_counter()
         self.stdout.write(
             "Adding %s categories in the database..." % len(categories))
 
-        # Adds new categories in db
+        # Adds new categories in db, in a single statement. Categories added
+        # meanwhile (same json_id) are ignored
+        Category.objects.bulk_create(
+            [
+                Category(
+                    name=category['name'],
+                    json_id=category['id'],
+                    url=category['url']
+                )
+                for category in categories
+            ],
+            ignore_conflicts=True,
+        )
         for category in categories:
-            new_category = Category(
-                name=category['name'],
-                json_id=category['id'],
-                url=category['url']
-            )
             print('Added new category : {} to database'.format(
                 category['name'])
             )
-            new_category.save()  # Save category to db
+        self.stdout.write(
+            "Insertion : %.2fs" % (time.perf_counter() - start))
+
+        # Cached listings & searches are now out of date
+        invalidate_catalogue()
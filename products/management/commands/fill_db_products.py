@@ -1,13 +1,22 @@
+import json
+import os
 import requests
+import time
 
+from concurrent.futures import ThreadPoolExecutor, as_completed
 from django.core.management.base import BaseCommand
-from random import randrange
-from math import ceil
 
+from products.cache import invalidate_catalogue
+from products.loader import (
+    BATCH_SIZE, bulk_load_products, get_product_data, sync_products
+)
 from products.models import Category, Product
+from products.openfoodfacts import get_client
+from products.substitutes import refresh_related_substitutes
 
 
-PRODUCTS_PER_PAGE = 20  # Products per page of a category in openfoodfacts
+# File used to save the progress of an import (categories already done)
+CHECKPOINT_FILE = 'fill_db_products.checkpoint.json'
 
 
 class Command(BaseCommand):
@@ -19,7 +28,7 @@ class Command(BaseCommand):
     Methods
     -------
     add_arguments(parser)
-        Adds int argument for command line
+        Adds int argument & options for command line
 
     handle()
         Contains the method called when executed the command line
@@ -31,23 +40,45 @@ class Command(BaseCommand):
     _get_categories_jsonid()
         Gets from database categories id & jsonid
 
-    _get_products_from_url(url)
-        Gets all products from category openfoodfacts url
+    _get_products_from_url(url, nb_prod)
+        Gets nb_prod random products from category openfoodfacts url
+
+    _load_checkpoint()
+        Returns the categories url already imported by an interrupted run
+
+    _save_checkpoint(done_urls)
+        Saves the categories url already imported
+
+    _set_categories_done(done_urls, urls)
+        Saves the categories url whose products are saved in the checkpoint
+        & sets the synchronization mark of the new categories
 
     _get_random_products(nb_prod)
-        Returns some random products defined by int nb_prod
+        Downloads & saves nb_prod random products by category
+
+    _save_products(products, categories_db_jsonid, products_db_barcode)
+        Saves viable products not yet in database & links them with their
+        categories
+
+    _bulk_save_products(products, categories_id)
+        Saves viable products not yet in database & links them with their
+        categories by batches (bulk insert)
 
     _test_product_keys(product)
         Tests each key in product to define viability
 
     _get_products_db_barcode()
         Gets all products barcodes in database
+
+    _sync_products()
+        Updates the products of each category changed since its last
+        synchronization
     """
 
     help = 'Adds categories and products in pur_beurre database'
 
     def add_arguments(self, parser):
-        """Adds int argument for command line"""
+        """Adds int argument & options for command line"""
 
         parser.add_argument(
             'nb_prod',
@@ -56,12 +87,77 @@ class Command(BaseCommand):
             default=5,
             help='Indicates the number of products by category to be created'
         )
+        parser.add_argument(
+            '--workers',
+            type=int,
+            default=4,
+            help='Indicates the number of categories downloaded concurrently'
+        )
+        parser.add_argument(
+            '--checkpoint',
+            default=CHECKPOINT_FILE,
+            help='Indicates the file used to resume an interrupted import'
+        )
+        parser.add_argument(
+            '--restart',
+            action='store_true',
+            help='Ignores the progress saved by an interrupted import'
+        )
+        parser.add_argument(
+            '--bulk',
+            action='store_true',
+            help='Saves products by batches instead of one by one'
+        )
+        parser.add_argument(
+            '--batch-size',
+            type=int,
+            default=BATCH_SIZE,
+            help='Indicates the number of products saved by batch (--bulk)'
+        )
+        parser.add_argument(
+            '--sync',
+            action='store_true',
+            help='Updates the products changed since the last synchronization'
+        )
+        parser.add_argument(
+            '--no-cache',
+            action='store_true',
+            help='Downloads without the OpenFoodFacts responses cache'
+        )
+        parser.add_argument(
+            '--offline',
+            action='store_true',
+            help='Only reads the OpenFoodFacts responses cache'
+        )
+        parser.add_argument(
+            '--seed',
+            type=int,
+            help='Selects the same random products at each run'
+        )
 
     def handle(self, *args, **options):
         """Contains the method called when executed the command line
         (set_categories_to_db) with the specified int argument"""
 
         nb_prod = options['nb_prod']  # Gets nb_prod argument
+        self.workers = options['workers']
+        self.checkpoint = options['checkpoint']
+        self.bulk = options['bulk']
+        self.batch_size = options['batch_size']
+        if options['restart'] and os.path.exists(self.checkpoint):
+            os.remove(self.checkpoint)
+
+        self.client = get_client(
+            self.workers,
+            cached=not options['no_cache'],
+            offline=options['offline'],
+            seed=options['seed'],
+        )
+        if options['sync']:
+            self.stdout.write("Synchronizing products...")
+            self._sync_products()  # _sync_products method
+            return
+
         self.stdout.write(
             "Processing for %s products by category..." % nb_prod
         )
@@ -92,147 +188,219 @@ class Command(BaseCommand):
 
         return categories_jsonid
 
-    def _get_products_from_url(self, url):
-        """Gets all products from category openfoodfacts url"""
-
-        # Attempt to connect to the specified url
-        try:
-            url_json = requests.get(
-                url + '.json',
-                headers={
-                    'content-type': 'application/json',
-                    'User-Agent': 'python-requests - PurbeurreApp',
-                    }
-                )
-            print('Connecting to {}...'.format(url))
-        except requests.exceptions.ConnectionError:
-            print('Unable to connect to {}, skip the category...'.format(url))
-            return
+    def _get_products_from_url(self, url, nb_prod):
+        """Gets nb_prod random products from category openfoodfacts url"""
 
-        self.stdout.write("Getting products from " + url)
-        json_data = url_json.json()
+        print('Connecting to {}...'.format(url))
+        return self.client.get_random_products(url, nb_prod)
 
-        nb_products = int(json_data.get('count'))  # Nb products in category
+    def _load_checkpoint(self):
+        """Returns the categories url already imported by an interrupted
+        run"""
 
-        # Nb pages defined by PRODUCTS_PER_PAGE
-        nb_pages = ceil(nb_products / PRODUCTS_PER_PAGE)
+        if not os.path.exists(self.checkpoint):
+            return set()
 
-        lst_all_prods = []
-        i = 1
-        # Gets products from all pages
-        for i in range(nb_pages):
-            page_url = "{}/{}.json".format(url, str(i))
-            json_url_products = requests.get(
-                page_url,
-                headers={
-                    'content-type': 'application/json',
-                    'User-Agent': 'python-requests - PurbeurreApp',
-                    }
-                ).json()
-            lst_products = json_url_products.get('products')
-
-            for product in lst_products:
-                lst_all_prods.append(product)
-
-        return lst_all_prods
+        with open(self.checkpoint) as checkpoint:
+            done_urls = set(json.load(checkpoint))
+        self.stdout.write(
+            "Resuming import, %s categories already done..." % len(done_urls))
+        return done_urls
+
+    def _save_checkpoint(self, done_urls):
+        """Saves the categories url already imported"""
+
+        tmp_file = self.checkpoint + '.tmp'
+        with open(tmp_file, 'w') as checkpoint:
+            json.dump(sorted(done_urls), checkpoint)
+        os.replace(tmp_file, self.checkpoint)
+
+    def _set_categories_done(self, done_urls, urls):
+        """Saves the categories url whose products are saved in the
+        checkpoint & sets the synchronization mark of the new categories"""
+
+        done_urls.update(urls)
+        self._save_checkpoint(done_urls)
+        # Products of categories imported for the first time are up to date
+        # at the start of the import
+        Category.objects.filter(
+            url__in=self.empty_urls.intersection(urls),
+            last_modified_t=None,
+        ).update(last_modified_t=self.start_t)
 
     def _get_random_products(self, nb_prod):
-        """Returns some random products defined by int nb_prod"""
+        """Downloads & saves nb_prod random products by category"""
 
         # Gets Categories jsonid, url & products barcodes
         categories_db_jsonid = self._get_categories_jsonid()
-        products_db_barcode = self._get_products_db_barcode()
-        categories_url = self._get_categories_url()
-
-        list_rnd_products = []
-        count = 0
-        for url in categories_url:
-            # Gets products from categories url
-            products_in_category = self._get_products_from_url(url)
+        categories_id = {
+            catg['json_id']: catg['id'] for catg in categories_db_jsonid
+        }
+        if not self.bulk:
+            products_db_barcode = self._get_products_db_barcode()
+        done_urls = self._load_checkpoint()
+        self.start_t = int(time.time())
+        self.empty_urls = set(Category.objects.filter(
+            products__isnull=True).values_list('url', flat=True))
+        categories_url = [
+            url for url in self._get_categories_url() if url not in done_urls
+        ]
+
+        new_products_id = []
+        failed_urls = []
+        # Downloaded products & categories waiting for a bulk save
+        pending_products = []
+        pending_urls = []
+        save_time = 0
+        with ThreadPoolExecutor(max_workers=self.workers) as executor:
+            # Categories are downloaded concurrently, products are saved by
+            # the main thread as soon as their category is downloaded
+            futures = {
+                executor.submit(self._get_products_from_url, url, nb_prod): url
+                for url in categories_url
+            }
+            for future in as_completed(futures):
+                url = futures[future]
+                try:
+                    products_in_category = future.result()
+                except (requests.exceptions.RequestException, ValueError):
+                    print('Unable to get {}, skip the category...'.format(url))
+                    failed_urls.append(url)
+                    continue
+
+                print('==== {} ===='.format(url))
+                print('')
+                if len(products_in_category) < nb_prod:
+                    print("{} products available in this category...".format(
+                        len(products_in_category)))
+
+                start = time.perf_counter()
+                if self.bulk:
+                    pending_products += products_in_category
+                    pending_urls.append(url)
+                    if len(pending_products) >= self.batch_size:
+                        new_products_id += self._bulk_save_products(
+                            pending_products, categories_id)
+                        pending_products = []
+                else:
+                    new_products_id += self._save_products(
+                        products_in_category,
+                        categories_db_jsonid,
+                        products_db_barcode
+                    )
+                    pending_urls.append(url)
+                save_time += time.perf_counter() - start
+                print('')
+
+                if not pending_products:
+                    # Categories are done once their products are saved
+                    self._set_categories_done(done_urls, pending_urls)
+                    pending_urls = []
+
+        if pending_products:
+            start = time.perf_counter()
+            new_products_id += self._bulk_save_products(
+                pending_products, categories_id)
+            save_time += time.perf_counter() - start
+            self._set_categories_done(done_urls, pending_urls)
+
+        print(str(len(new_products_id)) + ' viables products.')
+        self.stdout.write(
+            "%s products saved in %.2fs (%.0f rows/s)" % (
+                len(new_products_id),
+                save_time,
+                len(new_products_id) / save_time if save_time else 0,
+            )
+        )
 
-            if products_in_category is None:
+        # Indexes substitutes of the new products & of the products of their
+        # categories, which may have new better substitutes
+        refresh_related_substitutes(new_products_id, self.batch_size)
+        # Cached listings & searches are now out of date
+        invalidate_catalogue()
+
+        if failed_urls:
+            # Running the command again only retries the failed categories
+            self.stdout.write(
+                "%s categories failed, run the command again to resume..."
+                % len(failed_urls))
+        elif os.path.exists(self.checkpoint):
+            # The import is complete, nothing to resume
+            os.remove(self.checkpoint)
+
+        return new_products_id
+
+    def _save_products(self, products, categories_db_jsonid,
+                       products_db_barcode):
+        """Saves viable products not yet in database & links them with their
+        categories"""
+
+        new_products_id = []
+        for product in products:
+            # Test products data
+            data = self._test_product_keys(product)
+            if data is None:
                 continue
 
-            print('==== {} ===='.format(url))
-            print('')
-
-            if nb_prod > len(products_in_category):
-                nb_prod = len(products_in_category)
-                print(
-                    "{} products available in this category...".format(nb_prod)
+            # Checks if product barcode exists in db
+            if data['barcode'] in products_db_barcode:
+                print('{} with barcode : {} already in database'.format(
+                    data['name'],
+                    data['barcode'])
                 )
+                continue
 
-            rnd_prod_catg = []
-            for i in range(nb_prod):
-                # Gets some products randomly
-                index = randrange(0, len(products_in_category))
-                rnd_prod_catg.append(products_in_category.pop(index))
-                i += 1
-
-            list_rnd_products.append(rnd_prod_catg)
-
-            for product in rnd_prod_catg:
-                # Test products data
-                data = self._test_product_keys(product)
-                if data is not None:
-                    prod = Product(
-                        name=data['name'],
-                        brand=data['brand'],
-                        description=data['description'],
-                        score=data['score'],
-                        barcode=data['barcode'],
-                        url_img_small=data['url_img_small'],
-                        url_img=data['url_img'],
-                        url_off=data['url_off'],
-                        url_img_nutrition=data['url_img_nutrition'],
+            prod = Product(
+                name=data['name'],
+                brand=data['brand'],
+                description=data['description'],
+                score=data['score'],
+                barcode=data['barcode'],
+                url_img_small=data['url_img_small'],
+                url_img=data['url_img'],
+                url_off=data['url_off'],
+                url_img_nutrition=data['url_img_nutrition'],
+            )
+            prod.save()
+            products_db_barcode.add(data['barcode'])
+
+            for catg in categories_db_jsonid:
+                # Linking (if any) in database between new products
+                # and existing categories
+                if catg['json_id'] in product['categories_tags']:
+                    prod.categories.add(catg['id'])
+                    print('Links {} with category id {}'.format(
+                        data['name'],
+                        catg['id'])
                     )
 
-                    # Checks if product barcode exists in db
-                    if data['barcode'] not in products_db_barcode:
-                        prod.save()
-                    else:
-                        print(
-                            '{} with barcode : {} already in database'.format(
-                                data['name'],
-                                data['barcode'])
-                            )
-                        continue
-
-                    for catg in categories_db_jsonid:
-                        # Linking (if any) in database between new products
-                        # and existing categories
-                        if catg['json_id'] in product['categories_tags']:
-                            prod.categories.add(catg['id'])
-                            print('Links {} with category id {}'.format(
-                                data['name'],
-                                catg['id'])
-                            )
-
-                    count += 1
-            print('')
-
-        print(str(count) + ' viables products.')
-
-        return list_rnd_products
+            new_products_id.append(prod.id)
+
+        return new_products_id
+
+    def _bulk_save_products(self, products, categories_id):
+        """Saves viable products not yet in database & links them with their
+        categories by batches (bulk insert)"""
+
+        products_data = []
+        for product in products:
+            # Test products data
+            data = self._test_product_keys(product)
+            if data is not None:
+                products_data.append(data)
+
+        new_products_id, nb_links = bulk_load_products(
+            products_data, categories_id, self.batch_size)
+        print('{} new products, {} links with categories'.format(
+            len(new_products_id), nb_links))
+
+        return new_products_id
 
     def _test_product_keys(self, product):
         """Tests each key in product to define viability"""
 
-        data = None
-        try:
-            data = {
-                'name': product['product_name'],
-                'brand': product['brands'],
-                'description': product['ingredients_text'],
-                'score': product['nutriscore_grade'],
-                'barcode': product['code'],
-                'categories': product['categories_tags'],
-                'url_img': product['image_url'],
-                'url_img_small': product['image_small_url'],
-                'url_off': product['url'],
-                'url_img_nutrition': product['image_nutrition_url']
-            }
-        except KeyError:
+        data = get_product_data(product)
+        if data is None:
             print('This product is not viable')
 
         return data
@@ -240,11 +408,64 @@ class Command(BaseCommand):
     def _get_products_db_barcode(self):
         """Gets all products barcodes in database"""
 
-        products = Product.objects.all()  # Gets all products from database
-        products_barcode = []
-
-        for product in products:
-            # Gets product barcode
-            products_barcode.append(product.barcode)
-
-        return products_barcode
+        # A set, as each downloaded product is looked up in it
+        return set(Product.objects.values_list('barcode', flat=True))
+
+    def _sync_products(self):
+        """Updates the products of each category changed since its last
+        synchronization"""
+
+        categories = list(Category.objects.all())
+        updated_ids = set()
+        regraded_ids = set()
+        nb_downloaded = 0
+        with ThreadPoolExecutor(max_workers=self.workers) as executor:
+            futures = {
+                executor.submit(
+                    self.client.get_changed_products,
+                    category.url,
+                    category.last_modified_t
+                ): category
+                for category in categories
+            }
+            for future in as_completed(futures):
+                category = futures[future]
+                try:
+                    products = future.result()
+                except (requests.exceptions.RequestException, ValueError):
+                    print('Unable to get {}, skip the category...'.format(
+                        category.url))
+                    continue
+
+                products_data = []
+                for product in products:
+                    data = get_product_data(product)
+                    if data is not None:
+                        products_data.append(data)
+                updated, regraded = sync_products(
+                    products_data, self.batch_size)
+                print('{} : {} changed products, {} updated'.format(
+                    category.url, len(products), len(updated)))
+                nb_downloaded += len(products)
+                updated_ids.update(updated)
+                regraded_ids.update(regraded)
+
+                if products:
+                    # The mark is saved once the products are updated
+                    category.last_modified_t = max(
+                        product.get('last_modified_t', 0)
+                        for product in products)
+                    category.save(update_fields=['last_modified_t'])
+
+        self.stdout.write("%s products downloaded, %s updated" % (
+            nb_downloaded, len(updated_ids)))
+
+        if updated_ids:
+            # Substitutes depend on the grades: the regraded products may be
+            # better substitutes in their categories, or worse than the
+            # products having them in their pool
+            refresh_related_substitutes(regraded_ids, self.batch_size)
+            # Cached listings & searches are now out of date
+            invalidate_catalogue()
+
+        return updated_ids
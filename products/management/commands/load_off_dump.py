@@ -0,0 +1,317 @@
+import csv
+import gzip
+import io
+import json
+import sys
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection, transaction
+
+from products.cache import invalidate_catalogue
+from products.loader import PRODUCT_FIELDS, get_product_data
+from products.models import GRADES, Product
+from products.openfoodfacts import URL
+from products.management.commands.fill_db_categories import (
+    MIN_PRODUCTS_TO_FILTER
+)
+
+
+# Number of rows sent to the database by COPY statement
+COPY_BATCH_SIZE = 10000
+
+# Staging tables (dropped at the end of the load or of the transaction)
+CREATE_STAGING_SQL = """
+    CREATE TEMP TABLE off_staging_product (
+        line bigint, barcode text, name text, brand text, description text,
+        score text, url_img_small text, url_img text, url_off text,
+        url_img_nutrition text
+    ) ON COMMIT DROP;
+    CREATE TEMP TABLE off_staging_link (
+        barcode text, json_id text
+    ) ON COMMIT DROP;
+"""
+
+STAGING_PRODUCT_COLUMNS = ('line',) + PRODUCT_FIELDS
+
+# Inserts new products & updates the changed ones (the last line of a
+# barcode wins). Unchanged products aren't rewritten (nor their
+# modification date). Returns the numbers of inserted & updated products
+UPSERT_PRODUCTS_SQL = """
+    WITH upserted AS (
+        INSERT INTO products_product (
+            name, brand, description, score, grade, barcode, url_img_small,
+            url_img, url_off, url_img_nutrition, updated_at
+        )
+        SELECT DISTINCT ON (barcode)
+            name, brand, description, score,
+            array_position(%(grades)s::text[], lower(score)), barcode,
+            url_img_small, url_img, url_off, url_img_nutrition, now()
+        FROM off_staging_product
+        ORDER BY barcode, line DESC
+        ON CONFLICT (barcode) DO UPDATE SET
+            name = EXCLUDED.name,
+            brand = EXCLUDED.brand,
+            description = EXCLUDED.description,
+            score = EXCLUDED.score,
+            grade = EXCLUDED.grade,
+            url_img_small = EXCLUDED.url_img_small,
+            url_img = EXCLUDED.url_img,
+            url_off = EXCLUDED.url_off,
+            url_img_nutrition = EXCLUDED.url_img_nutrition,
+            updated_at = EXCLUDED.updated_at
+        WHERE (
+            products_product.name, products_product.brand,
+            products_product.description, products_product.score,
+            products_product.url_img_small, products_product.url_img,
+            products_product.url_off, products_product.url_img_nutrition
+        ) IS DISTINCT FROM (
+            EXCLUDED.name, EXCLUDED.brand, EXCLUDED.description,
+            EXCLUDED.score, EXCLUDED.url_img_small, EXCLUDED.url_img,
+            EXCLUDED.url_off, EXCLUDED.url_img_nutrition
+        )
+        RETURNING xmax = 0 AS inserted
+    )
+    SELECT
+        count(*) FILTER (WHERE inserted),
+        count(*) FILTER (WHERE NOT inserted)
+    FROM upserted
+"""
+
+# Inserts the categories of the language containing at least min_products
+# products of the dump. Their name is made from their json_id (the dump
+# doesn't give the name of each tag)
+INSERT_CATEGORIES_SQL = """
+    INSERT INTO products_category (name, json_id, url)
+    SELECT
+        left(upper(left(slug, 1)) || replace(substr(slug, 2), '-', ' '), 200),
+        json_id, left(%(url)s || slug, 200)
+    FROM (
+        SELECT json_id, substr(json_id, length(%(lang)s) + 2) AS slug
+        FROM off_staging_link
+        WHERE json_id LIKE %(lang)s || ':%%' AND length(json_id) <= 200
+        GROUP BY json_id
+        HAVING count(DISTINCT barcode) >= %(min_products)s
+    ) tags
+    ON CONFLICT (json_id) DO NOTHING
+"""
+
+# Links products with their categories in database, with a copy of the
+# product grade
+UPSERT_LINKS_SQL = """
+    INSERT INTO products_product_categories (product_id, category_id, grade)
+    SELECT DISTINCT p.id, c.id, p.grade
+    FROM off_staging_link l
+    JOIN products_product p ON p.barcode = l.barcode
+    JOIN products_category c ON c.json_id = l.json_id
+    ON CONFLICT (product_id, category_id) DO UPDATE SET
+        grade = EXCLUDED.grade
+    WHERE products_product_categories.grade IS DISTINCT FROM EXCLUDED.grade
+"""
+
+
+class Command(BaseCommand):
+    """
+    Class used to add a new parameter load_off_dump to manage.py
+
+    ...
+
+    Methods
+    -------
+    add_arguments(parser)
+        Adds path argument & options for command line
+
+    handle()
+        Contains the method called when executed the command line
+        (_load_dump) with the specified path argument
+
+    _read_products(path, file_format)
+        Yields the products of the (gzipped) CSV or JSONL export
+
+    _is_loadable(data)
+        Tests that the product data fit in the products columns
+
+    _copy_products(products)
+        Copies the viable products & their categories in staging tables
+
+    _load_dump(path, file_format)
+        Loads the export in staging tables then upserts products,
+        categories & their links
+    """
+
+    help = 'Loads an OpenFoodFacts export in pur_beurre database'
+
+    def add_arguments(self, parser):
+        """Adds path argument & options for command line"""
+
+        parser.add_argument(
+            'path',
+            help='Indicates the OpenFoodFacts export file (may be gzipped)',
+        )
+        parser.add_argument(
+            '--format',
+            choices=('csv', 'jsonl'),
+            help='Indicates the export format (guessed from the file name)',
+        )
+        parser.add_argument(
+            '--batch-size',
+            type=int,
+            default=COPY_BATCH_SIZE,
+            help='Indicates the number of rows copied by statement',
+        )
+        parser.add_argument(
+            '--min-products',
+            type=int,
+            default=MIN_PRODUCTS_TO_FILTER,
+            help='Indicates the minimum number of products of a new category',
+        )
+        parser.add_argument(
+            '--lang',
+            default='fr',
+            help='Indicates the language of the new categories',
+        )
+
+    def handle(self, *args, **options):
+        """Contains the method called when executed the command line
+        (_load_dump) with the specified path argument"""
+
+        path = options['path']
+        file_format = options['format']
+        if file_format is None:
+            file_format = 'jsonl' if '.jsonl' in path else 'csv'
+        self.batch_size = options['batch_size']
+        self.min_products = options['min_products']
+        self.lang = options['lang']
+
+        self.stdout.write("Loading %s (%s)..." % (path, file_format))
+        try:
+            self._load_dump(path, file_format)  # _load_dump method
+        except OSError as error:
+            raise CommandError(error)
+
+    def _read_products(self, path, file_format):
+        """Yields the products of the (gzipped) CSV or JSONL export"""
+
+        opener = gzip.open if path.endswith('.gz') else open
+        with opener(path, 'rt', encoding='utf-8', newline='') as dump:
+            if file_format == 'jsonl':
+                for line in dump:
+                    if line.strip():
+                        yield json.loads(line)
+                return
+
+            # The CSV export is tab separated, without quoting, and some
+            # fields exceed the default size limit
+            csv.field_size_limit(sys.maxsize)
+            for row in csv.DictReader(
+                    dump, delimiter='\t', quoting=csv.QUOTE_NONE):
+                # Empty columns are missing keys, as in the JSON API
+                product = {key: value for key, value in row.items() if value}
+                if 'categories_tags' in product:
+                    product['categories_tags'] = (
+                        product['categories_tags'].split(','))
+                yield product
+
+    def _is_loadable(self, data):
+        """Tests that the product data fit in the products columns"""
+
+        if str(data['score']).lower() not in GRADES:
+            return False
+        for field in PRODUCT_FIELDS:
+            max_length = Product._meta.get_field(field).max_length
+            if max_length is not None and len(data[field]) > max_length:
+                return False
+        return True
+
+    def _copy_products(self, products):
+        """Copies the viable products & their categories in staging
+        tables"""
+
+        nb_rows = nb_viables = 0
+        products_buffer, links_buffer = io.StringIO(), io.StringIO()
+        products_writer = csv.writer(products_buffer)
+        links_writer = csv.writer(links_buffer)
+
+        def copy(cursor):
+            # Sends the buffered rows to the staging tables
+            for table, columns, buffer in (
+                    ('off_staging_product', STAGING_PRODUCT_COLUMNS,
+                     products_buffer),
+                    ('off_staging_link', ('barcode', 'json_id'),
+                     links_buffer)):
+                buffer.seek(0)
+                cursor.copy_expert(
+                    "COPY {} ({}) FROM STDIN WITH (FORMAT csv)".format(
+                        table, ', '.join(columns)),
+                    buffer)
+                buffer.seek(0)
+                buffer.truncate()
+
+        with connection.cursor() as cursor:
+            for product in products:
+                nb_rows += 1
+                data = get_product_data(product)
+                if data is None or not self._is_loadable(data):
+                    continue
+
+                nb_viables += 1
+                # NUL characters are refused by PostgreSQL text columns
+                products_writer.writerow([nb_rows] + [
+                    str(data[field]).replace('\x00', '')
+                    for field in PRODUCT_FIELDS
+                ])
+                for json_id in data['categories']:
+                    links_writer.writerow([data['barcode'], json_id])
+
+                if nb_viables % self.batch_size == 0:
+                    copy(cursor)
+                    print('{} rows read, {} viables products...'.format(
+                        nb_rows, nb_viables))
+            copy(cursor)
+
+        return nb_rows, nb_viables
+
+    def _load_dump(self, path, file_format):
+        """Loads the export in staging tables then upserts products,
+        categories & their links"""
+
+        with transaction.atomic(), connection.cursor() as cursor:
+            cursor.execute(CREATE_STAGING_SQL)
+
+            start = time.perf_counter()
+            nb_rows, nb_viables = self._copy_products(
+                self._read_products(path, file_format))
+            copy_time = time.perf_counter() - start
+            self.stdout.write(
+                "%s rows read, %s viables products in %.2fs (%.0f rows/s)" % (
+                    nb_rows, nb_viables, copy_time,
+                    nb_rows / copy_time if copy_time else 0))
+
+            start = time.perf_counter()
+            cursor.execute("ANALYZE off_staging_product, off_staging_link")
+            cursor.execute(UPSERT_PRODUCTS_SQL, {
+                'grades': sorted(GRADES, key=GRADES.get),
+            })
+            nb_inserted, nb_updated = cursor.fetchone()
+            cursor.execute(INSERT_CATEGORIES_SQL, {
+                'url': URL + 'categorie/',
+                'lang': self.lang,
+                'min_products': self.min_products,
+            })
+            nb_categories = cursor.rowcount
+            cursor.execute(UPSERT_LINKS_SQL)
+            nb_links = cursor.rowcount
+            cursor.execute("DROP TABLE off_staging_product, off_staging_link")
+            upsert_time = time.perf_counter() - start
+
+        self.stdout.write(
+            "%s products added, %s updated, %s categories added, "
+            "%s links with categories in %.2fs (%.0f rows/s)" % (
+                nb_inserted, nb_updated, nb_categories, nb_links,
+                upsert_time,
+                nb_viables / upsert_time if upsert_time else 0))
+
+        # Cached listings & searches are now out of date
+        invalidate_catalogue()
+        self.stdout.write(
+            "Run build_substitutes to index the substitutes of the products")
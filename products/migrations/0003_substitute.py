@@ -0,0 +1,25 @@
+# Generated by Django 3.1.5 on 2026-10-18 09:10
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('products', '0002_auto_20210510_2247'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='Substitute',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('product', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='substitute_pool', to='products.product')),
+                ('substitute', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='substitute_for', to='products.product')),
+            ],
+            options={
+                'unique_together': {('product', 'substitute')},
+            },
+        ),
+    ]
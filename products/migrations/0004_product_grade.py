@@ -0,0 +1,70 @@
+from django.db import migrations, models
+from django.db.models import OuterRef, Subquery
+import django.db.models.deletion
+
+
+GRADES = {'a': 1, 'b': 2, 'c': 3, 'd': 4, 'e': 5}
+
+
+def set_grades(apps, schema_editor):
+    """
+    Sets the ordinal grade of products and of their links with categories
+    from the nutriscore letter
+    """
+    Product = apps.get_model('products', 'Product')
+    ProductCategory = apps.get_model('products', 'ProductCategory')
+
+    for letter, grade in GRADES.items():
+        Product.objects.filter(score__iexact=letter).update(grade=grade)
+
+    ProductCategory.objects.update(grade=Subquery(
+        Product.objects.filter(pk=OuterRef('product_id')).values('grade')
+    ))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('products', '0003_substitute'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='product',
+            name='grade',
+            field=models.PositiveSmallIntegerField(db_index=True, null=True),
+        ),
+        # The existing products_product_categories table becomes the table
+        # of the ProductCategory through model
+        migrations.SeparateDatabaseAndState(
+            state_operations=[
+                migrations.CreateModel(
+                    name='ProductCategory',
+                    fields=[
+                        ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                        ('category', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='products.category')),
+                        ('product', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='products.product')),
+                    ],
+                    options={
+                        'db_table': 'products_product_categories',
+                        'unique_together': {('product', 'category')},
+                    },
+                ),
+                migrations.AlterField(
+                    model_name='product',
+                    name='categories',
+                    field=models.ManyToManyField(related_name='products', through='products.ProductCategory', to='products.Category'),
+                ),
+            ],
+        ),
+        migrations.AddField(
+            model_name='productcategory',
+            name='grade',
+            field=models.PositiveSmallIntegerField(null=True),
+        ),
+        migrations.RunPython(set_grades, migrations.RunPython.noop),
+        migrations.AddIndex(
+            model_name='productcategory',
+            index=models.Index(fields=['category', 'grade', 'product'], name='products_pc_catg_grade_idx'),
+        ),
+    ]
@@ -0,0 +1,48 @@
+from django.contrib.postgres.operations import TrigramExtension
+from django.db import migrations
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('products', '0004_product_grade'),
+    ]
+
+    operations = [
+        TrigramExtension(),
+        # unaccent() is only STABLE and can't be used by an index. This
+        # wrapper (with an explicit dictionary) is IMMUTABLE and also
+        # lower-cases the text searched by the products search
+        migrations.RunSQL(
+            sql="""
+                CREATE FUNCTION products_unaccent(text) RETURNS text AS $$
+                    SELECT lower(public.unaccent(
+                        'public.unaccent'::regdictionary, $1))
+                $$ LANGUAGE sql IMMUTABLE PARALLEL SAFE STRICT;
+            """,
+            reverse_sql="DROP FUNCTION products_unaccent(text);",
+        ),
+        # Trigram indexes used by the "contains" searches
+        migrations.RunSQL(
+            sql="""
+                CREATE INDEX products_product_name_trgm
+                    ON products_product
+                    USING gin (products_unaccent(name) gin_trgm_ops);
+                CREATE INDEX products_product_brand_trgm
+                    ON products_product
+                    USING gin (products_unaccent(brand) gin_trgm_ops);
+                CREATE INDEX products_product_barcode_trgm
+                    ON products_product
+                    USING gin (barcode gin_trgm_ops);
+                CREATE INDEX products_category_name_trgm
+                    ON products_category
+                    USING gin (products_unaccent(name) gin_trgm_ops);
+            """,
+            reverse_sql="""
+                DROP INDEX products_product_name_trgm;
+                DROP INDEX products_product_brand_trgm;
+                DROP INDEX products_product_barcode_trgm;
+                DROP INDEX products_category_name_trgm;
+            """,
+        ),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 3.1.5 on 2026-10-18 09:30
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('products', '0005_search_indexes'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='category',
+            name='last_modified_t',
+            field=models.BigIntegerField(null=True),
+        ),
+    ]
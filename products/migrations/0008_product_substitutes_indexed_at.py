@@ -0,0 +1,18 @@
+# Generated by Django 3.1.5 on 2026-10-18 10:04
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('products', '0007_product_updated_at'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='product',
+            name='substitutes_indexed_at',
+            field=models.DateTimeField(null=True),
+        ),
+    ]
@@ -2,11 +2,25 @@ from django.db import models
 from django.contrib.auth.models import User
 
 
+# Ordinal grade of each nutriscore letter (1 is the best grade)
+GRADES = {'a': 1, 'b': 2, 'c': 3, 'd': 4, 'e': 5}
+
+
+def get_grade(score):
+    """
+    Returns the ordinal grade of a nutriscore letter or None if unknown
+    """
+    return GRADES.get(str(score).lower())
+
+
 class Category(models.Model):
     # Category model
     name = models.CharField(max_length=200)
     json_id = models.CharField(max_length=200, unique=True)
     url = models.URLField()
+    # High-water mark of the synchronization (OpenFoodFacts last_modified_t
+    # of the last synchronized product), None until a first synchronization
+    last_modified_t = models.BigIntegerField(null=True)
 
     def __str__(self):
         return self.name
@@ -18,16 +32,52 @@ class Product(models.Model):
     brand = models.CharField(max_length=200, default="NC")
     description = models.TextField(default="Aucune description disponible...")
     score = models.CharField(max_length=1)
+    grade = models.PositiveSmallIntegerField(null=True, db_index=True)
     barcode = models.CharField(max_length=50, unique=True)
     url_img_small = models.URLField()
     url_img = models.URLField()
     url_off = models.URLField()
     url_img_nutrition = models.URLField()
-    categories = models.ManyToManyField(Category, related_name='products')
+    # Last change of the product (also set by the import commands), used by
+    # the conditional responses of its pages
+    updated_at = models.DateTimeField(auto_now=True)
+    # Last (re)build of the substitutes index of the product, None until it
+    # is indexed (an indexed product may have no substitute)
+    substitutes_indexed_at = models.DateTimeField(null=True)
+    categories = models.ManyToManyField(
+        Category, related_name='products', through='ProductCategory')
 
     def __str__(self):
         return f'{self.name}, {self.brand}, {self.barcode}'
 
+    def save(self, *args, **kwargs):
+        # The ordinal grade is always derived from the nutriscore letter
+        adding = self._state.adding
+        self.grade = get_grade(self.score)
+        super().save(*args, **kwargs)
+        if not adding:
+            # Copies the grade on the links with categories
+            ProductCategory.objects.filter(product=self).update(
+                grade=self.grade)
+
+
+class ProductCategory(models.Model):
+    # Association products & categories, with a copy of the product grade
+    # used to rank products of a category
+    product = models.ForeignKey(Product, on_delete=models.CASCADE)
+    category = models.ForeignKey(Category, on_delete=models.CASCADE)
+    grade = models.PositiveSmallIntegerField(null=True)
+
+    class Meta:
+        db_table = 'products_product_categories'
+        unique_together = ('product', 'category',)
+        # Products of a category by grade (substitutes lookups)
+        indexes = [
+            models.Index(
+                fields=['category', 'grade', 'product'],
+                name='products_pc_catg_grade_idx'),
+        ]
+
 
 class Favorite(models.Model):
     # Favorite model
@@ -41,3 +91,18 @@ class Favorite(models.Model):
     class Meta:
         # Constraint of unicity on the association products & users
         unique_together = ('products', 'users',)
+
+
+class Substitute(models.Model):
+    # Substitute index model (pool of precomputed substitutes by product)
+    product = models.ForeignKey(
+        Product, on_delete=models.CASCADE, related_name='substitute_pool')
+    substitute = models.ForeignKey(
+        Product, on_delete=models.CASCADE, related_name='substitute_for')
+
+    def __str__(self):
+        return f'{self.product_id} -> {self.substitute_id}'
+
+    class Meta:
+        # Constraint of unicity (and lookup index) on product & substitute
+        unique_together = ('product', 'substitute',)
@@ -0,0 +1,300 @@
+import codecs
+import contextlib
+import json
+import random
+import requests
+
+from django.conf import settings
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+
+from .httpcache import HttpCache
+
+
+URL = 'https://fr.openfoodfacts.org/'  # + /categorie/[name_cat].json
+
+PRODUCTS_PER_PAGE = 20  # Products per page of a category in openfoodfacts
+
+STREAM_CHUNK_SIZE = 64 * 1024  # Bytes read at once from a streamed response
+
+HEADERS = {
+    'content-type': 'application/json',
+    'User-Agent': 'python-requests - PurbeurreApp',
+}
+
+
+class NotCachedError(requests.exceptions.RequestException):
+    """
+    Raised by an offline client for a response missing from the cache
+    """
+
+
+class OpenFoodFactsClient:
+    """
+    Class used to get data from OpenFoodFacts through a pooled HTTP session
+    (keep-alive connections, retries with exponential backoff)
+
+    With a HttpCache, responses are cached on disk and revalidated by
+    conditional requests. An offline client only reads the cache. With a
+    seed, each run selects the same random products (whose pages are then
+    cached).
+
+    ...
+
+    Methods
+    -------
+    get_json(url)
+        Returns the JSON document designated by url
+
+    get_category_count(url)
+        Returns the number of products of the category designated by url
+
+    get_random_products(url, nb_prod)
+        Returns nb_prod random products of the category designated by url.
+        Only the pages containing them are downloaded (offline, they are
+        selected in the cached pages)
+
+    get_changed_products(url, since)
+        Returns the products of the category designated by url modified
+        after since (last_modified_t), the most recently modified first
+
+    iter_json_items(url, key)
+        Yields the items of the key array of the JSON document designated
+        by url, parsed while it is downloaded
+    """
+
+    def __init__(self, pool_size=4, retries=3, backoff=0.5, timeout=30,
+                 cache=None, offline=False, seed=None):
+        self.timeout = timeout
+        self.cache = cache
+        self.offline = offline
+        self.seed = seed
+        self.session = requests.Session()
+        self.session.headers.update(HEADERS)
+
+        retry = Retry(
+            total=retries,
+            backoff_factor=backoff,
+            status_forcelist=(429, 500, 502, 503, 504),
+        )
+        adapter = HTTPAdapter(
+            pool_connections=pool_size,
+            pool_maxsize=pool_size,
+            max_retries=retry,
+        )
+        self.session.mount('http://', adapter)
+        self.session.mount('https://', adapter)
+
+    def _iter_chunks(self, url):
+        # Yields the body of the response of url by chunks (bytes), from
+        # the cache if it is still valid
+        validators = self.cache.get(url) if self.cache else None
+        # The cached body is opened first, it stays readable if it is
+        # evicted meanwhile. A missing body is a cache miss.
+        body = self.cache.open_body(url) if validators is not None else None
+        if body is None:
+            validators = None
+        with body or contextlib.nullcontext():
+            yield from self._iter_response_chunks(url, validators, body)
+
+    def _iter_response_chunks(self, url, validators, body):
+        # Yields the body of the response of url by chunks, read from the
+        # opened cached body if it is still valid
+        if self.offline:
+            if body is None:
+                raise NotCachedError('{} is not cached'.format(url))
+            yield from iter(lambda: body.read(STREAM_CHUNK_SIZE), b'')
+            return
+
+        headers = {}
+        if validators:
+            if validators.get('etag'):
+                headers['If-None-Match'] = validators['etag']
+            if validators.get('last_modified'):
+                headers['If-Modified-Since'] = validators['last_modified']
+
+        with self.session.get(url, headers=headers, timeout=self.timeout,
+                              stream=True) as response:
+            if response.status_code == 304 and body is not None:
+                yield from iter(lambda: body.read(STREAM_CHUNK_SIZE), b'')
+                return
+
+            response.raise_for_status()
+            chunks = response.iter_content(STREAM_CHUNK_SIZE)
+            if self.cache is None:
+                yield from chunks
+                return
+
+            with self.cache.writer(url, {
+                'etag': response.headers.get('ETag'),
+                'last_modified': response.headers.get('Last-Modified'),
+            }) as writer:
+                for chunk in chunks:
+                    writer.write(chunk)
+                    yield chunk
+
+    def get_json(self, url):
+        """Returns the JSON document designated by url"""
+
+        return json.loads(b''.join(self._iter_chunks(url)))
+
+    def get_category_count(self, url):
+        """Returns the number of products of the category designated by
+        url"""
+
+        return int(self.get_json(url + '.json').get('count', 0))
+
+    def _get_page_url(self, url, page):
+        # Returns the url of the page (from 1) of the category of url
+        return "{}/{}.json".format(url, page)
+
+    def get_random_products(self, url, nb_prod):
+        """Returns nb_prod random products of the category designated by
+        url. Only the pages containing them are downloaded (offline, they
+        are selected in the cached pages)"""
+
+        nb_products = self.get_category_count(url)
+        positions = range(nb_products)
+        if self.offline:
+            # Positions of the products of the cached pages
+            cached_pages = {
+                page for page in range(1, nb_products // PRODUCTS_PER_PAGE + 2)
+                if self.cache.contains(self._get_page_url(url, page))
+            }
+            positions = [
+                position for position in positions
+                if position // PRODUCTS_PER_PAGE + 1 in cached_pages
+            ]
+
+        # Categories are downloaded concurrently: each one has its own
+        # generator, so that the selection doesn't depend on their order
+        generator = random
+        if self.seed is not None:
+            generator = random.Random('{}:{}'.format(self.seed, url))
+        positions = generator.sample(
+            positions, min(nb_prod, len(positions)))
+
+        # Positions of the selected products by page (pages start at 1)
+        pages = {}
+        for position in positions:
+            page, index = divmod(position, PRODUCTS_PER_PAGE)
+            pages.setdefault(page + 1, []).append(index)
+
+        products = []
+        for page, indexes in sorted(pages.items()):
+            page_products = self.get_json(
+                self._get_page_url(url, page)).get('products', [])
+            for index in indexes:
+                # Counts and pages may differ while the category changes
+                if index < len(page_products):
+                    products.append(page_products[index])
+
+        return products
+
+    def get_changed_products(self, url, since=None):
+        """Returns the products of the category designated by url modified
+        after since (last_modified_t), the most recently modified first"""
+
+        # Pages are sorted by modification, so they are read until the
+        # first product not modified since (all pages if since is None)
+        products = []
+        page = 1
+        while True:
+            page_products = self.get_json(
+                "{}/{}.json?sort_by=last_modified_t".format(url, page)
+            ).get('products', [])
+            for product in page_products:
+                if (since is not None and
+                        product.get('last_modified_t', 0) <= since):
+                    return products
+                products.append(product)
+
+            if len(page_products) < PRODUCTS_PER_PAGE:
+                return products
+            page += 1
+
+    def iter_json_items(self, url, key):
+        """Yields the items of the key array of the JSON document designated
+        by url, parsed while it is downloaded"""
+
+        decoder = codecs.getincrementaldecoder('utf-8')()
+        chunks = (decoder.decode(chunk) for chunk in self._iter_chunks(url))
+        yield from iter_json_array(chunks, key)
+        # Reads the end of the document, so that the response is cached
+        for chunk in chunks:
+            pass
+
+
+def get_client(pool_size=4, cached=True, offline=False, seed=None):
+    """
+    Returns an OpenFoodFactsClient using the HTTP cache of the settings
+    (OFF_CACHE_DIR, OFF_CACHE_MAX_SIZE), unless cached is False or the
+    cache directory isn't set
+    """
+    cache = None
+    if (cached or offline) and settings.OFF_CACHE_DIR:
+        cache = HttpCache(settings.OFF_CACHE_DIR, settings.OFF_CACHE_MAX_SIZE)
+    return OpenFoodFactsClient(
+        pool_size=pool_size, cache=cache, offline=offline, seed=seed)
+
+
+def iter_json_array(chunks, key):
+    """
+    Yields the items of the first array named key in a JSON document read
+    by chunks (str), without loading the whole document. Only the current
+    item is kept in memory
+    """
+    decoder = json.JSONDecoder()
+    marker = '"{}"'.format(key)
+    buffer = ''
+    chunks = iter(chunks)
+
+    # Skips the document until the opening bracket of the array
+    while True:
+        index = buffer.find(marker)
+        start = buffer.find('[', index) if index != -1 else -1
+        if start != -1:
+            buffer = buffer[start + 1:]
+            break
+        if index == -1:
+            # Keeps the end, the marker may be split between two chunks
+            buffer = buffer[-len(marker):]
+        chunk = next(chunks, None)
+        if chunk is None:
+            return
+        buffer += chunk
+
+    while True:
+        buffer = buffer.lstrip(' \t\r\n,')
+        if buffer.startswith(']'):
+            return
+        try:
+            item, end = decoder.raw_decode(buffer)
+        except ValueError:
+            # The item is incomplete, reads the next chunk
+            chunk = next(chunks, None)
+            if chunk is None:
+                raise ValueError('Truncated JSON document')
+            buffer += chunk
+            continue
+        yield item
+        buffer = buffer[end:]
+
+
+def reservoir_sample(items, size):
+    """
+    Returns size random items of the iterable items (all of them if there
+    are fewer). Items are read once and only size of them are kept in memory
+    (reservoir sampling)
+    """
+    sample = []
+    for index, item in enumerate(items):
+        if index < size:
+            sample.append(item)
+        else:
+            # The item replaces one of the sample with probability
+            # size / (index + 1)
+            position = random.randrange(index + 1)
+            if position < size:
+                sample[position] = item
+    return sample
@@ -0,0 +1,307 @@
+import base64
+import binascii
+import json
+
+from django.core.exceptions import ValidationError
+from django.db import connection
+from django.db.models import Q
+from django.utils.functional import cached_property
+from django.utils.http import urlencode
+
+
+class KeysetPage:
+    """
+    Class used for a page of a KeysetPaginator
+
+    ...
+
+    Attributes
+    ----------
+    object_list : list
+        Objects of the page
+    has_next / has_previous : bool
+        Tells if a next / previous page exists
+    next_cursor / previous_cursor : str
+        Cursors of the next / previous page (None if it doesn't exist)
+    next_query / previous_query : str
+        Querystrings of the next / previous page, made of the request
+        parameters and the page cursor
+    """
+
+    def __init__(self, object_list, next_cursor=None, previous_cursor=None):
+        self.object_list = object_list
+        self.next_cursor = next_cursor
+        self.previous_cursor = previous_cursor
+        self.has_next = next_cursor is not None
+        self.has_previous = previous_cursor is not None
+        self.params = {}
+
+    def __len__(self):
+        return len(self.object_list)
+
+    def __iter__(self):
+        return iter(self.object_list)
+
+    def __getitem__(self, index):
+        return self.object_list[index]
+
+    def set_params(self, request):
+        """Keeps the request parameters (except the cursor) in the pages
+        links"""
+
+        self.params = {
+            key: value for key, value in request.GET.items()
+            if key != 'cursor'
+        }
+
+    def _get_query(self, cursor):
+        # Returns the querystring of the page designated by cursor
+        return urlencode(dict(self.params, cursor=cursor))
+
+    @property
+    def next_query(self):
+        return self._get_query(self.next_cursor)
+
+    @property
+    def previous_query(self):
+        return self._get_query(self.previous_cursor)
+
+
+class KeysetPaginator:
+    """
+    Class used to paginate a queryset by seeking on its ordering keys
+    instead of counting rows and using OFFSET
+
+    The ordering of the queryset must end by a unique key (e.g. 'id' or
+    '-id'). Pages are designated by an opaque cursor made of the keys of
+    the last (or first) object of the previous (or next) page.
+
+    ...
+
+    Methods
+    -------
+    page(cursor)
+        Returns the KeysetPage designated by cursor (first page if cursor
+        is empty or invalid)
+
+    encode_cursor(obj, direction)
+        Returns the cursor of the page following (or preceding) obj
+
+    decode_cursor(cursor)
+        Returns the keys values & direction of cursor (None if invalid)
+
+    clean_cursor(cursor)
+        Returns the canonical form of cursor ('' if it is invalid, as the
+        first page)
+
+    count
+        Exact number of objects or, with estimate=True, the planner
+        estimate (no COUNT(*) is run)
+
+    The first objects of the queryset can be given (e.g. from a cache) with
+    cached, cached_all telling if they are all the objects. Pages contained
+    in them are returned without any query.
+    """
+
+    def __init__(self, queryset, per_page, estimate=False, cached=None,
+                 cached_all=False):
+        self.queryset = queryset
+        self.per_page = per_page
+        self.estimate = estimate
+        self.cached = cached
+        self.cached_all = cached_all
+        # Ordering keys, e.g. ['-rank', '-id']
+        self.keys = list(queryset.query.order_by)
+
+    @staticmethod
+    def _get_value(obj, key):
+        # Returns the value of the key field of obj (model instance or dict)
+        name = key.lstrip('-')
+        return obj[name] if isinstance(obj, dict) else getattr(obj, name)
+
+    def encode_cursor(self, obj, direction):
+        """Returns the cursor of the page following (or preceding) obj"""
+
+        return self._encode(
+            [self._get_value(obj, key) for key in self.keys], direction)
+
+    @staticmethod
+    def _encode(values, direction):
+        # Returns the cursor of the keys values & direction
+        data = {'k': values, 'd': direction}
+        return base64.urlsafe_b64encode(
+            json.dumps(data).encode()).decode()
+
+    def decode_cursor(self, cursor):
+        """Returns the keys values & direction of cursor (None if
+        invalid)"""
+
+        try:
+            data = json.loads(base64.urlsafe_b64decode(cursor.encode()))
+            values, direction = data['k'], data['d']
+        except (binascii.Error, ValueError, TypeError, KeyError):
+            return None
+
+        if (not isinstance(values, list) or len(values) != len(self.keys)
+                or direction not in ('next', 'previous')):
+            return None
+        # Keys values are scalars (their types are checked by page())
+        if not all(isinstance(value, (int, float, str)) for value in values):
+            return None
+        return values, direction
+
+    def _seek(self, decoded):
+        # Returns the queryset of the objects after (or before) the keys
+        # values of decoded, or None if they don't fit the keys types
+        values, direction = decoded
+        try:
+            return self.queryset.filter(
+                self._seek_filter(values, direction == 'previous'))
+        except (TypeError, ValueError, ValidationError):
+            # Values of a tampered cursor
+            return None
+
+    def clean_cursor(self, cursor):
+        """Returns the canonical form of cursor ('' if it is invalid, as
+        the first page)"""
+
+        decoded = self.decode_cursor(cursor) if cursor else None
+        if decoded is None or self._seek(decoded) is None:
+            return ''
+        return self._encode(*decoded)
+
+    def _seek_filter(self, values, reverse):
+        # Returns the Q object selecting rows after values in the ordering
+        # (or before values if reverse is True)
+        seek = Q()
+        for i, key in enumerate(self.keys):
+            name = key.lstrip('-')
+            lookup = 'lt' if key.startswith('-') != reverse else 'gt'
+            condition = Q(**{f'{name}__{lookup}': values[i]})
+            for prev_key, value in zip(self.keys[:i], values[:i]):
+                condition &= Q(**{prev_key.lstrip('-'): value})
+            seek |= condition
+        return seek
+
+    def _make_page(self, objects, has_next, has_previous):
+        # Returns the KeysetPage of objects with its cursors
+        next_cursor = previous_cursor = None
+        if objects and has_next:
+            next_cursor = self.encode_cursor(objects[-1], 'next')
+        if objects and has_previous:
+            previous_cursor = self.encode_cursor(objects[0], 'previous')
+        return KeysetPage(objects, next_cursor, previous_cursor)
+
+    def _cached_page(self, decoded):
+        # Returns the page designated by decoded (keys values & direction)
+        # from the cached objects, or None if they don't contain it
+        if decoded is None:
+            index, direction = -1, 'next'
+        else:
+            values, direction = decoded
+            keys_values = [
+                [self._get_value(obj, key) for key in self.keys]
+                for obj in self.cached
+            ]
+            if values not in keys_values:
+                return None
+            index = keys_values.index(values)
+
+        if direction == 'next':
+            start = index + 1
+            objects = self.cached[start:start + self.per_page + 1]
+            if len(objects) <= self.per_page and not self.cached_all:
+                return None
+            return self._make_page(
+                objects[:self.per_page],
+                has_next=len(objects) > self.per_page,
+                has_previous=start > 0)
+
+        start = max(0, index - self.per_page)
+        return self._make_page(
+            self.cached[start:index], has_next=True, has_previous=start > 0)
+
+    def page(self, cursor=None):
+        """Returns the KeysetPage designated by cursor (first page if
+        cursor is empty or invalid)"""
+
+        decoded = self.decode_cursor(cursor) if cursor else None
+        if self.cached is not None:
+            page = self._cached_page(decoded)
+            if page is not None:
+                return page
+
+        if decoded is not None:
+            values, direction = decoded
+            seek = self._seek(decoded)
+            if seek is None:
+                decoded = None
+
+        if decoded is None:
+            objects = list(self.queryset[:self.per_page + 1])
+            return self._make_page(
+                objects[:self.per_page],
+                has_next=len(objects) > self.per_page,
+                has_previous=False)
+
+        if direction == 'next':
+            objects = list(seek[:self.per_page + 1])
+            return self._make_page(
+                objects[:self.per_page],
+                has_next=len(objects) > self.per_page,
+                has_previous=True)
+
+        # Previous page: reads backwards from values then restores order
+        reversed_keys = [
+            key[1:] if key.startswith('-') else '-' + key
+            for key in self.keys
+        ]
+        objects = list(
+            seek.order_by(*reversed_keys)[:self.per_page + 1])
+        has_previous = len(objects) > self.per_page
+        objects = objects[:self.per_page][::-1]
+        return self._make_page(
+            objects, has_next=True, has_previous=has_previous)
+
+    @cached_property
+    def count(self):
+        """Exact number of objects or, with estimate=True, the planner
+        estimate (no COUNT(*) is run)"""
+
+        if not self.estimate:
+            return self.queryset.count()
+        return estimate_count(self.queryset)
+
+
+def estimate_count(queryset):
+    """
+    Returns the estimated number of rows of queryset: the table statistics
+    (pg_class.reltuples) for a whole table, the planner estimate otherwise
+    """
+    with connection.cursor() as cursor:
+        if not queryset.query.where:
+            cursor.execute(
+                "SELECT reltuples::bigint FROM pg_class "
+                "WHERE oid = %s::regclass",
+                [queryset.model._meta.db_table])
+            row = cursor.fetchone()
+            # reltuples is -1 (or 0) until the table has been analyzed
+            if row and row[0] > 0:
+                return row[0]
+
+        sql, params = queryset.query.sql_with_params()
+        cursor.execute('EXPLAIN (FORMAT JSON) ' + sql, params)
+        plan = cursor.fetchone()[0]
+
+    return plan[0]['Plan']['Plan Rows']
+
+
+def get_page(queryset, request, per_page, **kwargs):
+    """
+    Returns the KeysetPage of queryset designated by the 'cursor' parameter
+    of request. Other request parameters are kept by the pages links
+    """
+    paginator = KeysetPaginator(queryset, per_page, **kwargs)
+    page = paginator.page(request.GET.get('cursor'))
+    page.set_params(request)
+    return page
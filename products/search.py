@@ -0,0 +1,115 @@
+from django.contrib.postgres.search import (
+    SearchQuery, SearchRank, SearchVector, TrigramSimilarity
+)
+from django.db.models import (
+    BooleanField, Exists, ExpressionWrapper, FloatField, Func, OuterRef, Q,
+    TextField
+)
+from django.db.models.functions import Cast, Greatest
+
+from .favorites import get_user_favorites
+from .models import (
+    Category, Favorite, Product, ProductCategory, get_grade
+)
+
+
+# Text search configuration used to rank products
+SEARCH_CONFIG = 'french'
+
+
+class Unaccent(Func):
+    """
+    Lower-cased and unaccented text, computed by the immutable
+    products_unaccent() function used by the trigram indexes
+    """
+    function = 'products_unaccent'
+    output_field = TextField()
+
+
+def _search_in_field(field, query):
+    """
+    Returns products whose field contains query, ranked by relevance
+    """
+    vector = SearchVector(Unaccent(field), config=SEARCH_CONFIG)
+    search_query = SearchQuery(query, config=SEARCH_CONFIG)
+
+    # LIKE '%query%' on the same expression as the trigram index
+    return Product.objects.annotate(
+        search_text=Unaccent(field),
+        # double precision rank, compared as is by keyset pagination
+        rank=Cast(SearchRank(vector, search_query), FloatField()),
+    ).filter(search_text__contains=query).order_by('-rank', '-id')
+
+
+def search_products(query, search_filter):
+    """
+    Returns products matching query (lower-cased and without accents)
+    according to search_filter
+    """
+    if search_filter in ('product', 'brand'):
+        field = 'name' if search_filter == 'product' else 'brand'
+        return _search_in_field(field, query)
+
+    if search_filter == 'category':
+        categories = Category.objects.annotate(
+            search_text=Unaccent('name')
+        ).filter(search_text__contains=query)
+        links = ProductCategory.objects.filter(
+            category__in=categories).values('product')
+        return Product.objects.filter(pk__in=links).order_by('-id')
+
+    if search_filter == 'barcode':
+        return Product.objects.filter(
+            barcode__contains=query).order_by('-id')
+
+    if search_filter == 'score':
+        grade = get_grade(query)
+        if grade is None:
+            # Not a nutriscore letter (grade=None would select the products
+            # without grade)
+            return Product.objects.none()
+        return Product.objects.filter(grade=grade).order_by('-id')
+
+    return Product.objects.none()
+
+
+def _annotate_favorite_match(favorites, query):
+    """
+    Returns favorites annotated with the unaccented name & brand of their
+    product and whether one of its categories contains query
+    """
+    categories = ProductCategory.objects.annotate(
+        search_text=Unaccent('category__name')
+    ).filter(product=OuterRef('products'), search_text__contains=query)
+
+    return favorites.annotate(
+        name_text=Unaccent('products__name'),
+        brand_text=Unaccent('products__brand'),
+        in_categories=Exists(categories),
+    )
+
+
+def search_favorites(user, query):
+    """
+    Returns the favorites of user whose product name, brand or categories
+    contain query (lower-cased and without accents), ranked by similarity,
+    or all its favorites if none does. A single query selects them:
+    matched tells which case it is
+    """
+    match = (
+        Q(name_text__contains=query) | Q(brand_text__contains=query) |
+        Q(in_categories=True)
+    )
+    # Computed once by the database (it doesn't depend on the row)
+    any_match = Exists(_annotate_favorite_match(
+        Favorite.objects.filter(users_id=user.id), query).filter(match))
+
+    return _annotate_favorite_match(get_user_favorites(user), query).annotate(
+        matched=ExpressionWrapper(match, output_field=BooleanField()),
+        any_match=any_match,
+        # double precision rank, compared as is by keyset pagination
+        rank=Cast(Greatest(
+            TrigramSimilarity('name_text', query),
+            TrigramSimilarity('brand_text', query),
+        ), FloatField()),
+    ).filter(Q(matched=True) | Q(any_match=False)).order_by('-rank', '-id')
@@ -0,0 +1,38 @@
+from django.db.models import OuterRef, Subquery
+from django.db.models.signals import m2m_changed, post_delete, post_save
+from django.dispatch import receiver
+
+from .cache import write_through_favorite_ids
+from .models import Favorite, Product, ProductCategory
+
+
+@receiver(m2m_changed, sender=ProductCategory)
+def set_links_grade(sender, instance, action, reverse, pk_set, **kwargs):
+    """
+    Copies the products grade on their new links with categories
+    """
+    if action != 'post_add' or not pk_set:
+        return
+
+    if reverse:
+        # Products added from a category
+        ProductCategory.objects.filter(
+            category=instance, product_id__in=pk_set
+        ).update(grade=Subquery(
+            Product.objects.filter(pk=OuterRef('product_id')).values('grade')
+        ))
+    else:
+        # Categories added from a product
+        ProductCategory.objects.filter(
+            product=instance, category_id__in=pk_set
+        ).update(grade=instance.grade)
+
+
+@receiver(post_save, sender=Favorite)
+@receiver(post_delete, sender=Favorite)
+def update_favorites_cache(sender, instance, **kwargs):
+    """
+    Writes through the cache the favorites of the user of a saved or
+    deleted favorite, once the change is committed
+    """
+    write_through_favorite_ids(instance.users_id)
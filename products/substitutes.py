@@ -0,0 +1,114 @@
+from django.db import connection, transaction
+from django.utils import timezone
+
+from .models import Product, ProductCategory, Substitute
+
+
+# Number of substitutes stored in the index for each product. The result
+# page randomly displays some of them, so the pool only needs to be large
+# enough to keep the selection varied.
+SUBSTITUTES_POOL_SIZE = 60
+
+# Number of products indexed by statement by the commands
+INDEX_BATCH_SIZE = 500
+
+# Indexes, in a single statement, the substitutes of the products whose ids
+# are given. Candidates of a product are the products sharing at least one
+# category with it and having the same or a better grade (deduplicated,
+# source product excluded); they are read by range scans on the (category,
+# grade, product) index of the links. Instead of sorting all candidates by
+# random(), the pool is sampled in the database with a keyed random offset:
+# a random pivot is drawn between the smallest and greatest candidate ids
+# and the pool is read from the pivot, wrapping around to the smallest ids.
+INDEX_SUBSTITUTES_SQL = """
+    INSERT INTO products_substitute (product_id, substitute_id)
+    SELECT src.id, sub.id
+    FROM products_product src
+    CROSS JOIN LATERAL (
+        WITH candidates AS (
+            SELECT DISTINCT pc.product_id AS id
+            FROM products_product_categories src_pc
+            JOIN products_product_categories pc
+                ON pc.category_id = src_pc.category_id
+                AND pc.grade <= src_pc.grade
+            WHERE src_pc.product_id = src.id
+                AND pc.product_id <> src.id
+        ), pivot AS (
+            SELECT min(id) + floor(random() * (max(id) - min(id) + 1)) AS id
+            FROM candidates
+        )
+        (SELECT id FROM candidates
+            WHERE id >= (SELECT id FROM pivot) ORDER BY id LIMIT %(size)s)
+        UNION ALL
+        (SELECT id FROM candidates
+            WHERE id < (SELECT id FROM pivot) ORDER BY id LIMIT %(size)s)
+        LIMIT %(size)s
+    ) sub
+    WHERE src.id = ANY(%(ids)s)
+"""
+
+
+def refresh_substitutes(product_ids):
+    """
+    (Re)builds the substitutes index of the products designated by
+    product_ids, marks them as indexed and returns the number of indexed
+    substitutes
+    """
+    product_ids = list(product_ids)
+
+    with transaction.atomic():
+        Substitute.objects.filter(product_id__in=product_ids).delete()
+        with connection.cursor() as cursor:
+            cursor.execute(INDEX_SUBSTITUTES_SQL, {
+                'size': SUBSTITUTES_POOL_SIZE,
+                'ids': product_ids,
+            })
+            nb_rows = cursor.rowcount
+        # Not a change of the products (their modification date is kept)
+        Product.objects.filter(id__in=product_ids).update(
+            substitutes_indexed_at=timezone.now())
+
+    return nb_rows
+
+
+def get_related_product_ids(product_ids):
+    """
+    Returns the ids of the products designated by product_ids, of the
+    products sharing a category with them and of the products having them
+    in their pool, whose substitutes may change with them
+    """
+    product_ids = set(product_ids)
+    categories = ProductCategory.objects.filter(
+        product_id__in=product_ids).values('category_id')
+    related_ids = set(ProductCategory.objects.filter(
+        category_id__in=categories).values_list('product_id', flat=True))
+    related_ids.update(Substitute.objects.filter(
+        substitute_id__in=product_ids).values_list('product_id', flat=True))
+    return product_ids | related_ids
+
+
+def refresh_related_substitutes(product_ids, batch_size=INDEX_BATCH_SIZE):
+    """
+    Rebuilds, by batches of batch_size products, the substitutes index of
+    the products designated by product_ids and of their related products
+    (get_related_product_ids). Returns the number of indexed substitutes
+    """
+    product_ids = sorted(get_related_product_ids(product_ids))
+
+    nb_rows = 0
+    for i in range(0, len(product_ids), batch_size):
+        nb_rows += refresh_substitutes(product_ids[i:i + batch_size])
+
+    return nb_rows
+
+
+def get_substitutes(product, nb_sub=6):
+    """
+    Returns nb_sub random substitutes of product from the substitutes index.
+    The index of product is built first if it isn't indexed yet
+    """
+    if product.substitutes_indexed_at is None:
+        refresh_substitutes([product.id])
+
+    return list(Product.objects.filter(
+        substitute_for__product=product).order_by('?')[:nb_sub])
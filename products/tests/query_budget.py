@@ -0,0 +1,74 @@
+from django.core.cache import cache
+from django.db import connection
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+
+
+class QueryBudgetMixin:
+    """
+    Mixin of the test cases pinning the number of queries of the views
+
+    ...
+
+    Methods
+    -------
+    get(name, user=None, query=None, **kwargs)
+        Returns the GET request of user of the view designated by name
+
+    capture_queries(user, method, url, **extra)
+        Sends the request of user (anonymous if None) & returns its response
+        and its queries
+
+    assertQueryBudget(budget, requests, warm_up=True, cold=False)
+        Asserts that each request runs at most budget queries, and that
+        they all run the same number of queries
+    """
+
+    def get(self, name, user=None, query=None, **kwargs):
+        """Returns the GET request of user of the view designated by name
+        (kwargs being its arguments and query its query string)"""
+
+        url = reverse(name, kwargs=kwargs)
+        if query:
+            url += '?' + query
+        return (user, 'get', url, {'HTTP_REFERER': '/'})
+
+    def capture_queries(self, user, method, url, **extra):
+        """Sends the request of user (anonymous if None) & returns its
+        response and its queries"""
+
+        self.client.logout()
+        if user is not None:
+            self.client.force_login(user)
+
+        with CaptureQueriesContext(connection) as queries:
+            response = getattr(self.client, method)(url, **extra)
+        return response, queries.captured_queries
+
+    def assertQueryBudget(self, budget, requests, warm_up=True, cold=False):
+        """Asserts that each request (user, method, url, extra) runs at
+        most budget queries, and that they all run the same number of
+        queries: the requests differ by the size of their data, which must
+        not change the count. With warm_up, each request is sent once
+        before (caches filled). With cold, the cache is cleared before each
+        request (caches missed)"""
+
+        counts = {}
+        for user, method, url, extra in requests:
+            label = '{} ({})'.format(url, user or 'anonymous')
+            if cold:
+                cache.clear()
+            elif warm_up:
+                self.capture_queries(user, method, url, **extra)
+            response, queries = self.capture_queries(
+                user, method, url, **extra)
+            self.assertLess(response.status_code, 400, label)
+
+            if len(queries) > budget:
+                self.fail("{} ran {} queries (budget {}):\n{}".format(
+                    label, len(queries), budget,
+                    '\n'.join(query['sql'] for query in queries)))
+            counts[label] = len(queries)
+
+        if len(set(counts.values())) > 1:
+            self.fail(f"Queries count depends on data size: {counts}")
@@ -0,0 +1,218 @@
+import json
+
+from io import StringIO
+
+from django.contrib.auth.models import User
+from django.core import management
+from django.core.cache import cache
+from django.db import connections
+from django.test import TestCase, TransactionTestCase
+from django.urls import reverse
+
+from products.models import Category, Favorite, Product
+
+
+def create_products(nb_products, category):
+    # Creates nb_products products of category & returns them
+    products = []
+    for pnum in range(nb_products):
+        product = Product.objects.create(
+            name=f'Pâtes {pnum}',
+            brand=f'Brand {pnum}',
+            score='abcde'[pnum % 5],
+            barcode=f'12345678910{pnum}',
+            url_img_small=f'https://www.off.com/cat/prod/img_small{pnum}',
+            url_img=f'https://www.off.com/cat/prod/img{pnum}',
+            url_off=f'https://www.off.com/cat/prod/{pnum}',
+            url_img_nutrition=f'https://www.off.com/cat/prod/img_nt{pnum}',
+        )
+        product.categories.add(category)
+        products.append(product)
+    return products
+
+
+class ApiTestCase(TestCase):
+    """
+    JSON API test case
+    """
+
+    @classmethod
+    def setUpTestData(cls):
+        # Setup objects used for test methods
+        category = Category.objects.create(
+            name='Pâtes', json_id='fr:pates', url='https://www.off.com/cat')
+        cls.products = create_products(25, category)
+        cls.user = User.objects.create_user('test_user', password='Apass_0404')
+        for product in cls.products[:3]:
+            Favorite.objects.create(products=product, users=cls.user)
+
+    @classmethod
+    def tearDownClass(cls):
+        # Call super to close connections and remove data from the database
+        super().tearDownClass()
+        # Delete the test database
+        management.call_command('flush', verbosity=0, interactive=False)
+        # Disconnect from the test database
+        connections['default'].close()
+
+    def setUp(self):
+        cache.clear()
+
+    def get_json(self, name, params=None, status=200, **kwargs):
+        # Returns the JSON content of the API response
+        response = self.client.get(reverse(name, kwargs=kwargs), params)
+        self.assertEqual(response.status_code, status)
+        self.assertEqual(response['Content-Type'], 'application/json')
+        return json.loads(response.content)
+
+    def test_search_pages(self):
+        """
+        Test that search results are paginated by cursor without overlap
+        """
+        params = {'search': 'Pates', 'search_filter': 'product'}
+        first = self.get_json('api_search', params)
+        self.assertEqual(len(first['results']), 20)
+        self.assertIsNone(first['previous'])
+
+        second = self.get_json(
+            'api_search', dict(params, cursor=first['next']))
+        self.assertEqual(len(second['results']), 5)
+        self.assertIsNone(second['next'])
+        self.assertCountEqual(
+            [row['id'] for row in first['results'] + second['results']],
+            [product.id for product in self.products])
+
+    def test_search_field_selection(self):
+        """
+        Test that only the selected fields (and the id) are returned, read
+        in one query
+        """
+        with self.assertNumQueries(1):
+            data = self.get_json('api_search', {
+                'search': 'pates', 'search_filter': 'product',
+                'fields': 'name,barcode', 'page_size': 5,
+            })
+        self.assertEqual(len(data['results']), 5)
+        self.assertEqual(
+            set(data['results'][0]), {'id', 'name', 'barcode'})
+
+    def test_search_errors(self):
+        """
+        Test that invalid searches & unknown fields return 400
+        """
+        data = self.get_json(
+            'api_search', {'search': 'p', 'search_filter': 'product'},
+            status=400)
+        self.assertIn('search', data['error'])
+        data = self.get_json('api_search', {
+            'search': 'pates', 'search_filter': 'product',
+            'fields': 'name,password',
+        }, status=400)
+        self.assertEqual(data['error'], 'Unknown fields: password')
+
+    def test_search_unknown_filter(self):
+        """
+        Test that a search_filter outside the form choices returns 400
+        """
+        data = self.get_json(
+            'api_search', {'search': 'pates', 'search_filter': 'bogus'},
+            status=400)
+        self.assertIn('search_filter', data['error'])
+
+    def test_search_stream(self):
+        """
+        Test that all the search results are streamed with stream=1
+        """
+        response = self.client.get(reverse('api_search'), {
+            'search': 'pates', 'search_filter': 'product', 'stream': 1,
+        })
+        self.assertTrue(response.streaming)
+        data = json.loads(b''.join(response.streaming_content))
+        self.assertEqual(len(data['results']), 25)
+        self.assertEqual(
+            set(data['results'][0]), {'id', 'name', 'brand', 'score',
+                                      'url_img'})
+
+    def test_detail_conditional_request(self):
+        """
+        Test that a product is returned with an ETag and that the same
+        ETag in If-None-Match returns 304 without content
+        """
+        url = reverse('api_detail', kwargs={'product_id': self.products[0].id})
+        response = self.client.get(url, {'fields': 'name,description'})
+        self.assertEqual(json.loads(response.content), {
+            'id': self.products[0].id,
+            'name': 'Pâtes 0',
+            'description': 'Aucune description disponible...',
+        })
+
+        response = self.client.get(
+            url, {'fields': 'name,description'},
+            HTTP_IF_NONE_MATCH=response['ETag'])
+        self.assertEqual(response.status_code, 304)
+        self.assertEqual(response.content, b'')
+
+        response = self.client.get(url, HTTP_IF_NONE_MATCH=response['ETag'])
+        self.assertEqual(response.status_code, 200)
+
+    def test_detail_unknown_product(self):
+        """
+        Test that an unknown product returns 404 and POST returns 405
+        """
+        self.get_json('api_detail', status=404, product_id=0)
+        response = self.client.post(
+            reverse('api_detail', kwargs={'product_id': self.products[0].id}))
+        self.assertEqual(response.status_code, 405)
+
+    def test_substitutes(self):
+        """
+        Test that substitutes have the same or a better grade, best first
+        """
+        product = self.products[2]
+        data = self.get_json(
+            'api_substitutes', {'limit': 50, 'fields': 'score'},
+            product_id=product.id)
+        scores = [row['score'] for row in data['results']]
+        self.assertEqual(len(scores), 14)
+        self.assertEqual(scores, sorted(scores))
+        self.assertTrue(all(score <= 'c' for score in scores))
+
+        self.get_json('api_substitutes', status=404, product_id=0)
+
+    def test_favorites(self):
+        """
+        Test that favorites require a logged-in user and are returned most
+        recent first, buffered or streamed
+        """
+        data = self.get_json('api_favorites', status=401)
+        self.assertEqual(data['error'], 'Authentication required')
+
+        self.client.force_login(self.user)
+        expected = [product.id for product in self.products[2::-1]]
+        data = self.get_json('api_favorites', {'fields': 'id'})
+        self.assertEqual([row['id'] for row in data['results']], expected)
+
+        response = self.client.get(reverse('api_favorites'), {'stream': 1})
+        data = json.loads(b''.join(response.streaming_content))
+        self.assertEqual([row['id'] for row in data['results']], expected)
+
+
+class BenchApiTestCase(TransactionTestCase):
+    """
+    bench_api command test case (the requests are sent by other threads)
+    """
+
+    def test_bench_api(self):
+        """
+        Test that the HTML pages & the API are requested without error
+        """
+        category = Category.objects.create(
+            name='Pâtes', json_id='fr:pates', url='https://www.off.com/cat')
+        create_products(5, category)
+
+        out, err = StringIO(), StringIO()
+        management.call_command(
+            'bench_api', requests=4, concurrency=2, stdout=out, stderr=err)
+        self.assertEqual(err.getvalue(), '')
+        for name in ('search', 'detail', 'substitutes'):
+            self.assertIn(name, out.getvalue())
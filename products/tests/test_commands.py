@@ -0,0 +1,718 @@
+import gzip
+import hashlib
+import json
+import os
+import tempfile
+import threading
+
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from io import StringIO
+from unittest import mock
+from urllib.parse import parse_qs, urlsplit
+
+from django.core import management
+from django.db import connections
+from django.db.models import F
+from django.test import TestCase, override_settings
+
+from products.models import Category, Product, ProductCategory, Substitute
+from products.httpcache import HttpCache
+from products.openfoodfacts import (
+    NotCachedError, OpenFoodFactsClient, PRODUCTS_PER_PAGE, iter_json_array,
+    reservoir_sample
+)
+from products.substitutes import refresh_substitutes
+
+
+# Number of products of each category served by the fake OpenFoodFacts
+FAKE_CATEGORIES = {
+    'category-a': 45,
+    'category-b': 8,
+}
+
+# Tags of the categories document served by the fake OpenFoodFacts
+FAKE_TAGS = [
+    {'id': f'{lang}:category-{num}', 'name': f'Category {num}',
+     'products': num * 50, 'url': f'https://fr.off.org/categorie/{num}'}
+    for num in range(6) for lang in ('fr', 'en')
+]
+
+
+def make_fake_product(category, position):
+    # Returns a viable product of the fake OpenFoodFacts
+    code = f'{category}-{position}'
+    return {
+        'product_name': f'Product {code}',
+        'brands': 'Brand',
+        'ingredients_text': 'Ingredients',
+        'nutriscore_grade': 'abcde'[position % 5],
+        'code': code,
+        'categories_tags': [f'fr:{category}'],
+        'image_url': f'https://www.off.com/{code}/img',
+        'image_small_url': f'https://www.off.com/{code}/img_small',
+        'url': f'https://www.off.com/{code}',
+        'image_nutrition_url': f'https://www.off.com/{code}/img_nt',
+        'last_modified_t': 1000 + position,
+    }
+
+
+class FakeOpenFoodFactsHandler(BaseHTTPRequestHandler):
+    # Serves /categorie/<name>.json (count) and /categorie/<name>/<page>.json
+
+    def do_GET(self):
+        server = self.server
+        with server.lock:
+            server.paths.append(self.path)
+            failures = server.failures.get(self.path, 0)
+            if failures:
+                server.failures[self.path] = failures - 1
+
+        url = urlsplit(self.path)
+        if url.path == '/categories.json':
+            return self.send_json({'count': len(FAKE_TAGS), 'tags': FAKE_TAGS})
+
+        path = url.path.strip('/')
+        if path.endswith('.json'):
+            path = path[:-len('.json')]
+        parts = path.split('/')
+        if failures:
+            return self.send_error(503)
+        if len(parts) < 2 or parts[1] not in FAKE_CATEGORIES:
+            return self.send_error(404)
+
+        count = FAKE_CATEGORIES[parts[1]]
+        if len(parts) == 2:
+            data = {'count': count}
+        else:
+            products = []
+            for position in range(count):
+                product = make_fake_product(parts[1], position)
+                product.update(server.changes.get(product['code'], {}))
+                products.append(product)
+            if parse_qs(url.query).get('sort_by') == ['last_modified_t']:
+                products.sort(
+                    key=lambda product: product['last_modified_t'],
+                    reverse=True)
+            start = (int(parts[2]) - 1) * PRODUCTS_PER_PAGE
+            data = {'products': products[start:start + PRODUCTS_PER_PAGE]}
+        self.send_json(data)
+
+    def send_json(self, data):
+        body = json.dumps(data).encode()
+        etag = '"{}"'.format(hashlib.md5(body).hexdigest())
+        if self.headers.get('If-None-Match') == etag:
+            self.server.not_modified += 1
+            self.send_response(304)
+            self.end_headers()
+            return
+
+        self.send_response(200)
+        self.send_header('ETag', etag)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, *args):
+        pass
+
+
+class FakeOpenFoodFactsMixin:
+    # Starts a fake OpenFoodFacts server for the test case
+
+    @classmethod
+    def setUpClass(cls):
+        cls.server = ThreadingHTTPServer(
+            ('127.0.0.1', 0), FakeOpenFoodFactsHandler)
+        cls.server.lock = threading.Lock()
+        cls.server.paths = []
+        cls.server.failures = {}
+        cls.server.changes = {}
+        cls.server.not_modified = 0
+        cls.root_url = 'http://127.0.0.1:{}/'.format(cls.server.server_port)
+        cls.base_url = cls.root_url + 'categorie/'
+        thread = threading.Thread(target=cls.server.serve_forever)
+        thread.daemon = True
+        thread.start()
+        super().setUpClass()
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.server.shutdown()
+        cls.server.server_close()
+        super().tearDownClass()
+
+    def setUp(self):
+        self.server.paths.clear()
+        self.server.failures.clear()
+        self.server.changes.clear()
+        self.server.not_modified = 0
+
+
+class OpenFoodFactsClientTestCase(FakeOpenFoodFactsMixin, TestCase):
+    """
+    OpenFoodFacts client test case
+    """
+
+    def test_random_products_only_downloads_needed_pages(self):
+        """
+        Test that random products are distinct and that only the count and
+        the pages containing them are downloaded
+        """
+        client = OpenFoodFactsClient()
+        products = client.get_random_products(
+            self.base_url + 'category-a', 5)
+        codes = [product['code'] for product in products]
+        self.assertEqual(len(set(codes)), 5)
+
+        pages = {
+            int(code.split('-')[-1]) // PRODUCTS_PER_PAGE + 1
+            for code in codes
+        }
+        self.assertEqual(
+            sorted(self.server.paths),
+            sorted(['/categorie/category-a.json'] + [
+                f'/categorie/category-a/{page}.json' for page in pages]))
+
+    def test_small_category_returns_all_products(self):
+        """
+        Test that a category smaller than nb_prod returns all its products
+        """
+        client = OpenFoodFactsClient()
+        products = client.get_random_products(
+            self.base_url + 'category-b', 20)
+        self.assertEqual(len(products), 8)
+
+    def test_seeded_clients_select_the_same_products(self):
+        """
+        Test that clients with the same seed select the same products
+        """
+        url = self.base_url + 'category-a'
+        codes = [
+            [product['code']
+             for product in OpenFoodFactsClient(seed=4).get_random_products(
+                 url, 5)]
+            for i in range(2)
+        ]
+        self.assertEqual(len(set(codes[0])), 5)
+        self.assertEqual(codes[0], codes[1])
+
+    def test_server_errors_are_retried(self):
+        """
+        Test that a request failing with a server error is retried
+        """
+        self.server.failures['/categorie/category-b.json'] = 2
+        client = OpenFoodFactsClient(backoff=0)
+        self.assertEqual(
+            client.get_category_count(self.base_url + 'category-b'), 8)
+        self.assertEqual(
+            self.server.paths.count('/categorie/category-b.json'), 3)
+
+    def test_streamed_array_items(self):
+        """
+        Test that items of a JSON array are the same whatever the size of
+        the chunks the document is read by
+        """
+        document = json.dumps({'count': len(FAKE_TAGS), 'tags': FAKE_TAGS})
+        for size in (1, 7, len(document)):
+            chunks = (
+                document[i:i + size] for i in range(0, len(document), size)
+            )
+            self.assertEqual(list(iter_json_array(chunks, 'tags')), FAKE_TAGS)
+
+        client = OpenFoodFactsClient()
+        self.assertEqual(
+            list(client.iter_json_items(
+                self.root_url + 'categories.json', 'tags')),
+            FAKE_TAGS)
+
+    def test_reservoir_sample_is_uniform(self):
+        """
+        Test that reservoir sampling returns distinct items, each item
+        being selected with the same probability
+        """
+        self.assertEqual(sorted(reservoir_sample(range(3), 5)), [0, 1, 2])
+
+        selections = [0] * 10
+        for i in range(2000):
+            sample = reservoir_sample(iter(range(10)), 2)
+            self.assertEqual(len(set(sample)), 2)
+            for item in sample:
+                selections[item] += 1
+        # Each item is expected 400 times
+        for count in selections:
+            self.assertTrue(300 < count < 500, selections)
+
+
+class HttpCacheTestCase(FakeOpenFoodFactsMixin, TestCase):
+    """
+    OpenFoodFacts responses cache test case
+    """
+
+    def setUp(self):
+        super().setUp()
+        tmp_dir = tempfile.TemporaryDirectory()
+        self.addCleanup(tmp_dir.cleanup)
+        self.cache_dir = tmp_dir.name
+
+    def test_cached_responses_are_revalidated(self):
+        """
+        Test that a cached response is revalidated by a conditional request
+        and read from the cache when it isn't modified
+        """
+        client = OpenFoodFactsClient(
+            cache=HttpCache(self.cache_dir, 10 ** 6))
+        url = self.base_url + 'category-b/1.json'
+        first = client.get_json(url)
+        self.assertEqual(client.get_json(url), first)
+        self.assertEqual(self.server.not_modified, 1)
+
+        self.server.changes['category-b-0'] = {'product_name': 'New name'}
+        self.assertEqual(
+            client.get_json(url)['products'][0]['product_name'], 'New name')
+        self.assertEqual(self.server.not_modified, 1)
+
+    def test_offline_client_only_reads_the_cache(self):
+        """
+        Test that an offline client makes no request and fails on responses
+        missing from the cache
+        """
+        cache = HttpCache(self.cache_dir, 10 ** 6)
+        url = self.root_url + 'categories.json'
+        tags = list(OpenFoodFactsClient(cache=cache).iter_json_items(
+            url, 'tags'))
+        self.server.paths.clear()
+
+        client = OpenFoodFactsClient(cache=cache, offline=True)
+        self.assertEqual(list(client.iter_json_items(url, 'tags')), tags)
+        with self.assertRaises(NotCachedError):
+            client.get_json(self.base_url + 'category-b.json')
+        self.assertEqual(self.server.paths, [])
+
+    def test_least_recently_used_responses_are_evicted(self):
+        """
+        Test that the least recently used responses are removed when the
+        cache exceeds its maximum size
+        """
+        cache = HttpCache(self.cache_dir, 25)
+        for mtime, name in enumerate(('first', 'second')):
+            with cache.writer(name, {}) as writer:
+                writer.write(b'0123456789')
+            os.utime(cache._path(name), (mtime, mtime))
+        # 'first' is used, 'second' becomes the least recently used
+        self.assertIsNotNone(cache.get('first'))
+        with cache.writer('third', {}) as writer:
+            writer.write(b'0123456789')
+
+        self.assertIsNotNone(cache.get('first'))
+        self.assertIsNone(cache.get('second'))
+        self.assertEqual(cache.size, 20)
+        self.assertEqual(b''.join(cache.read_chunks('third')), b'0123456789')
+
+    def test_missing_body_is_a_cache_miss(self):
+        """
+        Test that a metadata file left without its body is removed and the
+        response downloaded again (or missing from the cache offline)
+        """
+        cache = HttpCache(self.cache_dir, 10 ** 6)
+        url = self.base_url + 'category-b/1.json'
+        client = OpenFoodFactsClient(cache=cache)
+        first = client.get_json(url)
+        os.remove(cache._path(url))
+
+        with self.assertRaises(NotCachedError):
+            OpenFoodFactsClient(cache=cache, offline=True).get_json(url)
+        self.assertFalse(cache.contains(url))
+        self.assertEqual(client.get_json(url), first)
+        self.assertEqual(self.server.not_modified, 0)
+        self.assertIsNotNone(cache.get(url))
+
+
+class FillDbProductsTestCase(FakeOpenFoodFactsMixin, TestCase):
+    """
+    fill_db_products command test case
+    """
+
+    @classmethod
+    def setUpTestData(cls):
+        # Setup objects used for test methods
+        for name in list(FAKE_CATEGORIES) + ['category-missing']:
+            Category.objects.create(
+                name=name,
+                json_id=f'fr:{name}',
+                url=cls.base_url + name,
+            )
+
+    @classmethod
+    def tearDownClass(cls):
+        # Call super to close connections and remove data from the database
+        super().tearDownClass()
+        # Delete the test database
+        management.call_command('flush', verbosity=0, interactive=False)
+        # Disconnect from the test database
+        connections['default'].close()
+
+    def setUp(self):
+        super().setUp()
+        tmp_dir = tempfile.TemporaryDirectory()
+        self.addCleanup(tmp_dir.cleanup)
+        self.checkpoint = os.path.join(tmp_dir.name, 'checkpoint.json')
+
+    def call_command(self, *args):
+        management.call_command(
+            'fill_db_products', *args, '--workers', '3',
+            '--checkpoint', self.checkpoint, stdout=StringIO())
+
+    def test_import_saves_and_links_products(self):
+        """
+        Test that products of each reachable category are saved, linked
+        with their category, and that the failed category is left to resume
+        """
+        self.call_command('5')
+        self.assertEqual(
+            Product.objects.filter(categories__json_id='fr:category-a')
+            .count(), 5)
+        self.assertEqual(
+            Product.objects.filter(categories__json_id='fr:category-b')
+            .count(), 5)
+        self.assertEqual(Product.objects.count(), 10)
+        with open(self.checkpoint) as checkpoint:
+            self.assertEqual(
+                json.load(checkpoint),
+                [self.base_url + 'category-a', self.base_url + 'category-b'])
+
+    def test_import_resumes_from_checkpoint(self):
+        """
+        Test that categories saved in the checkpoint are not downloaded
+        again
+        """
+        with open(self.checkpoint, 'w') as checkpoint:
+            json.dump([self.base_url + 'category-a'], checkpoint)
+
+        self.call_command('5')
+        self.assertFalse(any(
+            'category-a' in path for path in self.server.paths))
+        self.assertEqual(Product.objects.count(), 5)
+
+    def test_restart_ignores_checkpoint(self):
+        """
+        Test that the --restart option ignores the checkpoint
+        """
+        with open(self.checkpoint, 'w') as checkpoint:
+            json.dump([self.base_url + 'category-a'], checkpoint)
+
+        self.call_command('5', '--restart')
+        self.assertEqual(Product.objects.count(), 10)
+
+    def test_bulk_import_saves_and_links_products(self):
+        """
+        Test that the bulk import saves the same products & links as the
+        import product by product
+        """
+        self.call_command('5', '--bulk', '--batch-size', '3')
+        self.assertEqual(
+            Product.objects.filter(categories__json_id='fr:category-a')
+            .count(), 5)
+        self.assertEqual(
+            Product.objects.filter(categories__json_id='fr:category-b')
+            .count(), 5)
+        self.assertEqual(Product.objects.count(), 10)
+        self.assertFalse(Product.objects.filter(grade=None).exists())
+
+    def test_import_refreshes_substitutes_of_categories(self):
+        """
+        Test that the products already in the categories of the imported
+        products get them as substitutes
+        """
+        product = Product.objects.create(
+            name='Existing', score='e', barcode='123456789100',
+            url_img_small='https://www.off.com/prod/img_small',
+            url_img='https://www.off.com/prod/img',
+            url_off='https://www.off.com/prod/',
+            url_img_nutrition='https://www.off.com/prod/img_nt',
+        )
+        product.categories.add(Category.objects.get(json_id='fr:category-a'))
+        self.assertEqual(refresh_substitutes([product.id]), 0)
+
+        self.call_command('5')
+        self.assertEqual(
+            Substitute.objects.filter(product=product).count(), 5)
+
+    def test_offline_import_selects_products_of_cached_pages(self):
+        """
+        Test that the offline mode selects random products in the cached
+        pages of each category, without request
+        """
+        tmp_dir = tempfile.TemporaryDirectory()
+        self.addCleanup(tmp_dir.cleanup)
+        with override_settings(OFF_CACHE_DIR=tmp_dir.name):
+            # Caches a single page of category-a
+            self.call_command('1')
+            Product.objects.all().delete()
+            self.server.paths.clear()
+            self.call_command('5', '--offline', '--restart')
+
+        self.assertEqual(self.server.paths, [])
+        self.assertEqual(
+            Product.objects.filter(categories__json_id='fr:category-a')
+            .count(), 5)
+        self.assertEqual(
+            Product.objects.filter(categories__json_id='fr:category-b')
+            .count(), 5)
+
+    def test_import_sets_mark_of_new_categories(self):
+        """
+        Test that categories imported for the first time get a
+        synchronization mark
+        """
+        self.call_command('5')
+        self.assertEqual(
+            Category.objects.filter(last_modified_t__isnull=False).count(), 2)
+
+    def test_sync_updates_changed_products_only(self):
+        """
+        Test that the synchronization downloads the products changed since
+        the mark and only updates those whose fields changed
+        """
+        self.call_command('45')
+        Category.objects.update(last_modified_t=1044)
+        # Products 44 & 43 are changed since the mark, the fields of product
+        # 43 are the same, product 42 is changed before the mark
+        self.server.changes['category-a-44'] = {
+            'nutriscore_grade': 'a', 'last_modified_t': 3000}
+        self.server.changes['category-a-43'] = {'last_modified_t': 2000}
+        self.server.changes['category-a-42'] = {'nutriscore_grade': 'a'}
+        self.server.paths.clear()
+
+        out = StringIO()
+        management.call_command(
+            'fill_db_products', '--sync', stdout=out)
+        self.assertIn('2 products downloaded, 1 updated', out.getvalue())
+        product = Product.objects.get(barcode='category-a-44')
+        self.assertEqual((product.score, product.grade), ('a', 1))
+        self.assertEqual(
+            product.productcategory_set.get().grade, 1)
+        self.assertEqual(
+            Product.objects.get(barcode='category-a-42').score, 'c')
+        self.assertEqual(
+            Category.objects.get(json_id='fr:category-a').last_modified_t,
+            3000)
+        # Only the first page of the category is downloaded
+        self.assertIn(
+            '/categorie/category-a/1.json?sort_by=last_modified_t',
+            self.server.paths)
+        self.assertNotIn(
+            '/categorie/category-a/2.json?sort_by=last_modified_t',
+            self.server.paths)
+
+    def test_sync_refreshes_substitutes_of_regraded_products(self):
+        """
+        Test that a product whose grade gets worse is removed from the pools
+        of the products with a better grade
+        """
+        self.call_command('45')
+        product = Product.objects.get(barcode='category-a-0')
+        regraded = Product.objects.get(barcode='category-a-40')
+        refresh_substitutes(Product.objects.values_list('id', flat=True))
+        self.assertTrue(Substitute.objects.filter(
+            product=product, substitute=regraded).exists())
+
+        Category.objects.update(last_modified_t=1044)
+        self.server.changes['category-a-40'] = {
+            'nutriscore_grade': 'e', 'last_modified_t': 3000}
+        management.call_command(
+            'fill_db_products', '--sync', stdout=StringIO())
+        self.assertFalse(Substitute.objects.filter(
+            product=product, substitute=regraded).exists())
+        self.assertFalse(Substitute.objects.filter(
+            substitute__grade__gt=F('product__grade')).exists())
+
+
+class FillDbCategoriesTestCase(FakeOpenFoodFactsMixin, TestCase):
+    """
+    fill_db_categories command test case
+    """
+
+    @classmethod
+    def tearDownClass(cls):
+        # Call super to close connections and remove data from the database
+        super().tearDownClass()
+        # Delete the test database
+        management.call_command('flush', verbosity=0, interactive=False)
+        # Disconnect from the test database
+        connections['default'].close()
+
+    def test_streamed_categories_are_filtered_by_tag_count(self):
+        """
+        Test that the streaming mode adds french categories of at least 100
+        products, with a single request
+        """
+        with mock.patch(
+                'products.management.commands.fill_db_categories.URL',
+                self.root_url):
+            management.call_command(
+                'fill_db_categories', '10', '--stream', stdout=StringIO())
+
+        self.assertEqual(
+            sorted(Category.objects.values_list('json_id', flat=True)),
+            [f'fr:category-{num}' for num in range(2, 6)])
+        self.assertEqual(self.server.paths, ['/categories.json'])
+
+    def call_command(self, *args):
+        out = StringIO()
+        with mock.patch(
+                'products.management.commands.fill_db_categories.URL',
+                self.root_url):
+            management.call_command(
+                'fill_db_categories', '10', '--stream', *args, stdout=out)
+        return out.getvalue()
+
+    def test_streamed_selection_of_random_categories(self):
+        """
+        Test that the streaming mode selects the requested number of
+        distinct categories among the filtered ones
+        """
+        with mock.patch(
+                'products.management.commands.fill_db_categories.URL',
+                self.root_url):
+            management.call_command(
+                'fill_db_categories', '2', '--stream', stdout=StringIO())
+
+        json_ids = set(Category.objects.values_list('json_id', flat=True))
+        self.assertEqual(len(json_ids), 2)
+        self.assertTrue(json_ids <= {
+            f'fr:category-{num}' for num in range(2, 6)})
+
+    def test_existing_categories_are_not_added_again(self):
+        """
+        Test that categories already in database are skipped
+        """
+        Category.objects.create(
+            name='Category 2', json_id='fr:category-2', url='https://off/2')
+        out = self.call_command()
+        self.assertIn('Adding 3 categories', out)
+        self.assertEqual(Category.objects.count(), 4)
+        self.assertEqual(
+            Category.objects.get(json_id='fr:category-2').url, 'https://off/2')
+
+    def test_dry_run_adds_nothing(self):
+        """
+        Test that the dry run mode lists the new categories without adding
+        them
+        """
+        out = self.call_command('--dry-run')
+        self.assertIn('4 categories would be added (dry run)', out)
+        self.assertIn('Comparison with database', out)
+        self.assertFalse(Category.objects.exists())
+
+    def test_offline_run_reads_the_cache(self):
+        """
+        Test that the offline mode adds the categories from the cached
+        responses, without request
+        """
+        tmp_dir = tempfile.TemporaryDirectory()
+        self.addCleanup(tmp_dir.cleanup)
+        with override_settings(OFF_CACHE_DIR=tmp_dir.name):
+            self.call_command('--dry-run')
+            self.server.paths.clear()
+            out = self.call_command('--offline')
+
+        self.assertIn('Adding 4 categories', out)
+        self.assertEqual(self.server.paths, [])
+
+
+class LoadOffDumpTestCase(TestCase):
+    """
+    load_off_dump command test case
+    """
+
+    @classmethod
+    def tearDownClass(cls):
+        # Call super to close connections and remove data from the database
+        super().tearDownClass()
+        # Delete the test database
+        management.call_command('flush', verbosity=0, interactive=False)
+        # Disconnect from the test database
+        connections['default'].close()
+
+    def setUp(self):
+        tmp_dir = tempfile.TemporaryDirectory()
+        self.addCleanup(tmp_dir.cleanup)
+        self.tmp_dir = tmp_dir.name
+        # Products of 'fr:category-a' (3), 'fr:category-b' (1) and
+        # 'en:category-c' (3), one of them not viable, one with an unknown
+        # nutriscore
+        self.products = [
+            make_fake_product('category-a', position) for position in range(3)
+        ]
+        self.products[0]['categories_tags'].append('fr:category-b')
+        for product in self.products:
+            product['categories_tags'].append('en:category-c')
+        del self.products[1]['image_url']
+        self.products.append(make_fake_product('category-a', 3))
+        self.products[-1]['nutriscore_grade'] = 'unknown'
+
+    def write_dump(self, name, products):
+        # Writes products in a gzipped CSV or JSONL export & returns its path
+        path = os.path.join(self.tmp_dir, name)
+        with gzip.open(path, 'wt', encoding='utf-8', newline='') as dump:
+            if '.jsonl' in name:
+                for product in products:
+                    dump.write(json.dumps(product) + '\n')
+            else:
+                columns = sorted(make_fake_product('category-a', 0))
+                dump.write('\t'.join(columns) + '\n')
+                for product in products:
+                    dump.write('\t'.join(
+                        ','.join(product[column])
+                        if column == 'categories_tags'
+                        else str(product.get(column, ''))
+                        for column in columns
+                    ) + '\n')
+        return path
+
+    def load_dump(self, path):
+        management.call_command(
+            'load_off_dump', path, '--min-products', '2', stdout=StringIO())
+
+    def test_csv_and_jsonl_exports_load_the_same_catalogue(self):
+        """
+        Test that viable products, french categories of at least 2 products
+        and their links are loaded from both export formats
+        """
+        for name in ('products.csv.gz', 'products.jsonl.gz'):
+            self.load_dump(self.write_dump(name, self.products))
+            self.assertEqual(
+                sorted(Product.objects.values_list('barcode', 'grade')),
+                [('category-a-0', 1), ('category-a-2', 3)])
+            self.assertEqual(
+                list(Category.objects.values_list('name', 'json_id', 'url')),
+                [('Category a', 'fr:category-a',
+                  'https://fr.openfoodfacts.org/categorie/category-a')])
+            self.assertEqual(
+                sorted(ProductCategory.objects.values_list(
+                    'product__barcode', 'grade')),
+                [('category-a-0', 1), ('category-a-2', 3)])
+            Product.objects.all().delete()
+            Category.objects.all().delete()
+
+    def test_reload_updates_changed_products(self):
+        """
+        Test that loading an export again updates the changed products and
+        the grade of their links
+        """
+        self.load_dump(self.write_dump('first.jsonl.gz', self.products))
+        self.products[0]['nutriscore_grade'] = 'e'
+        self.products[2]['product_name'] = 'New name'
+        out = StringIO()
+        management.call_command(
+            'load_off_dump', self.write_dump('second.jsonl.gz', self.products),
+            '--min-products', '2', stdout=out)
+
+        self.assertIn('0 products added, 2 updated', out.getvalue())
+        self.assertEqual(
+            sorted(Product.objects.values_list('name', 'grade')),
+            [('New name', 3), ('Product category-a-0', 5)])
+        self.assertEqual(
+            ProductCategory.objects.get(product__barcode='category-a-0').grade,
+            5)
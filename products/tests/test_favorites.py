@@ -0,0 +1,361 @@
+import threading
+
+from unittest import mock
+
+from django.contrib.auth.models import User
+from django.core import management
+from django.core.cache import cache
+from django.db import connection, connections
+from django.test import TestCase, TransactionTestCase
+from django.urls import reverse
+
+from products.cache import (
+    clear_cache_stats, get_cache_stats, get_favorite_ids,
+    get_favorites_version
+)
+from products.favorites import add_favorites
+from products.models import Category, Favorite, Product
+from products.search import search_favorites
+
+
+def create_products(nb_products):
+    # Creates nb_products products & returns them
+    return [
+        Product.objects.create(
+            name=f'Product {pnum}',
+            brand=f'Brand {pnum}',
+            score='B',
+            barcode=f'12345678910{pnum}',
+            url_img_small=f'https://www.off.com/cat/prod/img_small{pnum}',
+            url_img=f'https://www.off.com/cat/prod/img{pnum}',
+            url_off=f'https://www.off.com/cat/prod/{pnum}',
+            url_img_nutrition=f'https://www.off.com/cat/prod/img_nt{pnum}',
+        )
+        for pnum in range(nb_products)
+    ]
+
+
+class FavoritesCacheTestCase(TestCase):
+    """
+    Cached favorites test case
+    """
+
+    @classmethod
+    def setUpTestData(cls):
+        # Setup objects used for test methods
+        cls.products = create_products(3)
+        cls.user = User.objects.create_user('test_user', password='Apass_0404')
+
+    @classmethod
+    def tearDownClass(cls):
+        # Call super to close connections and remove data from the database
+        super().tearDownClass()
+        # Delete the test database
+        management.call_command('flush', verbosity=0, interactive=False)
+        # Disconnect from the test database
+        connections['default'].close()
+
+    def setUp(self):
+        cache.clear()
+        clear_cache_stats()
+        self.client.force_login(self.user)
+
+    def test_favorites_are_read_once(self):
+        """
+        Test that favorites are read from the database on the first access
+        only, and that hits & misses are counted
+        """
+        with self.assertNumQueries(1):
+            self.assertEqual(get_favorite_ids(self.user.id), set())
+        with self.assertNumQueries(0):
+            self.assertEqual(get_favorite_ids(self.user.id), set())
+
+        stats = get_cache_stats('favorites')
+        self.assertEqual((stats['hits'], stats['misses']), (1, 1))
+        self.assertEqual(stats['ratio'], 0.5)
+
+    def test_cached_favorites_read_writes_nothing(self):
+        """
+        Test that reading the cached favorites doesn't write in the cache
+        """
+        get_favorite_ids(self.user.id)
+        with mock.patch.object(cache, 'set') as cache_set, \
+                mock.patch.object(cache, 'incr') as cache_incr, \
+                mock.patch.object(cache, 'add') as cache_add:
+            self.assertEqual(get_favorite_ids(self.user.id), set())
+        self.assertFalse(cache_set.called or cache_incr.called or
+                         cache_add.called)
+
+    def test_pages_ignore_stale_cached_favorites(self):
+        """
+        Test that the favorites pages read the favorites from the database
+        even if the cached favorites are empty (e.g. cached by another
+        process before an addition)
+        """
+        Favorite.objects.create(products=self.products[0], users=self.user)
+        cache.set(
+            f'favorites:{self.user.id}', set(),
+            version=get_favorites_version(self.user.id))
+        self.assertEqual(get_favorite_ids(self.user.id), set())
+
+        response = self.client.get(reverse('favorites'))
+        self.assertEqual(len(response.context['favorites']), 1)
+        response = self.client.get(
+            reverse('search_fav'), {'user_search': 'product'})
+        self.assertEqual(len(response.context['fav_filtered']), 1)
+
+
+class AddFavoritesTestCase(TestCase):
+    """
+    Favorites addition test case
+    """
+
+    @classmethod
+    def setUpTestData(cls):
+        # Setup objects used for test methods
+        cls.products = create_products(3)
+        cls.user = User.objects.create_user('test_user', password='Apass_0404')
+
+    @classmethod
+    def tearDownClass(cls):
+        # Call super to close connections and remove data from the database
+        super().tearDownClass()
+        # Delete the test database
+        management.call_command('flush', verbosity=0, interactive=False)
+        # Disconnect from the test database
+        connections['default'].close()
+
+    def setUp(self):
+        cache.clear()
+        self.client.force_login(self.user)
+
+    def test_add_favorites_in_one_query(self):
+        """
+        Test that favorites are added in one query, without error nor
+        duplicate when added twice
+        """
+        product_ids = [product.id for product in self.products]
+        with self.assertNumQueries(1):
+            self.assertEqual(
+                add_favorites(self.user, product_ids), set(product_ids))
+        with self.assertNumQueries(1):
+            self.assertEqual(add_favorites(self.user, product_ids), set())
+        self.assertEqual(Favorite.objects.count(), 3)
+
+    def test_add_fav_twice(self):
+        """
+        Test that a product added twice to favorites is saved once
+        """
+        url = reverse('add_fav', kwargs={'product_id': self.products[0].id})
+        for i in range(2):
+            response = self.client.get(url, HTTP_REFERER='/')
+            self.assertEqual(response.status_code, 302)
+        self.assertEqual(Favorite.objects.count(), 1)
+
+    def test_add_fav_unknown_product(self):
+        """
+        Test that adding an unknown product returns 404
+        """
+        response = self.client.get(
+            reverse('add_fav', kwargs={'product_id': 0}), HTTP_REFERER='/')
+        self.assertEqual(response.status_code, 404)
+        self.assertFalse(Favorite.objects.exists())
+
+    def test_add_favs(self):
+        """
+        Test that several products are added to favorites by one request,
+        unknown products being ignored
+        """
+        with self.assertLogs('purbeurre.favorites', 'INFO') as logs:
+            response = self.client.post(reverse('add_favs'), {
+                'product_id': [self.products[0].id, self.products[2].id, 0],
+            }, HTTP_REFERER='/products/1/')
+        self.assertIn('2 produit(s) ajouté(s)', logs.output[0])
+        self.assertRedirects(
+            response, '/products/1/', fetch_redirect_response=False)
+        self.assertEqual(
+            set(Favorite.objects.values_list('products_id', flat=True)),
+            {self.products[0].id, self.products[2].id})
+
+    def test_add_favs_invalid(self):
+        """
+        Test that the multiple addition refuses GET & invalid ids
+        """
+        self.assertEqual(
+            self.client.get(reverse('add_favs')).status_code, 405)
+        response = self.client.post(
+            reverse('add_favs'), {'product_id': 'abc'})
+        self.assertEqual(response.status_code, 400)
+
+
+class SearchFavoritesTestCase(TestCase):
+    """
+    Search in favorites test case
+    """
+
+    @classmethod
+    def setUpTestData(cls):
+        # Setup objects used for test methods
+        cls.user = User.objects.create_user('test_user', password='Apass_0404')
+        *cls.products, other_product = create_products(5)
+        for product, (name, brand) in zip(cls.products, (
+                ('Pâtes complètes', 'Panzani'),
+                ('Pâtes', 'Barilla'),
+                ('Riz basmati', 'Taureau ailé'),
+                ('Chocolat noir', 'Côte d\'Or'))):
+            product.name, product.brand = name, brand
+            product.save()
+            Favorite.objects.create(products=product, users=cls.user)
+        category = Category.objects.create(
+            name='Féculents', json_id='fr:feculents', url='https://off.fr')
+        category.products.add(cls.products[2])
+        # Product of another user
+        other = User.objects.create_user('other', password='Apass_0404')
+        Favorite.objects.create(products=other_product, users=other)
+
+    @classmethod
+    def tearDownClass(cls):
+        # Call super to close connections and remove data from the database
+        super().tearDownClass()
+        # Delete the test database
+        management.call_command('flush', verbosity=0, interactive=False)
+        # Disconnect from the test database
+        connections['default'].close()
+
+    def search(self, query):
+        # Returns the products of the favorites found by query & if they
+        # match it (one query)
+        with self.assertNumQueries(1):
+            favorites = list(search_favorites(self.user, query))
+        return (
+            [favorite.products for favorite in favorites],
+            {favorite.matched for favorite in favorites},
+        )
+
+    def test_search_is_accent_insensitive_and_ranked(self):
+        """
+        Test that favorites are found without accents & ranked by
+        similarity with the query
+        """
+        products, matched = self.search('pates')
+        self.assertEqual(products, self.products[1::-1])
+        self.assertEqual(matched, {True})
+
+    def test_search_by_brand_and_category(self):
+        """
+        Test that favorites are found by brand & by category
+        """
+        self.assertEqual(self.search('cote')[0], [self.products[3]])
+        self.assertEqual(self.search('feculent')[0], [self.products[2]])
+
+    def test_search_without_match_returns_all_favorites(self):
+        """
+        Test that all the favorites of the user (only) are returned when
+        none matches the query
+        """
+        products, matched = self.search('product')
+        self.assertCountEqual(products, self.products)
+        self.assertEqual(matched, {False})
+
+    def test_search_in_fav_view(self):
+        """
+        Test that the search in favorites page tells if favorites match
+        """
+        self.client.force_login(self.user)
+        response = self.client.get(reverse('search_fav') + '?user_search=Riz')
+        self.assertTrue(response.context['is_result'])
+        self.assertEqual(len(response.context['fav_filtered']), 1)
+
+        response = self.client.get(reverse('search_fav') + '?user_search=xyz')
+        self.assertFalse(response.context['is_result'])
+        self.assertEqual(len(response.context['fav_filtered']), 4)
+
+
+class FavoritesWriteThroughTestCase(TransactionTestCase):
+    """
+    Cached favorites write-through test case (changes are committed)
+    """
+
+    def setUp(self):
+        cache.clear()
+        self.products = create_products(8)
+        self.user = User.objects.create_user(
+            'test_user', password='Apass_0404')
+        self.client.force_login(self.user)
+
+    def test_add_and_remove_write_through(self):
+        """
+        Test that adding & removing favorites update the cached favorites
+        """
+        product = self.products[0]
+        self.assertEqual(get_favorite_ids(self.user.id), set())
+
+        self.client.get(
+            reverse('add_fav', kwargs={'product_id': product.id}),
+            HTTP_REFERER='/')
+        with self.assertNumQueries(0):
+            self.assertEqual(get_favorite_ids(self.user.id), {product.id})
+
+        favorite = Favorite.objects.get(products=product)
+        with self.assertLogs('purbeurre.favorites', 'INFO') as logs:
+            self.client.get(
+                reverse('del_fav', kwargs={'favorite_id': favorite.id}),
+                HTTP_REFERER='/')
+        self.assertIn('a été supprimé des favoris', logs.output[0])
+        with self.assertNumQueries(0):
+            self.assertEqual(get_favorite_ids(self.user.id), set())
+
+    def test_add_favs_write_through(self):
+        """
+        Test that adding several favorites at once updates the cached
+        favorites
+        """
+        self.assertEqual(get_favorite_ids(self.user.id), set())
+        product_ids = {product.id for product in self.products[:3]}
+
+        self.client.post(
+            reverse('add_favs'), {'product_id': list(product_ids)},
+            HTTP_REFERER='/')
+        with self.assertNumQueries(0):
+            self.assertEqual(get_favorite_ids(self.user.id), product_ids)
+
+    def test_concurrent_changes_leave_no_stale_cache(self):
+        """
+        Test that concurrent additions, removals & reads of favorites leave
+        the cached favorites equal to the database
+        """
+        products, user = self.products, self.user
+        barrier = threading.Barrier(len(products) * 2)
+
+        def add_then_remove(product, remove):
+            barrier.wait()
+            try:
+                favorite = Favorite.objects.create(
+                    products=product, users=user)
+                get_favorite_ids(user.id)
+                if remove:
+                    favorite.delete()
+            finally:
+                connection.close()
+
+        def read():
+            barrier.wait()
+            try:
+                for i in range(5):
+                    get_favorite_ids(user.id)
+            finally:
+                connection.close()
+
+        threads = [
+            threading.Thread(target=add_then_remove, args=(product, num % 2))
+            for num, product in enumerate(products)
+        ] + [threading.Thread(target=read) for product in products]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        self.assertEqual(
+            get_favorite_ids(user.id),
+            set(Favorite.objects.values_list('products_id', flat=True)))
+        self.assertEqual(len(get_favorite_ids(user.id)), 4)
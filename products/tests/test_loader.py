@@ -0,0 +1,105 @@
+from django.core import management
+from django.db import connections
+from django.test import TestCase
+
+from products.loader import bulk_load_products, sync_products
+from products.models import Category, Product, ProductCategory
+
+
+def make_product_data(pnum, score='b', categories=('fr:category',)):
+    # Returns the data of a product as given to bulk_load_products
+    return {
+        'name': f'Product {pnum}',
+        'brand': f'Brand {pnum}',
+        'description': 'Description',
+        'score': score,
+        'barcode': f'12345678910{pnum}',
+        'categories': list(categories),
+        'url_img_small': f'https://www.off.com/cat/prod/img_small{pnum}',
+        'url_img': f'https://www.off.com/cat/prod/img{pnum}',
+        'url_off': f'https://www.off.com/cat/prod/{pnum}',
+        'url_img_nutrition': f'https://www.off.com/cat/prod/img_nt{pnum}',
+    }
+
+
+class BulkLoadProductsTestCase(TestCase):
+    """
+    Bulk loader of products test case
+    """
+
+    @classmethod
+    def setUpTestData(cls):
+        # Setup objects used for test methods
+        cls.category = Category.objects.create(
+            name='Category',
+            json_id='fr:category',
+            url='https://www.openfoodfacts.com/category',
+        )
+        cls.other_category = Category.objects.create(
+            name='Other category',
+            json_id='fr:other-category',
+            url='https://www.openfoodfacts.com/other-category',
+        )
+
+    @classmethod
+    def tearDownClass(cls):
+        # Call super to close connections and remove data from the database
+        super().tearDownClass()
+        # Delete the test database
+        management.call_command('flush', verbosity=0, interactive=False)
+        # Disconnect from the test database
+        connections['default'].close()
+
+    def test_products_are_saved_with_links_and_grades(self):
+        """
+        Test that products are saved with their grade and linked with the
+        known categories only
+        """
+        products_data = [
+            make_product_data(pnum, score) for pnum, score in
+            enumerate('abcde')
+        ]
+        products_data.append(make_product_data(
+            5, 'c', ['fr:category', 'fr:other-category', 'fr:unknown']))
+
+        new_products_id, nb_links = bulk_load_products(
+            products_data, batch_size=4)
+        self.assertEqual(len(new_products_id), 6)
+        self.assertEqual(nb_links, 7)
+        self.assertEqual(
+            sorted(Product.objects.values_list('grade', flat=True)),
+            [1, 2, 3, 3, 4, 5])
+        self.assertEqual(self.other_category.products.get().name, 'Product 5')
+        self.assertFalse(ProductCategory.objects.filter(grade=None).exists())
+
+    def test_existing_and_duplicated_barcodes_are_ignored(self):
+        """
+        Test that products already in database or repeated in the data are
+        saved once
+        """
+        bulk_load_products([make_product_data(0)])
+        new_products_id, nb_links = bulk_load_products(
+            [make_product_data(pnum) for pnum in (0, 1, 1, 2)])
+        self.assertEqual(len(new_products_id), 2)
+        self.assertEqual(nb_links, 2)
+        self.assertEqual(Product.objects.count(), 3)
+        self.assertEqual(self.category.products.count(), 3)
+
+    def test_sync_sets_modification_date_of_changed_products(self):
+        """
+        Test that synchronized products get a new modification date, and
+        unchanged products keep theirs
+        """
+        bulk_load_products([make_product_data(pnum) for pnum in range(2)])
+        dates = dict(Product.objects.values_list('barcode', 'updated_at'))
+
+        changed = make_product_data(0, score='a')
+        updated_ids, regraded_ids = sync_products(
+            [changed, make_product_data(1)])
+        self.assertEqual(len(updated_ids), 1)
+
+        new_dates = dict(Product.objects.values_list('barcode', 'updated_at'))
+        unchanged = make_product_data(1)['barcode']
+        self.assertGreater(
+            new_dates[changed['barcode']], dates[changed['barcode']])
+        self.assertEqual(new_dates[unchanged], dates[unchanged])
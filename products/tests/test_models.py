@@ -2,7 +2,7 @@ from django.core import management
 from django.db import connections
 from django.test import TestCase
 
-from products.models import Category, Product, Favorite
+from products.models import Category, Product, ProductCategory, Favorite
 
 
 class CategoryModelTest(TestCase):
@@ -122,6 +122,34 @@ class ProductModelTest(TestCase):
         max_length = product._meta.get_field('score').max_length
         self.assertEquals(max_length, 1)
 
+    def test_grade_is_derived_from_score(self):
+        """
+        Test Product ordinal grade follows the nutriscore letter
+        """
+        product = Product.objects.get(id=1)
+        self.assertEqual(product.grade, 3)
+        product.score = 'a'
+        product.save()
+        self.assertEqual(Product.objects.get(id=1).grade, 1)
+
+    def test_grade_is_copied_on_categories_links(self):
+        """
+        Test Product grade is copied on its links with categories
+        """
+        product = Product.objects.get(id=1)
+        category = Category.objects.create(
+            name='Poissons',
+            json_id='fr:poissons',
+            url='https://www.openfoodfacts.com/poissons'
+        )
+        product.categories.add(category)
+        link = ProductCategory.objects.get(product=product)
+        self.assertEqual(link.grade, 3)
+        product.score = 'E'
+        product.save()
+        link.refresh_from_db()
+        self.assertEqual(link.grade, 5)
+
     def test_barcode_max_length(self):
         """
         Test Product barcode max length
@@ -0,0 +1,150 @@
+import base64
+import json
+
+from django.core import management
+from django.db import connections
+from django.db.models import ExpressionWrapper, F, IntegerField
+from django.test import TestCase
+
+from products.models import Product
+from products.pagination import KeysetPaginator, estimate_count
+
+
+class KeysetPaginatorTestCase(TestCase):
+    """
+    Keyset paginator test case
+    """
+
+    @classmethod
+    def setUpTestData(cls):
+        # Setup objects used for test methods
+        for pnum in range(20):
+            Product.objects.create(
+                name=f'Product {pnum}',
+                brand=f'Brand {pnum}',
+                score='B',
+                barcode=f'12345678910{pnum}',
+                url_img_small=f'https://www.off.com/cat/prod/img_small{pnum}',
+                url_img=f'https://www.off.com/cat/prod/img{pnum}',
+                url_off=f'https://www.off.com/cat/prod/{pnum}',
+                url_img_nutrition=f'https://www.off.com/cat/prod/img_nt{pnum}',
+            )
+
+    @classmethod
+    def tearDownClass(cls):
+        # Call super to close connections and remove data from the database
+        super().tearDownClass()
+        # Delete the test database
+        management.call_command('flush', verbosity=0, interactive=False)
+        # Disconnect from the test database
+        connections['default'].close()
+
+    def walk_pages(self, queryset):
+        # Returns the ids of all the pages, following the next cursors
+        paginator = KeysetPaginator(queryset, 6)
+        page = paginator.page()
+        pages = [[prod.id for prod in page]]
+        while page.has_next:
+            page = paginator.page(page.next_cursor)
+            pages.append([prod.id for prod in page])
+        return paginator, page, pages
+
+    def test_next_pages_cover_all_products(self):
+        """
+        Test that following next cursors returns each product once
+        """
+        queryset = Product.objects.order_by('-id')
+        paginator, page, pages = self.walk_pages(queryset)
+        self.assertEqual([len(ids) for ids in pages], [6, 6, 6, 2])
+        self.assertEqual(
+            sum(pages, []),
+            list(queryset.values_list('id', flat=True)))
+
+    def test_previous_page_returns_same_products(self):
+        """
+        Test that the previous cursor returns the previous page
+        """
+        paginator, page, pages = self.walk_pages(
+            Product.objects.order_by('id'))
+        page = paginator.page(page.previous_cursor)
+        self.assertEqual([prod.id for prod in page], pages[-2])
+        self.assertTrue(page.has_next)
+        self.assertTrue(page.has_previous)
+
+    def test_pages_with_non_unique_first_key(self):
+        """
+        Test pagination ordered by a non unique key followed by id
+        """
+        queryset = Product.objects.annotate(
+            rank=ExpressionWrapper(F('id') % 3, output_field=IntegerField())
+        ).order_by('-rank', '-id')
+        paginator, page, pages = self.walk_pages(queryset)
+        self.assertEqual(
+            sum(pages, []),
+            list(queryset.values_list('id', flat=True)))
+
+    def test_cached_pages_match_database_pages(self):
+        """
+        Test that pages served from the cached first objects are the same
+        as the pages read from the database
+        """
+        queryset = Product.objects.order_by('id')
+        paginator, page, pages = self.walk_pages(queryset)
+        for cached_all, size in ((False, 8), (True, 20)):
+            cached = list(queryset[:size])
+            paginator = KeysetPaginator(
+                queryset, 6, cached=cached, cached_all=cached_all)
+            page = paginator.page()
+            cached_pages = [[prod.id for prod in page]]
+            while page.has_next:
+                page = paginator.page(page.next_cursor)
+                cached_pages.append([prod.id for prod in page])
+            self.assertEqual(cached_pages, pages)
+            page = paginator.page(page.previous_cursor)
+            self.assertEqual([prod.id for prod in page], pages[-2])
+
+    def test_invalid_cursor_returns_first_page(self):
+        """
+        Test that an invalid cursor returns the first page
+        """
+        paginator = KeysetPaginator(Product.objects.order_by('id'), 6)
+        page = paginator.page('not-a-cursor')
+        self.assertFalse(page.has_previous)
+        self.assertEqual(page[0], Product.objects.order_by('id').first())
+
+    def test_tampered_cursor_returns_first_page(self):
+        """
+        Test that a cursor whose values don't fit the keys types returns
+        the first page
+        """
+        queryset = Product.objects.annotate(
+            rank=ExpressionWrapper(F('id') % 3, output_field=IntegerField())
+        ).order_by('-rank', '-id')
+        paginator = KeysetPaginator(queryset, 6)
+        for values in (['abc', 'x'], [1, {'id': 1}], [[1], 2]):
+            with self.subTest(values=values):
+                cursor = base64.urlsafe_b64encode(json.dumps(
+                    {'k': values, 'd': 'next'}).encode()).decode()
+                page = paginator.page(cursor)
+                self.assertFalse(page.has_previous)
+                self.assertEqual(page[0], queryset.first())
+
+    def test_clean_cursor(self):
+        """
+        Test that a valid cursor is kept and that invalid ones are the
+        first page ('')
+        """
+        paginator = KeysetPaginator(Product.objects.order_by('id'), 6)
+        cursor = paginator.page().next_cursor
+        self.assertEqual(paginator.clean_cursor(cursor), cursor)
+        for invalid in ('', 'not-a-cursor', base64.urlsafe_b64encode(
+                b'{"k": ["abc"], "d": "next"}').decode()):
+            self.assertEqual(paginator.clean_cursor(invalid), '')
+
+    def test_estimated_count(self):
+        """
+        Test the estimated number of products
+        """
+        self.assertGreater(estimate_count(Product.objects.all()), 0)
+        self.assertGreater(
+            estimate_count(Product.objects.filter(grade=2)), 0)
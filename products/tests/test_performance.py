@@ -0,0 +1,119 @@
+import json
+
+from django.contrib.auth.models import User
+from django.core import management
+from django.core.cache import cache
+from django.db import connections
+from django.test import TestCase, override_settings
+from django.urls import reverse
+
+from products.models import Product
+from purbeurre_project.performance import (
+    RequestMetrics, RequestStats, request_stats
+)
+
+
+@override_settings(PERFORMANCE_SAMPLE_RATE=1, PERFORMANCE_SERVER_TIMING=True)
+class PerformanceMiddlewareTestCase(TestCase):
+    """
+    Performance instrumentation test case
+    """
+
+    @classmethod
+    def setUpTestData(cls):
+        # Setup objects used for test methods
+        cls.product = Product.objects.create(
+            name='Product',
+            brand='Brand',
+            score='b',
+            barcode='123456789100',
+            url_img_small='https://www.off.com/cat/prod/img_small',
+            url_img='https://www.off.com/cat/prod/img',
+            url_off='https://www.off.com/cat/prod/',
+            url_img_nutrition='https://www.off.com/cat/prod/img_nt',
+        )
+        cls.staff = User.objects.create_user(
+            'staff', password='Apass_0404', is_staff=True)
+
+    @classmethod
+    def tearDownClass(cls):
+        # Call super to close connections and remove data from the database
+        super().tearDownClass()
+        # Delete the test database
+        management.call_command('flush', verbosity=0, interactive=False)
+        # Disconnect from the test database
+        connections['default'].close()
+
+    def setUp(self):
+        cache.clear()
+        request_stats.clear()
+        self.url = reverse('detail', kwargs={'product_id': self.product.id})
+
+    def test_sampled_request_metrics(self):
+        """
+        Test that the metrics of a sampled request are logged as JSON, sent
+        in a Server-Timing header and kept by view
+        """
+        with self.assertLogs('purbeurre.performance', 'INFO') as logs:
+            response = self.client.get(self.url)
+
+        line = json.loads(logs.records[0].getMessage())
+        self.assertEqual(line['view'], 'detail')
+        self.assertEqual(line['status'], 200)
+        # Product version & product
+        self.assertEqual(line['queries'], 2)
+        self.assertGreater(line['template'], 0)
+        self.assertGreaterEqual(line['total'], line['template'])
+        self.assertEqual(line['size'], len(response.content))
+
+        self.assertIn('db;dur=', response['Server-Timing'])
+        self.assertIn('desc="2 queries"', response['Server-Timing'])
+        self.assertEqual(request_stats.aggregate()['detail']['count'], 1)
+
+    @override_settings(PERFORMANCE_SAMPLE_RATE=0)
+    def test_requests_out_of_sample(self):
+        """
+        Test that requests aren't instrumented without sampling
+        """
+        response = self.client.get(self.url)
+        self.assertNotIn('Server-Timing', response)
+        self.assertEqual(request_stats.aggregate(), {})
+
+    def test_stats_endpoint_is_staff_only(self):
+        """
+        Test that the percentiles are only given to staff members
+        """
+        for i in range(3):
+            self.client.get(self.url)
+
+        response = self.client.get(reverse('performance_stats'))
+        self.assertEqual(response.status_code, 302)
+
+        self.client.force_login(self.staff)
+        stats = self.client.get(reverse('performance_stats')).json()
+        self.assertEqual(stats['sample_rate'], 1)
+        self.assertEqual(stats['views']['detail']['count'], 3)
+        self.assertEqual(
+            set(stats['views']['detail']['total']), {'p50', 'p90', 'p99'})
+
+
+class RequestStatsTestCase(TestCase):
+    """
+    Aggregation of the requests metrics test case
+    """
+
+    def test_percentiles_of_last_requests(self):
+        """
+        Test that percentiles are computed on the window of each view
+        """
+        stats = RequestStats(window=100)
+        for num in range(1, 201):
+            metrics = RequestMetrics()
+            metrics.total = metrics.queries = num
+            stats.add('view', metrics)
+
+        views = stats.aggregate()
+        self.assertEqual(views['view']['count'], 100)
+        self.assertEqual(
+            views['view']['queries'], {'p50': 150, 'p90': 190, 'p99': 199})
+        self.assertNotIn('size', views['view'])
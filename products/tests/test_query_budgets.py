@@ -0,0 +1,291 @@
+from django.contrib.auth.models import User
+from django.core import management
+from django.core.cache import cache
+from django.db import connections
+from django.test import TestCase, TransactionTestCase
+
+from products.models import (
+    Category, Favorite, Product, ProductCategory, get_grade
+)
+from products.tests.query_budget import QueryBudgetMixin
+
+
+# Sizes of the catalogue of the fixture
+NB_CATEGORIES = 50
+NB_PRODUCTS = 5000
+NB_FAVORITES = 200
+
+# Products of the small category (last one), of the 'Rare' brand & named
+# 'Riz': the small results of each search
+NB_RARE_PRODUCTS = 3
+
+# Queries with few & many results of each search filter
+SEARCHES = {
+    'product': ('riz', 'pates'),
+    'brand': ('rare', 'panzani'),
+    'category': ('epices', 'categorie ab'),
+    'barcode': ('3000000000001', '30000'),
+    'score': ('a', 'b'),
+}
+
+
+class QueryBudgetTestCase(QueryBudgetMixin, TestCase):
+    """
+    Queries count of the views test case. Each view is requested with
+    small & large data (results, categories, favorites), which must run the
+    same number of queries, within the budget of the view
+    """
+
+    @classmethod
+    def setUpTestData(cls):
+        # Setup objects used for test methods
+        categories = Category.objects.bulk_create([
+            Category(
+                name=f'Catégorie {code}',
+                json_id=f'fr:categorie-{code}',
+                url=f'https://www.off.com/categorie/{code}',
+            )
+            # Searched names can't contain digits
+            for code in (
+                chr(97 + cnum // 26) + chr(97 + cnum % 26)
+                for cnum in range(NB_CATEGORIES - 1))
+        ] + [
+            Category(
+                name='Épices rares', json_id='fr:epices-rares',
+                url='https://www.off.com/categorie/epices-rares'),
+        ])
+        cls.small_category = categories[-1]
+
+        products = []
+        for pnum in range(NB_PRODUCTS):
+            rare = pnum < NB_RARE_PRODUCTS
+            score = 'abcde'[pnum % 5]
+            products.append(Product(
+                name=f'Riz {pnum}' if rare else f'Pâtes {pnum}',
+                brand='Rare' if rare else 'Panzani',
+                score=score,
+                grade=get_grade(score),
+                barcode=f'3{pnum:012}',
+                url_img_small=f'https://www.off.com/prod/img_small{pnum}',
+                url_img=f'https://www.off.com/prod/img{pnum}',
+                url_off=f'https://www.off.com/prod/{pnum}',
+                url_img_nutrition=f'https://www.off.com/prod/img_nt{pnum}',
+            ))
+        products = Product.objects.bulk_create(products)
+        ProductCategory.objects.bulk_create([
+            ProductCategory(
+                product=product,
+                category=(
+                    cls.small_category if pnum < NB_RARE_PRODUCTS
+                    else categories[pnum % (NB_CATEGORIES - 1)]),
+                grade=product.grade,
+            )
+            for pnum, product in enumerate(products)
+        ])
+        # Rare products (small category) & others (large categories)
+        cls.small_product = products[NB_RARE_PRODUCTS - 1]
+        cls.large_product = products[-1]
+        cls.free_products = products[-3:-1]
+
+        # Users with few & many favorites
+        cls.small_user = User.objects.create_user(
+            'small_user', password='Apass_0404')
+        cls.large_user = User.objects.create_user(
+            'large_user', password='Apass_0404')
+        Favorite.objects.bulk_create([
+            Favorite(products=product, users=cls.small_user)
+            for product in products[:NB_RARE_PRODUCTS]
+        ] + [
+            Favorite(products=product, users=cls.large_user)
+            for product in products[:NB_FAVORITES]
+        ])
+
+    @classmethod
+    def tearDownClass(cls):
+        # Call super to close connections and remove data from the database
+        super().tearDownClass()
+        # Delete the test database
+        management.call_command('flush', verbosity=0, interactive=False)
+        # Disconnect from the test database
+        connections['default'].close()
+
+    def setUp(self):
+        cache.clear()
+
+    def test_index(self):
+        """
+        Test the queries of the index page
+        """
+        self.assertQueryBudget(0, [
+            self.get('index'),
+        ])
+        # Session & user
+        self.assertQueryBudget(2, [
+            self.get('index', self.small_user),
+            self.get('index', self.large_user),
+        ])
+
+    def test_search(self):
+        """
+        Test the queries of the search by each filter, with few & many
+        results
+        """
+        for search_filter, queries in SEARCHES.items():
+            with self.subTest(search_filter=search_filter):
+                # Page of the cached search (or of all products)
+                self.assertQueryBudget(1, [
+                    self.get(
+                        'search',
+                        query=f'search_filter={search_filter}&search={query}')
+                    for query in queries
+                ])
+
+    def test_search_cold(self):
+        """
+        Test the queries of the search by each filter, with few & many
+        results, when the search isn't cached
+        """
+        for search_filter, queries in SEARCHES.items():
+            with self.subTest(search_filter=search_filter):
+                # Existence, page, products of the page & count
+                self.assertQueryBudget(4, [
+                    self.get(
+                        'search',
+                        query=f'search_filter={search_filter}&search={query}')
+                    for query in queries
+                ], cold=True)
+        with self.subTest(search_filter=None):
+            # Existence & first pages of all products
+            self.assertQueryBudget(2, [
+                self.get('search', query='search_filter=product&search=xyz'),
+            ], cold=True)
+
+    def test_result(self):
+        """
+        Test the queries of the result page of a product with few & many
+        substitutes
+        """
+        # Product version, product & substitutes
+        self.assertQueryBudget(3, [
+            self.get('result', product_id=self.small_product.id),
+            self.get('result', product_id=self.large_product.id),
+        ])
+        # And session & user (favorites are cached)
+        self.assertQueryBudget(5, [
+            self.get('result', self.small_user,
+                     product_id=self.small_product.id),
+            self.get('result', self.large_user,
+                     product_id=self.large_product.id),
+        ])
+
+    def test_result_cold(self):
+        """
+        Test the queries of the result page of a product with few & many
+        substitutes, when its substitutes aren't indexed nor the favorites
+        cached
+        """
+        # Product version, product, indexing (deletion, insertion & mark,
+        # in a savepoint of the test transaction) & substitutes
+        Product.objects.update(substitutes_indexed_at=None)
+        self.assertQueryBudget(8, [
+            self.get('result', product_id=self.small_product.id),
+            self.get('result', product_id=self.large_product.id),
+        ], cold=True)
+        # And session, user & favorites
+        Product.objects.update(substitutes_indexed_at=None)
+        self.assertQueryBudget(11, [
+            self.get('result', self.small_user,
+                     product_id=self.small_product.id),
+            self.get('result', self.large_user,
+                     product_id=self.large_product.id),
+        ], cold=True)
+
+    def test_detail(self):
+        """
+        Test the queries of the detail page
+        """
+        # Product version & product
+        self.assertQueryBudget(2, [
+            self.get('detail', product_id=self.small_product.id),
+            self.get('detail', product_id=self.large_product.id),
+        ])
+
+    def test_favorites(self):
+        """
+        Test the queries of the favorites page & of a search in favorites,
+        with few & many favorites
+        """
+        # Session, user & favorites with their products
+        self.assertQueryBudget(3, [
+            self.get('favorites', self.small_user),
+            self.get('favorites', self.large_user),
+        ])
+        for query in ('riz', 'pates', 'xyz'):
+            with self.subTest(query=query):
+                self.assertQueryBudget(3, [
+                    self.get('search_fav', user, query=f'user_search={query}')
+                    for user in (self.small_user, self.large_user)
+                ])
+
+
+class FavoriteChangesBudgetTestCase(QueryBudgetMixin, TransactionTestCase):
+    """
+    Queries count of the changes of favorites test case. Changes are
+    committed, so that the write-through of the cached favorites is counted
+    """
+
+    def setUp(self):
+        cache.clear()
+        products = Product.objects.bulk_create([
+            Product(
+                name=f'Pâtes {pnum}',
+                brand='Panzani',
+                score='b',
+                grade=get_grade('b'),
+                barcode=f'3{pnum:012}',
+                url_img_small=f'https://www.off.com/prod/img_small{pnum}',
+                url_img=f'https://www.off.com/prod/img{pnum}',
+                url_off=f'https://www.off.com/prod/{pnum}',
+                url_img_nutrition=f'https://www.off.com/prod/img_nt{pnum}',
+            )
+            for pnum in range(NB_FAVORITES + 2)
+        ])
+        self.free_products = products[-2:]
+
+        # Users with few & many favorites
+        self.small_user = User.objects.create_user(
+            'small_user', password='Apass_0404')
+        self.large_user = User.objects.create_user(
+            'large_user', password='Apass_0404')
+        Favorite.objects.bulk_create([
+            Favorite(products=product, users=self.small_user)
+            for product in products[:NB_RARE_PRODUCTS]
+        ] + [
+            Favorite(products=product, users=self.large_user)
+            for product in products[:NB_FAVORITES]
+        ])
+
+    def test_add_fav(self):
+        """
+        Test the queries of the addition of a favorite, with few & many
+        favorites
+        """
+        # Session, user, insertion & cached favorites
+        self.assertQueryBudget(4, [
+            self.get('add_fav', self.small_user,
+                     product_id=self.free_products[0].id),
+            self.get('add_fav', self.large_user,
+                     product_id=self.free_products[1].id),
+        ], warm_up=False)
+
+    def test_remove_from_fav(self):
+        """
+        Test the queries of the removal of a favorite, with few & many
+        favorites
+        """
+        # Favorite (with its product), deletion & cached favorites
+        self.assertQueryBudget(3, [
+            self.get('del_fav', user, favorite_id=Favorite.objects.filter(
+                users=user).values_list('id', flat=True).first())
+            for user in (self.small_user, self.large_user)
+        ], warm_up=False)
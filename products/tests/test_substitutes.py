@@ -0,0 +1,122 @@
+from io import StringIO
+from unittest import mock
+
+from django.core import management
+from django.db import connections
+from django.test import TestCase
+
+from products.models import Category, Product, Substitute
+from products.substitutes import get_substitutes, refresh_substitutes
+
+
+class SubstitutesIndexTestCase(TestCase):
+    """
+    Substitutes index test case
+    """
+
+    @classmethod
+    def setUpTestData(cls):
+        # Setup objects used for test methods
+        category = Category.objects.create(
+            name='Category',
+            json_id='fr:category',
+            url='https://www.openfoodfacts.com/category',
+        )
+        other_category = Category.objects.create(
+            name='Other category',
+            json_id='fr:other-category',
+            url='https://www.openfoodfacts.com/other-category',
+        )
+
+        for pnum, score in enumerate('ABCDEABCDE'):
+            prod = Product.objects.create(
+                name=f'Product {pnum}',
+                brand=f'Brand {pnum}',
+                score=score,
+                barcode=f'12345678910{pnum}',
+                url_img_small=f'https://www.off.com/cat/prod/img_small{pnum}',
+                url_img=f'https://www.off.com/cat/prod/img{pnum}',
+                url_off=f'https://www.off.com/cat/prod/{pnum}',
+                url_img_nutrition=f'https://www.off.com/cat/prod/img_nt{pnum}',
+            )
+            # Adds relations products --> categories
+            prod.categories.add(category.id)
+            if pnum % 2:
+                prod.categories.add(other_category.id)
+
+        cls.product = Product.objects.get(name='Product 2')
+
+    @classmethod
+    def tearDownClass(cls):
+        # Call super to close connections and remove data from the database
+        super().tearDownClass()
+        # Delete the test database
+        management.call_command('flush', verbosity=0, interactive=False)
+        # Disconnect from the test database
+        connections['default'].close()
+
+    def test_refresh_indexes_better_or_equal_scores_only(self):
+        """
+        Test that the index of a product only contains other products with
+        the same or a better score, without duplicates
+        """
+        nb_rows = refresh_substitutes([self.product.id])
+        pool = Product.objects.filter(substitute_for__product=self.product)
+        self.assertEqual(nb_rows, 5)
+        self.assertEqual(pool.count(), 5)
+        self.assertNotIn(self.product, pool)
+        for sub in pool:
+            self.assertLessEqual(sub.grade, self.product.grade)
+
+    def test_refresh_samples_pool_size_substitutes(self):
+        """
+        Test that the index of a product is limited to the pool size
+        """
+        product = Product.objects.get(name='Product 4')
+        with mock.patch('products.substitutes.SUBSTITUTES_POOL_SIZE', 3):
+            nb_rows = refresh_substitutes([product.id])
+        self.assertEqual(nb_rows, 3)
+        self.assertEqual(
+            Substitute.objects.filter(product=product).count(), 3)
+
+    def test_get_substitutes_builds_missing_index(self):
+        """
+        Test that substitutes of a product not indexed yet are returned
+        """
+        self.assertFalse(
+            Substitute.objects.filter(product=self.product).exists())
+        substitutes = get_substitutes(self.product, 3)
+        self.assertEqual(len(substitutes), 3)
+        self.assertTrue(
+            Substitute.objects.filter(product=self.product).exists())
+
+    def test_product_without_substitute_is_indexed_once(self):
+        """
+        Test that a product without substitute (unknown grade) is indexed
+        on its first access only
+        """
+        product = Product.objects.create(
+            name='Product without grade',
+            score='x',
+            barcode='123456789200',
+            url_img_small='https://www.off.com/cat/prod/img_small',
+            url_img='https://www.off.com/cat/prod/img',
+            url_off='https://www.off.com/cat/prod/',
+            url_img_nutrition='https://www.off.com/cat/prod/img_nt',
+        )
+        product.categories.add(Category.objects.get(name='Category'))
+        self.assertEqual(get_substitutes(product), [])
+
+        product.refresh_from_db()
+        self.assertIsNotNone(product.substitutes_indexed_at)
+        # Only the substitutes are read
+        with self.assertNumQueries(1):
+            self.assertEqual(get_substitutes(product), [])
+
+    def test_build_substitutes_command(self):
+        """
+        Test that build_substitutes command indexes all products
+        """
+        management.call_command('build_substitutes', 4, stdout=StringIO())
+        indexed = Substitute.objects.values('product').distinct().count()
+        self.assertEqual(indexed, Product.objects.count())
@@ -1,4 +1,5 @@
 from django.core import management
+from django.core.cache import cache
 from django.db import connections
 from django.test import TestCase
 from django.urls import reverse
@@ -60,6 +61,7 @@ class TestUserExperience(TestCase):
         cls.favorite_id = None
 
     def setUp(self):
+        cache.clear()
         # Logon new user
         self.logon_user = self.client.post(
                     reverse('signup'),
@@ -1,10 +1,26 @@
+import base64
+import os
+import subprocess
+import sys
+
+from io import StringIO
+from unittest import mock
+
+from django.contrib.auth.models import User
 from django.core import management
-from django.db import connections
+from django.core.cache import cache
+from django.db import connection, connections
 from django.test import TestCase
+from django.test.utils import CaptureQueriesContext
 from django.urls import reverse
 
+from products.cache import (
+    clear_cache_stats, get_cache_stats, invalidate_catalogue
+)
+from products.conditional import PRODUCT_PAGE_MAX_AGE
+from products.favorites import add_favorites, annotate_favorites
 from products.forms import SearchForm
-from products.models import Category, Product
+from products.models import Category, Product, Favorite
 
 
 class IndexPageTestCase(TestCase):
@@ -165,6 +181,9 @@ class SearchPageTestCase(TestCase):
         Search page test case
     """
 
+    def setUp(self):
+        cache.clear()
+
     def test_search_url_exists_at_location(self):
         """
         Test that search page returns 200
@@ -206,6 +225,277 @@ class SearchPageTestCase(TestCase):
         self.assertTrue('paginate' in response.context)
         self.assertTrue(response.context['paginate'] is True)
 
+    def test_tampered_cursor_returns_first_page(self):
+        """
+        Test that a cursor whose values don't fit the ordering keys returns
+        the first page
+        """
+        cursor = base64.urlsafe_b64encode(
+            b'{"k":["abc"],"d":"next"}').decode()
+        response = self.client.get(reverse('search'), {
+            'search_filter': 'product', 'search': 'test', 'cursor': cursor})
+        self.assertEqual(response.status_code, 200)
+        self.assertFalse(response.context['products'].has_previous)
+
+
+class SearchEngineTestCase(TestCase):
+    """
+        Search engine test case
+    """
+
+    @classmethod
+    def setUpTestData(cls):
+        # Setup objects used for test methods
+        category = Category.objects.create(
+            name='Pâtes alimentaires',
+            json_id='fr:pates-alimentaires',
+            url='https://www.openfoodfacts.com/pates-alimentaires',
+        )
+        for pnum, name in enumerate(['Pâtes fraîches', 'Biscuits spatel']):
+            prod = Product.objects.create(
+                name=name,
+                brand='Brand',
+                score='B',
+                barcode=f'98765432{pnum}',
+                url_img_small=f'https://www.off.com/cat/prod/img_small{pnum}',
+                url_img=f'https://www.off.com/cat/prod/img{pnum}',
+                url_off=f'https://www.off.com/cat/prod/{pnum}',
+                url_img_nutrition=f'https://www.off.com/cat/prod/img_nt{pnum}',
+            )
+            prod.categories.add(category.id)
+
+    @classmethod
+    def tearDownClass(cls):
+        # Call super to close connections and remove data from the database
+        super().tearDownClass()
+        # Delete the test database
+        management.call_command('flush', verbosity=0, interactive=False)
+        # Disconnect from the test database
+        connections['default'].close()
+
+    def setUp(self):
+        cache.clear()
+
+    def test_search_product_is_ranked_by_relevance(self):
+        """
+        Test that a product search returns best matches first
+        """
+        response = self.client.get(
+            reverse('search')+'?search_filter=product&search=Pate')
+        products = list(response.context['products'])
+        self.assertEqual(len(products), 2)
+        self.assertEqual(products[0].name, 'Pâtes fraîches')
+
+    def test_search_category_without_accent(self):
+        """
+        Test that a category search ignores accents and case
+        """
+        response = self.client.get(
+            reverse('search')+'?search_filter=category&search=PATES')
+        self.assertTrue(response.context['is_result'])
+        self.assertEqual(len(response.context['products']), 2)
+
+    def test_search_unknown_score_has_no_result(self):
+        """
+        Test that a score search by a character which isn't a nutriscore
+        letter doesn't return the products without grade
+        """
+        Product.objects.create(
+            name='Product without grade',
+            score='x',
+            barcode='987654329',
+            url_img_small='https://www.off.com/cat/prod/img_small',
+            url_img='https://www.off.com/cat/prod/img',
+            url_off='https://www.off.com/cat/prod/',
+            url_img_nutrition='https://www.off.com/cat/prod/img_nt',
+        )
+        response = self.client.get(
+            reverse('search')+'?search_filter=score&search=1')
+        self.assertFalse(response.context['is_result'])
+
+
+class FallbackListingTestCase(TestCase):
+    """
+        Listing of all products (search without result) test case
+    """
+
+    @classmethod
+    def setUpTestData(cls):
+        # Setup objects used for test methods
+        for pnum in range(10):
+            Product.objects.create(
+                name=f'Product {pnum}',
+                brand=f'Brand {pnum}',
+                score='B',
+                barcode=f'12345678910{pnum}',
+                url_img_small=f'https://www.off.com/cat/prod/img_small{pnum}',
+                url_img=f'https://www.off.com/cat/prod/img{pnum}',
+                url_off=f'https://www.off.com/cat/prod/{pnum}',
+                url_img_nutrition=f'https://www.off.com/cat/prod/img_nt{pnum}',
+            )
+
+    @classmethod
+    def tearDownClass(cls):
+        # Call super to close connections and remove data from the database
+        super().tearDownClass()
+        # Delete the test database
+        management.call_command('flush', verbosity=0, interactive=False)
+        # Disconnect from the test database
+        connections['default'].close()
+
+    def setUp(self):
+        cache.clear()
+        self.url = reverse('search')+'?search_filter=product&search=nothing'
+
+    def test_listing_is_served_from_cache(self):
+        """
+        Test that a repeated search without result runs no query once the
+        listing of all products is cached
+        """
+        self.client.get(self.url)
+        with self.assertNumQueries(0):
+            response = self.client.get(self.url)
+        self.assertFalse(response.context['is_result'])
+        self.assertEqual(len(response.context['products']), 6)
+
+        # Next page is cached too: the cursor of the listing isn't one of
+        # the search, whose cached first page (no result) is used
+        next_query = response.context['products'].next_query
+        with self.assertNumQueries(0):
+            response = self.client.get(reverse('search') + '?' + next_query)
+        self.assertEqual(len(response.context['products']), 4)
+        self.assertFalse(response.context['products'].has_next)
+
+    def test_listing_is_invalidated(self):
+        """
+        Test that the cached listing is refreshed after the catalogue is
+        invalidated
+        """
+        self.client.get(self.url)
+        Product.objects.filter(name='Product 0').delete()
+        invalidate_catalogue()
+        response = self.client.get(self.url)
+        names = [prod.name for prod in response.context['products']]
+        self.assertNotIn('Product 0', names)
+
+    def test_listing_is_invalidated_by_another_process(self):
+        """
+        Test that the catalogue invalidated by another process (e.g. an
+        import command) refreshes the cached listing
+        """
+        self.client.get(self.url)
+        Product.objects.filter(name='Product 0').delete()
+        subprocess.run(
+            [sys.executable, '-c', (
+                'import django; django.setup(); '
+                'from products.cache import invalidate_catalogue; '
+                'invalidate_catalogue()')],
+            cwd=os.path.dirname(os.path.dirname(os.path.dirname(
+                os.path.abspath(__file__)))),
+            check=True,
+        )
+        response = self.client.get(self.url)
+        names = [prod.name for prod in response.context['products']]
+        self.assertNotIn('Product 0', names)
+
+
+class SearchCacheTestCase(TestCase):
+    """
+        Search results cache test case
+    """
+
+    @classmethod
+    def setUpTestData(cls):
+        # Setup objects used for test methods
+        for pnum in range(8):
+            Product.objects.create(
+                name=f'Nutella {pnum}',
+                brand='Ferrero',
+                score='E',
+                barcode=f'30176200{pnum}',
+                url_img_small=f'https://www.off.com/cat/prod/img_small{pnum}',
+                url_img=f'https://www.off.com/cat/prod/img{pnum}',
+                url_off=f'https://www.off.com/cat/prod/{pnum}',
+                url_img_nutrition=f'https://www.off.com/cat/prod/img_nt{pnum}',
+            )
+
+    @classmethod
+    def tearDownClass(cls):
+        # Call super to close connections and remove data from the database
+        super().tearDownClass()
+        # Delete the test database
+        management.call_command('flush', verbosity=0, interactive=False)
+        # Disconnect from the test database
+        connections['default'].close()
+
+    def setUp(self):
+        cache.clear()
+        clear_cache_stats()
+        self.url = reverse('search')+'?search_filter=product&search=Nutella'
+
+    def test_repeated_search_is_served_from_cache(self):
+        """
+        Test that a repeated search only loads the products of the page
+        """
+        first = self.client.get(self.url)
+        with self.assertNumQueries(1):
+            second = self.client.get(self.url)
+        self.assertEqual(second.context['nb_products'], 8)
+        self.assertEqual(
+            [prod.id for prod in first.context['products']],
+            [prod.id for prod in second.context['products']])
+        stats = get_cache_stats('search')
+        self.assertEqual(stats['hits'], 2)
+        self.assertEqual(stats['misses'], 2)
+
+    def test_invalid_cursors_share_first_page_entry(self):
+        """
+        Test that searches with invalid cursors are served from the cached
+        first page, without a new cache entry
+        """
+        self.client.get(self.url)
+        cursors = ['junk', base64.urlsafe_b64encode(
+            b'{"k":["abc","x"],"d":"next"}').decode()]
+        for cursor in cursors:
+            with mock.patch.object(cache, 'set') as cache_set:
+                response = self.client.get(f'{self.url}&cursor={cursor}')
+            self.assertFalse(cache_set.called)
+            self.assertFalse(response.context['products'].has_previous)
+
+    def test_search_cache_hit_writes_nothing(self):
+        """
+        Test that a search served from the cache (and counted) doesn't
+        write in the cache
+        """
+        self.client.get(self.url)
+        with mock.patch.object(cache, 'set') as cache_set, \
+                mock.patch.object(cache, 'incr') as cache_incr, \
+                mock.patch.object(cache, 'add') as cache_add:
+            self.client.get(self.url)
+        self.assertFalse(cache_set.called or cache_incr.called or
+                         cache_add.called)
+        self.assertEqual(get_cache_stats('search')['hits'], 2)
+
+    def test_normalized_searches_share_cache(self):
+        """
+        Test that a search differing by accents or case hits the cache
+        """
+        self.client.get(self.url)
+        with self.assertNumQueries(1):
+            self.client.get(
+                reverse('search')+'?search_filter=product&search=NUTÉLLA')
+
+    def test_search_cache_is_invalidated(self):
+        """
+        Test that a search is computed again after the catalogue is
+        invalidated
+        """
+        self.client.get(self.url)
+        Product.objects.filter(name='Nutella 7').delete()
+        invalidate_catalogue()
+        response = self.client.get(self.url)
+        self.assertEqual(response.context['nb_products'], 7)
+
 
 class ResultPageTestCase(TestCase):
     """
@@ -289,6 +579,31 @@ class ResultPageTestCase(TestCase):
         self.assertTrue('substitutes' in response.context)
         self.assertTrue(len(response.context['substitutes']) == 6)
 
+    def test_result_marks_favorite_substitutes(self):
+        """
+        Test that substitutes in the user favorites are marked, with a
+        number of queries independent of the number of favorites
+        """
+        args = {'product_id': 5}
+        queries = []
+        for username, nb_favorites in (('user_1', 1), ('user_19', 19)):
+            user = User.objects.create_user(username, password='Apass_0404')
+            for prod in Product.objects.exclude(pk=5)[:nb_favorites]:
+                Favorite.objects.create(products=prod, users=user)
+            self.client.force_login(user)
+            self.client.get(reverse('result', kwargs=args))
+
+            with CaptureQueriesContext(connection) as context:
+                response = self.client.get(reverse('result', kwargs=args))
+            queries.append(len(context))
+
+        self.assertEqual(queries[0], queries[1])
+        self.assertTrue(all(
+            sub.is_favorite for sub in response.context['substitutes']))
+        self.assertEqual(
+            annotate_favorites(Product.objects.all(), user)
+            .filter(is_favorite=True).count(), 19)
+
     def test_detail_url_exists_at_location(self):
         """
         Test that detail page url returns 200
@@ -551,6 +866,262 @@ class FavoritePageTestCase(TestCase):
         self.assertTemplateUsed(response, 'favorites/search_in_fav.html')
 
 
+class ProductPageConditionalTestCase(TestCase):
+    """
+    Conditional responses of the product pages test case
+    """
+
+    @classmethod
+    def setUpTestData(cls):
+        # Setup objects used for test methods
+        category = Category.objects.create(
+            name='Category', json_id='fr:category',
+            url='https://www.openfoodfacts.com/category')
+        cls.products = []
+        for pnum, score in enumerate('bab'):
+            product = Product.objects.create(
+                name=f'Product {pnum}',
+                brand=f'Brand {pnum}',
+                score=score,
+                barcode=f'12345678910{pnum}',
+                url_img_small=f'https://www.off.com/cat/prod/img_small{pnum}',
+                url_img=f'https://www.off.com/cat/prod/img{pnum}',
+                url_off=f'https://www.off.com/cat/prod/{pnum}',
+                url_img_nutrition=f'https://www.off.com/cat/prod/img_nt{pnum}',
+            )
+            product.categories.add(category)
+            cls.products.append(product)
+        cls.user = User.objects.create_user('test_user', password='Apass_0404')
+
+    @classmethod
+    def tearDownClass(cls):
+        # Call super to close connections and remove data from the database
+        super().tearDownClass()
+        # Delete the test database
+        management.call_command('flush', verbosity=0, interactive=False)
+        # Disconnect from the test database
+        connections['default'].close()
+
+    def setUp(self):
+        cache.clear()
+        self.detail_url = reverse(
+            'detail', kwargs={'product_id': self.products[0].id})
+        self.result_url = reverse(
+            'result', kwargs={'product_id': self.products[0].id})
+
+    def test_repeated_detail_request_returns_304(self):
+        """
+        Test that a repeated request of a detail page returns 304 after the
+        version lookup only
+        """
+        response = self.client.get(self.detail_url)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(
+            response['Cache-Control'],
+            f'public, max-age={PRODUCT_PAGE_MAX_AGE}')
+        self.assertIn('Last-Modified', response)
+
+        with self.assertNumQueries(1):
+            response = self.client.get(
+                self.detail_url, HTTP_IF_NONE_MATCH=response['ETag'])
+        self.assertEqual(response.status_code, 304)
+        self.assertEqual(response.content, b'')
+
+        with self.assertNumQueries(1):
+            response = self.client.get(
+                self.detail_url,
+                HTTP_IF_MODIFIED_SINCE=response['Last-Modified'])
+        self.assertEqual(response.status_code, 304)
+
+    def test_changed_product_is_rendered_again(self):
+        """
+        Test that a changed product or catalogue changes the ETag
+        """
+        etag = self.client.get(self.detail_url)['ETag']
+
+        self.products[0].save()
+        response = self.client.get(self.detail_url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+
+        etag = response['ETag']
+        invalidate_catalogue()
+        response = self.client.get(self.detail_url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+
+    def test_result_depends_on_user_favorites(self):
+        """
+        Test that a result page of a logged-in user is private and
+        rendered again when its favorites change
+        """
+        self.client.force_login(self.user)
+        # Sets the CSRF cookie used by the form of the page
+        self.client.get(self.result_url)
+        response = self.client.get(self.result_url)
+        self.assertEqual(response['Cache-Control'], 'private, no-cache')
+        self.assertTrue(response['ETag'].startswith('W/'))
+
+        etag = response['ETag']
+        response = self.client.get(self.result_url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 304)
+
+        add_favorites(self.user, [self.products[1].id])
+        response = self.client.get(self.result_url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertNotEqual(response['ETag'], etag)
+
+    def test_result_is_not_validated_by_date(self):
+        """
+        Test that a result page has no Last-Modified, so that a request
+        validated by date only is rendered again
+        """
+        response = self.client.get(self.result_url)
+        self.assertNotIn('Last-Modified', response)
+
+        response = self.client.get(
+            self.result_url,
+            HTTP_IF_MODIFIED_SINCE='Fri, 01 Jan 2100 00:00:00 GMT')
+        self.assertEqual(response.status_code, 200)
+
+    def test_unknown_product_returns_404(self):
+        """
+        Test that the pages of an unknown product return 404
+        """
+        for name in ('detail', 'result'):
+            response = self.client.get(
+                reverse(name, kwargs={'product_id': 0}),
+                HTTP_IF_NONE_MATCH='*')
+            self.assertEqual(response.status_code, 404)
+
+
+class ProductCardCacheTestCase(TestCase):
+    """
+    Cached product cards test case
+    """
+
+    @classmethod
+    def setUpTestData(cls):
+        # Setup objects used for test methods
+        cls.product = Product.objects.create(
+            name='Pâtes',
+            brand='Brand',
+            score='b',
+            barcode='123456789100',
+            url_img_small='https://www.off.com/cat/prod/img_small',
+            url_img='https://www.off.com/cat/prod/img',
+            url_off='https://www.off.com/cat/prod/',
+            url_img_nutrition='https://www.off.com/cat/prod/img_nt',
+        )
+
+    @classmethod
+    def tearDownClass(cls):
+        # Call super to close connections and remove data from the database
+        super().tearDownClass()
+        # Delete the test database
+        management.call_command('flush', verbosity=0, interactive=False)
+        # Disconnect from the test database
+        connections['default'].close()
+
+    def setUp(self):
+        cache.clear()
+
+    def search(self):
+        # Returns the search page of the product
+        return self.client.get(
+            reverse('search') + '?search_filter=product&search=pates')
+
+    def test_cards_are_cached_by_product_version(self):
+        """
+        Test that a card is rendered again only when its product changes
+        """
+        self.assertContains(self.search(), 'Pâtes')
+
+        # Not a new version of the product: the cached card is used
+        Product.objects.filter(pk=self.product.pk).update(name='Pâtes 2')
+        self.assertNotContains(self.search(), 'Pâtes 2')
+
+        self.product.name = 'Pâtes 3'
+        self.product.save()
+        self.assertContains(self.search(), 'Pâtes 3')
+
+    def test_bench_templates(self):
+        """
+        Test that the render times of the pages are measured
+        """
+        out = StringIO()
+        management.call_command(
+            'bench_templates', sizes=[6], repeat=2, stdout=out)
+        self.assertEqual(len(out.getvalue().splitlines()), 2)
+
+
+class FavoritePageQueriesTestCase(TestCase):
+    """
+    Favorite pages queries test case
+    """
+
+    @classmethod
+    def setUpTestData(cls):
+        # Setup objects used for test methods
+        cls.users = {}
+        for nb_favorites in (1, 6, 20):
+            user = User.objects.create_user(
+                f'user_{nb_favorites}', password='Apass_0404')
+            cls.users[nb_favorites] = user
+            for pnum in range(nb_favorites):
+                prod = Product.objects.create(
+                    name=f'Product {nb_favorites}-{pnum}',
+                    brand=f'Brand {pnum}',
+                    score='B',
+                    barcode=f'12345678910{nb_favorites}-{pnum}',
+                    url_img_small=f'https://www.off.com/prod/img_small{pnum}',
+                    url_img=f'https://www.off.com/prod/img{pnum}',
+                    url_off=f'https://www.off.com/prod/{pnum}',
+                    url_img_nutrition=f'https://www.off.com/prod/img_nt{pnum}',
+                )
+                Favorite.objects.create(products=prod, users=user)
+
+    @classmethod
+    def tearDownClass(cls):
+        # Call super to close connections and remove data from the database
+        super().tearDownClass()
+        # Delete the test database
+        management.call_command('flush', verbosity=0, interactive=False)
+        # Disconnect from the test database
+        connections['default'].close()
+
+    def test_favorites_page_queries_do_not_depend_on_cards(self):
+        """
+        Test that a favorites page issues the same queries (session, user,
+        favorites with their products) whatever its number of cards
+        """
+        for nb_favorites, user in self.users.items():
+            self.client.force_login(user)
+            # Caches the cards of the favorites
+            self.client.get(reverse('favorites'))
+            with self.assertNumQueries(3):
+                response = self.client.get(reverse('favorites'))
+            self.assertEqual(
+                len(response.context['favorites']), min(nb_favorites, 6))
+            # Favorites are displayed from the most recent
+            self.assertContains(response, 'Product {}-{}'.format(
+                nb_favorites, nb_favorites - 1))
+
+    def test_search_in_fav_queries_do_not_depend_on_cards(self):
+        """
+        Test that a search in favorites issues the same queries (session,
+        user, matching or else all favorites with their products) whatever
+        its number of cards
+        """
+        for nb_favorites, user in self.users.items():
+            self.client.force_login(user)
+            # Caches the cards of the favorites
+            self.client.get(reverse('favorites'))
+            with self.assertNumQueries(3):
+                response = self.client.get(
+                    reverse('search_fav') + '?user_search=product')
+            self.assertEqual(
+                len(response.context['fav_filtered']), min(nb_favorites, 6))
+
+
 class MentionPageTestCase(TestCase):
     """
     Mention page test case
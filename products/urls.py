@@ -1,6 +1,6 @@
 from django.conf.urls import url
 
-from . import views
+from . import api, views
 
 
 urlpatterns = [
@@ -11,4 +11,12 @@ urlpatterns = [
 
     # Used when adding a product to the user's favorites
     url(r'^add_fav/(?P<product_id>[0-9]+)/$', views.add_fav, name='add_fav'),
+    url(r'^add_favs/$', views.add_favs, name='add_favs'),
+
+    # Read-only JSON API
+    url(r'^api/search/$', api.search, name='api_search'),
+    url(r'^api/(?P<product_id>[0-9]+)/$', api.detail, name='api_detail'),
+    url(r'^api/(?P<product_id>[0-9]+)/substitutes/$',
+        api.substitutes, name='api_substitutes'),
+    url(r'^api/favorites/$', api.favorites, name='api_favorites'),
 ]
@@ -1,10 +1,23 @@
+import logging
+
+from django.http import Http404, HttpResponseBadRequest
 from django.shortcuts import render, get_object_or_404, redirect
-from django.core.paginator import Paginator, PageNotAnInteger, EmptyPage
-from random import randrange
+from django.views.decorators.http import condition, require_POST
 from unidecode import unidecode
 
-from .models import Product, Category, Favorite
+from .models import Product
+from .cache import get_cached_search, get_fallback_listing
+from .conditional import (
+    detail_etag, product_last_modified, product_page_cache, result_etag
+)
+from .favorites import add_favorites, set_favorites
 from .forms import SearchForm
+from .pagination import KeysetPage, KeysetPaginator, get_page
+from .search import search_products
+from .substitutes import get_substitutes
+
+
+logger = logging.getLogger('purbeurre.favorites')
 
 
 def index(request):
@@ -29,53 +42,36 @@ def mentions(request):
     return render(request, 'products/mentions.html')
 
 
+@product_page_cache
+@condition(etag_func=result_etag)
 def result(request, product_id):
     """
-    Used for result page
+    Used for result page (not rendered again if the client has it). The page
+    depends on more than the product (substitutes, favorites), so it is
+    only validated by its ETag
     """
-    substitutes = []
     current_user = request.user  # Gets current user
 
     # Gets a product designated by product_id or returns 404
     product = get_object_or_404(Product, pk=product_id)
-    # Gets product-related categor(y)(ies)
-    category = Category.objects.filter(products__id=product.id)
-
-    all_prods = []
-    for catg in category:
-        # Get products related to the categor(y)(ies)
-        prods = Product.objects.filter(categories__id=catg.id)
-        for prod in prods:
-            if prod.score <= product.score:
-                # Adds products with same or higher score to all_prods list
-                all_prods.append(prod)
-
-    nb_prod = 6
-    if len(all_prods) < nb_prod:
-        nb_prod = len(all_prods)
-
-    for i in range(nb_prod):
-        # Randomly selects products(substitutes) whose number is defined
-        # by nb_prod. These substitutes are displayed in the page
-        this_index = randrange(0, len(all_prods))
-        substitutes.append(all_prods.pop(this_index))
-        i += 1
-
-    # Gets current user favorites
-    qs_fav = Favorite.objects.filter(users__id=current_user.id)
-    fav_prods_id = [fav.products.id for fav in qs_fav]
+    # Randomly selects 6 substitutes from the substitutes index. These
+    # substitutes are displayed in the page, marked if they are in the
+    # current user favorites
+    substitutes = set_favorites(get_substitutes(product, 6), current_user)
+
     context = {
         'product': product,
         'substitutes': substitutes,
-        'fav_prods_id': fav_prods_id
     }
 
     return render(request, 'products/result.html', context)
 
 
+@product_page_cache
+@condition(etag_func=detail_etag, last_modified_func=product_last_modified)
 def detail(request, product_id):
     """
-    Used for detail page
+    Used for detail page (not rendered again if the client has it)
     """
     # Gets a product designated by product_id or returns 404
     product = get_object_or_404(Product, pk=product_id)
@@ -93,34 +89,93 @@ def add_fav(request, product_id):
     """
     current_user = request.user  # Gets the current user
 
-    # Gets a product designated by product_id or returns 404
-    product = get_object_or_404(Product, pk=product_id)
+    # Saves the product in Favorite model in one statement (nothing is
+    # saved twice, even by concurrent requests)
+    added_ids = add_favorites(current_user, [int(product_id)])
+    if added_ids:
+        logger.info(
+            "Produit %s ajouté aux favoris de l'utilisateur %s",
+            product_id, current_user.id)
+    elif not Product.objects.filter(pk=product_id).exists():
+        # Returns 404 if no product is designated by product_id
+        raise Http404("Aucun produit ne correspond à la requête")
 
-    new_fav = Favorite(
-        products=product,
-        users=current_user
-    )
-    # Save the product in Favorite model
-    new_fav.save()
-
-    print(product.name + " a été ajouté aux favoris")
     return redirect(request.META['HTTP_REFERER'])
 
 
-def get_search_result(result_products):
+@require_POST
+def add_favs(request):
+    """
+    Used to add several products (product_id values) to favorites at once
     """
-    Returns desired products if exist or all the products if they don't
+    try:
+        product_ids = [
+            int(product_id)
+            for product_id in request.POST.getlist('product_id')
+        ]
+    except ValueError:
+        return HttpResponseBadRequest("Identifiant de produit invalide")
+
+    added_ids = add_favorites(request.user, product_ids)
+    logger.info(
+        "%s produit(s) ajouté(s) aux favoris de l'utilisateur %s",
+        len(added_ids), request.user.id)
+    return redirect(request.META.get('HTTP_REFERER', 'index'))
+
+
+def get_search_result(request, query, search_filter):
     """
-    # Boolean used if query match (True) or not (False)
-    this_result = True
-    products = result_products
-    if not products.exists():
-        this_result = False
-        # Returns all products from database
-        products = Product.objects.all().order_by('id')
+    Returns the page of desired products if exist or of all the products
+    if they don't. Desired products pages (ids) and count are cached
+    """
+    desired = search_products(query, search_filter)
+
+    def get_result_page():
+        # Returns the ids & cursors of the page of desired products
+        if not desired.exists():
+            return {'result': False}
+
+        page = get_page(desired, request, 6)
+        return {
+            'result': True,
+            'ids': [product.id for product in page],
+            'next_cursor': page.next_cursor,
+            'previous_cursor': page.previous_cursor,
+        }
+
+    # Invalid cursors share the entry of the first page
+    cursor = KeysetPaginator(desired, 6).clean_cursor(
+        request.GET.get('cursor', ''))
+    entry = get_cached_search(
+        query, search_filter, f'page:{cursor}', get_result_page)
+
+    if not entry['result']:
+        # The first pages of all products are served from the cache
+        listing, listing_all = get_fallback_listing(6)
+        products = get_page(
+            Product.objects.all().order_by('id'), request, 6,
+            cached=listing, cached_all=listing_all)
+        return {
+            'products': products,
+            'result': False,
+            'count': 0,
+        }
+
+    # Gets the products of the cached page, in the page order
+    products = Product.objects.in_bulk(entry['ids'])
+    page = KeysetPage(
+        [products[pk] for pk in entry['ids'] if pk in products],
+        entry['next_cursor'],
+        entry['previous_cursor'])
+    page.set_params(request)
+    count = get_cached_search(
+        query, search_filter, 'count',
+        lambda: desired.count())
+
     return {
-        'products': products,
-        'result': this_result
+        'products': page,
+        'result': True,
+        'count': count,
     }
 
 
@@ -135,39 +190,8 @@ def search(request):
     search_filter = request.GET['search_filter']
 
     if form.is_valid():
-        result_products = None
-
-        if search_filter == 'product':
-            # Returns products based on query
-            result_products = Product.objects.filter(
-                    name__unaccent__icontains=query).order_by('-id')
-        elif search_filter == 'category':
-            result_products = Product.objects.filter(
-                    categories__name__unaccent__icontains=query
-                ).order_by('-id')
-        elif search_filter == 'brand':
-            result_products = Product.objects.filter(
-                    brand__unaccent__icontains=query).order_by('-id')
-        elif search_filter == 'barcode':
-            result_products = Product.objects.filter(
-                    barcode__icontains=query).order_by('-id')
-        elif search_filter == 'score':
-            result_products = Product.objects.filter(
-                    score__contains=query).order_by('-id')
-
-        search_result = get_search_result(result_products)
-        products = search_result['products']
-
-        # Init pagination with 6 products
-        paginator = Paginator(products, 6)
-        page = request.GET.get('page')
-
-        try:
-            products = paginator.page(page)
-        except PageNotAnInteger:
-            products = paginator.page(1)
-        except EmptyPage:
-            products = paginator.page(paginator.num_pages)
+        # Returns a page of products based on query and filter
+        search_result = get_search_result(request, query, search_filter)
 
         if search_result['result']:
             title = "Résultats de la recherche : {}".format(query)
@@ -176,7 +200,8 @@ def search(request):
 
         context = {
             'is_result': search_result['result'],
-            'products': products,
+            'products': search_result['products'],
+            'nb_products': search_result['count'],
             'title': title,
             'paginate': True,
             'form': form
@@ -0,0 +1,216 @@
+import contextvars
+import json
+import logging
+import os
+import random
+import threading
+
+from collections import defaultdict, deque
+from contextlib import ExitStack
+from time import perf_counter
+
+from django.conf import settings
+from django.contrib.admin.views.decorators import staff_member_required
+from django.db import connections
+from django.http import JsonResponse
+from django.template.backends.django import DjangoTemplates, Template
+
+
+logger = logging.getLogger('purbeurre.performance')
+
+# Metrics of the sampled request being processed (None if not sampled)
+current_metrics = contextvars.ContextVar('current_metrics', default=None)
+
+# Percentiles given by the statistics endpoint
+PERCENTILES = (50, 90, 99)
+
+
+class RequestMetrics:
+    """
+    Class used to collect the metrics of a sampled request
+
+    ...
+
+    Attributes
+    ----------
+    total : float
+        Wall time of the view & middlewares (ms)
+    queries : int
+        Number of database queries
+    db : float
+        Time of the database queries (ms)
+    template : float
+        Render time of the templates (ms)
+    size : int
+        Size of the response content (None if streamed)
+    """
+
+    def __init__(self):
+        self.total = self.db = self.template = 0.0
+        self.queries = 0
+        self.size = None
+
+    def __call__(self, execute, sql, params, many, context):
+        # Database execute wrapper timing each query
+        start = perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            self.db += (perf_counter() - start) * 1000
+            self.queries += 1
+
+    def as_dict(self):
+        return {
+            'total': round(self.total, 2),
+            'queries': self.queries,
+            'db': round(self.db, 2),
+            'template': round(self.template, 2),
+            'size': self.size,
+        }
+
+
+class RequestStats:
+    """
+    Class used to keep the metrics of the last sampled requests of each
+    view (PERFORMANCE_WINDOW by view) in the memory of the process, and to
+    aggregate them
+    """
+
+    def __init__(self, window):
+        self.lock = threading.Lock()
+        self.samples = defaultdict(lambda: deque(maxlen=window))
+
+    def add(self, view_name, metrics):
+        with self.lock:
+            self.samples[view_name].append(metrics.as_dict())
+
+    def clear(self):
+        with self.lock:
+            self.samples.clear()
+
+    @staticmethod
+    def _percentile(values, percentile):
+        # Nearest-rank percentile of the sorted values
+        rank = max(1, -(-len(values) * percentile // 100))
+        return values[int(rank) - 1]
+
+    def aggregate(self):
+        """Returns the count & percentiles of each metric by view"""
+
+        with self.lock:
+            samples = {name: list(rows) for name, rows in self.samples.items()}
+
+        stats = {}
+        for name, rows in sorted(samples.items()):
+            stats[name] = {'count': len(rows)}
+            for metric in ('total', 'queries', 'db', 'template', 'size'):
+                values = sorted(
+                    row[metric] for row in rows if row[metric] is not None)
+                if values:
+                    stats[name][metric] = {
+                        f'p{percentile}': self._percentile(values, percentile)
+                        for percentile in PERCENTILES
+                    }
+        return stats
+
+
+request_stats = RequestStats(getattr(settings, 'PERFORMANCE_WINDOW', 1000))
+
+
+class PerformanceMiddleware:
+    """
+    Middleware recording the wall time, the database queries count & time,
+    the templates render time and the response size of a sample of the
+    requests (PERFORMANCE_SAMPLE_RATE). The metrics are logged as JSON
+    lines, kept for the statistics endpoint and, with
+    PERFORMANCE_SERVER_TIMING, sent in a Server-Timing header. Requests out
+    of the sample only cost a random draw
+    """
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        self.sample_rate = getattr(settings, 'PERFORMANCE_SAMPLE_RATE', 0)
+        self.server_timing = getattr(
+            settings, 'PERFORMANCE_SERVER_TIMING', False)
+
+    def __call__(self, request):
+        if self.sample_rate <= 0 or random.random() >= self.sample_rate:
+            return self.get_response(request)
+
+        metrics = RequestMetrics()
+        token = current_metrics.set(metrics)
+        try:
+            with ExitStack() as stack:
+                for connection in connections.all():
+                    stack.enter_context(connection.execute_wrapper(metrics))
+                start = perf_counter()
+                response = self.get_response(request)
+                metrics.total = (perf_counter() - start) * 1000
+        finally:
+            current_metrics.reset(token)
+
+        if not response.streaming:
+            metrics.size = len(response.content)
+        self._record(request, response, metrics)
+        return response
+
+    def _record(self, request, response, metrics):
+        # Logs & keeps the metrics, and adds the Server-Timing header
+        match = request.resolver_match
+        view_name = match.view_name if match else 'unresolved'
+        request_stats.add(view_name, metrics)
+
+        logger.info(json.dumps(dict(
+            metrics.as_dict(), view=view_name, method=request.method,
+            status=response.status_code)))
+
+        if self.server_timing:
+            response['Server-Timing'] = (
+                'total;dur={:.2f}, db;dur={:.2f};desc="{} queries", '
+                'tpl;dur={:.2f}'.format(
+                    metrics.total, metrics.db, metrics.queries,
+                    metrics.template))
+
+
+class TimedTemplate(Template):
+    """
+    Template adding its render time to the metrics of the sampled request
+    """
+
+    def render(self, context=None, request=None):
+        metrics = current_metrics.get()
+        if metrics is None:
+            return super().render(context, request)
+
+        start = perf_counter()
+        try:
+            return super().render(context, request)
+        finally:
+            metrics.template += (perf_counter() - start) * 1000
+
+
+class TimedDjangoTemplates(DjangoTemplates):
+    """
+    Django templates backend whose templates are timed for the
+    PerformanceMiddleware (included templates are part of their parent)
+    """
+
+    def from_string(self, template_code):
+        return TimedTemplate(self.engine.from_string(template_code), self)
+
+    def get_template(self, template_name):
+        template = super().get_template(template_name)
+        return TimedTemplate(template.template, self)
+
+
+@staff_member_required
+def performance_stats(request):
+    """
+    Used by staff members to read the percentiles of the metrics of each
+    view, computed from the requests sampled by the current process
+    """
+    return JsonResponse({
+        'pid': os.getpid(),
+        'sample_rate': getattr(settings, 'PERFORMANCE_SAMPLE_RATE', 0),
+        'views': request_stats.aggregate(),
+    })
@@ -48,6 +48,7 @@ INSTALLED_APPS = [
 ]
 
 MIDDLEWARE = [
+    'purbeurre_project.performance.PerformanceMiddleware',
     'django.middleware.security.SecurityMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
@@ -62,9 +63,9 @@ ROOT_URLCONF = 'purbeurre_project.urls'
 
 TEMPLATES = [
     {
-        'BACKEND': 'django.template.backends.django.DjangoTemplates',
+        # Django templates timed by the PerformanceMiddleware
+        'BACKEND': 'purbeurre_project.performance.TimedDjangoTemplates',
         'DIRS': [],
-        'APP_DIRS': True,
         'OPTIONS': {
             'context_processors': [
                 'django.template.context_processors.debug',
@@ -72,6 +73,14 @@ TEMPLATES = [
                 'django.contrib.auth.context_processors.auth',
                 'django.contrib.messages.context_processors.messages',
             ],
+            # Templates are compiled once by process, even with DEBUG
+            # (restart the server to reload them)
+            'loaders': [
+                ('django.template.loaders.cached.Loader', [
+                    'django.template.loaders.filesystem.Loader',
+                    'django.template.loaders.app_directories.Loader',
+                ]),
+            ],
         },
     },
 ]
@@ -94,6 +103,70 @@ DATABASES = {
 }
 
 
+# Cache
+# https://docs.djangoproject.com/en/3.1/topics/cache/
+
+# The cache is shared by all the processes (server workers & import
+# commands invalidating the catalogue). The default backend, on disk, is
+# meant for development: each of its writes lists the cache directory to
+# cull it (reads never write, only misses do). In production, set a
+# backend whose writes don't depend on the number of entries, e.g.
+# CACHE_BACKEND=django.core.cache.backends.memcached.MemcachedCache
+# and CACHE_LOCATION=127.0.0.1:11211 (requires python-memcached)
+CACHES = {
+    'default': {
+        'BACKEND': os.environ.get(
+            'CACHE_BACKEND',
+            'django.core.cache.backends.filebased.FileBasedCache'),
+        'LOCATION': os.environ.get(
+            'CACHE_LOCATION', os.path.join(PROJECT_ROOT, 'django_cache')),
+        'OPTIONS': {
+            # Searches, listings, favorites, statistics & product cards
+            'MAX_ENTRIES': int(os.environ.get('CACHE_MAX_ENTRIES', 10000)),
+        },
+    }
+}
+
+# On-disk cache of the OpenFoodFacts responses used by the import commands
+OFF_CACHE_DIR = os.environ.get(
+    'OFF_CACHE_DIR', os.path.join(PROJECT_ROOT, 'off_cache'))
+OFF_CACHE_MAX_SIZE = 500 * 1024 * 1024  # Bytes
+
+
+# Performance instrumentation (purbeurre_project.performance)
+# Share of the requests whose metrics are recorded (0 disables it)
+PERFORMANCE_SAMPLE_RATE = float(
+    os.environ.get('PERFORMANCE_SAMPLE_RATE', 0.05))
+# Sends the metrics of the sampled requests in a Server-Timing header
+PERFORMANCE_SERVER_TIMING = DEBUG
+# Number of sampled requests kept by view for the percentiles
+PERFORMANCE_WINDOW = 1000
+
+LOGGING = {
+    'version': 1,
+    'disable_existing_loggers': False,
+    'handlers': {
+        'console': {
+            'class': 'logging.StreamHandler',
+        },
+    },
+    'loggers': {
+        # One JSON line by sampled request
+        'purbeurre.performance': {
+            'handlers': ['console'],
+            'level': 'INFO',
+            'propagate': False,
+        },
+        # Changes of the users favorites
+        'purbeurre.favorites': {
+            'handlers': ['console'],
+            'level': 'INFO',
+            'propagate': False,
+        },
+    },
+}
+
+
 # Password validation
 # https://docs.djangoproject.com/en/3.1/ref/settings/#auth-password-validators
 
@@ -1,3 +1,6 @@
+import os
+import tempfile
+
 from . import *
 
 DATABASES = {
@@ -10,3 +13,21 @@ DATABASES = {
         'PORT': '',
     }
 }
+
+# The tests never use the cache of the application
+CACHES = {
+    'default': dict(
+        CACHES['default'],
+        BACKEND='django.core.cache.backends.filebased.FileBasedCache',
+        LOCATION=os.path.join(tempfile.gettempdir(), 'pur_beurre_test_cache'),
+    )
+}
+
+# Import commands don't use the OpenFoodFacts cache unless a test sets it
+OFF_CACHE_DIR = None
+
+# Requests are only sampled by the tests of the instrumentation
+PERFORMANCE_SAMPLE_RATE = 0
+
+# Changes of favorites are only logged when a test captures them
+LOGGING['loggers']['purbeurre.favorites']['level'] = 'WARNING'
@@ -19,6 +19,7 @@ from django.conf.urls import url, include
 from django.conf import settings
 
 from products import views
+from purbeurre_project.performance import performance_stats
 
 urlpatterns = [
     url(r'^$', views.index, name="index"),
@@ -26,6 +27,8 @@ urlpatterns = [
     url(r'^products/', include('products.urls')),
     url(r'^mentions/', views.mentions, name="mentions"),
 
+    # Percentiles of the sampled requests metrics (staff only)
+    path('manage/performance/', performance_stats, name='performance_stats'),
     path('manage/', admin.site.urls),
     path('', include("django.contrib.auth.urls"))
 ]